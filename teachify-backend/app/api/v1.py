@@ -3,35 +3,47 @@
 import os
 import logging
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, Form, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Form, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 
 from app.auth.routes import get_current_user
 from app.auth.models import (
     UserPublic,
-    GeneratedContent,
     GenerationRequest,
     LectureOutput,
+    JobSubmitted,
+    JobStatus,
+    BatchGenerationRequest,
+    BatchItemStatus,
+    BatchStatus,
+    WebhookConfigIn,
+    WebhookConfig,
+    WebhookDelivery,
+    LibraryDocument,
 )
 from typing import List, Tuple, Optional
 
-from app.content.generator import generate_content
-from app.media.visuals import generate_visuals_for_content
-from app.media.avatar_azure import (
-    submit_synthesis_with_text,
-    poll_job_and_get_result,
-    download_file,
-)
 # 👇 still imported for backwards compatibility, but no longer used
 from app.media.compiler import compose_fullscreen_with_avatar
 from app.utils.storage import ensure_dirs
-from app.utils.storage import save_file, get_file_url
-import requests
-from app.media.avatar_azure import _authenticate  # reuse Azure auth header
 
-from app.content.rag_processor import build_context_from_files
+from app.content.pipeline import (
+    LecturePipelineError,
+    generate_lecture_once,
+    submit_lecture_job,
+)
+from app.content.batch import submit_batch_job
+from app.content import library
+from app.config import settings
 from app.utils.validators import allowed_file_mime
 from app.utils.storage import save_upload_file
-from app.content.generator import generate_content_with_context
+from app.utils.jobs import get_job
+from app.content.prompt_cache import get_prompt_cache
+from app.media.image_cache import get_image_cache
+from app.content.embedding_cache import get_embedding_cache, get_query_cache
+from app.utils import http_clients
+from app.utils.sse import SSE_HEADERS, Emit, sse_events
+from app.utils import webhooks
 
 from app.database.connection import get_db
 from pydantic import BaseModel
@@ -52,54 +64,45 @@ class LectureHistoryItem(BaseModel):
     lecture: LectureOutput
 
 
-async def _persist_lecture(
-    db: AsyncIOMotorDatabase,
-    current_user: UserPublic,
-    lecture_output: LectureOutput,
-    *,
-    rag_used: bool,
-    source_files: Optional[List[str]] = None,
-) -> None:
-    """Best-effort insert of a lecture document for history view."""
-    if db is None:
-        return
+async def _resolve_user_id(db: AsyncIOMotorDatabase, current_user: UserPublic) -> str:
+    """Return the Mongo _id (as str) for the authenticated user."""
+    user = await db.users.find_one({"username": current_user.username})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return str(user.get("_id"))
+
+
+async def _save_uploads(files: List[UploadFile], dest_dir: str = "static/uploads") -> List[Tuple[str, Optional[str]]]:
+    """Validate and store uploaded documents; returns (path, mime) pairs."""
+    saved: List[Tuple[str, Optional[str]]] = []
+    for f in files:
+        if not allowed_file_mime(f.content_type):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {f.content_type}")
+        path = await save_upload_file(f, dest_dir=dest_dir)
+        saved.append((path, f.content_type))
+    return saved
+
 
+async def _library_selection(
+    db: AsyncIOMotorDatabase, current_user: UserPublic, doc_ids: Optional[List[str]]
+) -> Optional[library.LibrarySelection]:
+    """Resolve library document ids referenced by a generation request (None if there are none)."""
+    if not doc_ids:
+        return None
+    user_id = await _resolve_user_id(db, current_user)
     try:
-        user = await db.users.find_one({"username": current_user.username})
-        if not user:
-            return
+        return await library.select_documents(db, user_id, doc_ids)
+    except library.LibraryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-        user_id = str(user.get("_id"))
-        now = datetime.utcnow()
-
-        record = {
-            "user_id": user_id,
-            "topic": lecture_output.topic,
-            "introduction": lecture_output.introduction,
-            "main_body": lecture_output.main_body,
-            "conclusion": lecture_output.conclusion,
-            "visuals": [
-                v.image_path
-                for v in (lecture_output.visualizations or [])
-                if v and getattr(v, "image_path", None)
-            ],
-            "avatar_video_url": lecture_output.video_path,
-            "rag_used": bool(rag_used),
-            "source_files": source_files or [],
-            "status": "ready",
-            "created_at": now,
-            "updated_at": now,
-            "meta": {
-                "lecture_output": lecture_output.model_dump(),
-                "captions_url": lecture_output.captions_url,
-                "source": "rag" if rag_used else "prompt",
-            },
-        }
-
-        await db.lectures.insert_one(record)
-    except Exception as e:  # history is non-critical
-        logger.error(f"❌ Failed to persist lecture history: {e}")
 
+async def _check_callback_url(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    try:
+        return await webhooks.check_callback_url(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post(
@@ -124,95 +127,25 @@ async def generate_lecture(
     username = current_user.username
     logger.info(f"🎬 Starting lecture generation for user: {username}")
 
-    # 1️⃣ Generate structured lecture content using Gemini
-    try:
-        content_data = generate_content(request.prompt)
-        content = GeneratedContent(**content_data)
-        logger.info(f"✅ Content generation successful for topic: {content.topic}")
-    except Exception as e:
-        logger.error(f"❌ LLM content generation failed: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to generate structured content.",
-        )
+    selection = await _library_selection(db, current_user, request.library_doc_ids)
 
-    # 2️⃣ Generate visuals
+    # Identical in-flight requests (double-click / retry) share one pipeline run;
+    # the run also persists the lecture in history (best-effort)
     try:
-        content_with_visuals = generate_visuals_for_content(content.model_dump())
-        content = GeneratedContent(**content_with_visuals)
-        logger.info("🖼️ Visual generation complete.")
-    except Exception as e:
-        logger.error(f"❌ Visual generation failed: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to generate visuals for lecture.",
+        lecture_output = await generate_lecture_once(
+            db,
+            current_user,
+            request.prompt,
+            use_cache=request.use_cache,
+            parallel_sections=request.parallel_sections,
+            library=selection,
         )
-
-    # 3️⃣ Azure Avatar synthesis (URL only, no download)
-    safe_title = content.topic.replace(" ", "_").replace("/", "-")[:50]
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    filename_base = f"{username}_{safe_title}_{timestamp}"
-
-    try:
-        logger.info("🧠 Submitting text to Azure Avatar for synthesis...")
-
-        full_text = "\n\n".join(
-            filter(None, [content.introduction, content.main_body, content.conclusion])
-        ).strip()
-
-        # Split text into smaller chunks
-        words = full_text.split()
-        max_chunk_words = 250
-        chunks = [" ".join(words[i:i + max_chunk_words]) for i in range(0, len(words), max_chunk_words)]
-
-        job_id = submit_synthesis_with_text(None, chunks, avatar_character="Max", style="business")
-        result_url, captions_url_remote = poll_job_and_get_result(job_id)
-        logger.info(f"✅ Azure Avatar job completed. Returning video URL: {result_url}")
-        # Try to materialize captions locally so the frontend can fetch without Azure auth
-        captions_url = None
-        try:
-            if captions_url_remote:
-                resp = requests.get(captions_url_remote, headers=_authenticate(), timeout=30)
-                if resp.ok and resp.text.strip():
-                    ensure_dirs()
-                    local_rel = f"static/captions/{job_id}.vtt"
-                    os.makedirs(os.path.dirname(local_rel), exist_ok=True)
-                    save_file(local_rel, resp.content)
-                    captions_url = get_file_url(local_rel)
-        except Exception as e:
-            logger.warning(f"⚠️ Could not cache captions locally: {e}")
-
-    except Exception as e:
-        logger.error(f"❌ Azure Avatar synthesis failed: {e}")
+    except LecturePipelineError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Avatar synthesis failed. Please retry.",
+            detail=e.detail,
         )
 
-    # 4️⃣ ✅ Skip final video composition (frontend will handle)
-    logger.info("⏭️ Skipping backend video compilation. Returning assets for frontend assembly.")
-
-    # ✅ Return structured response with all materials
-    # 5) Build response (no backend compilation)
-    lecture_output = LectureOutput(
-        topic=content.topic,
-        introduction=content.introduction,
-        main_body=content.main_body,
-        conclusion=content.conclusion,
-        visualizations=content.visualizations,
-        video_path=result_url,  # direct Azure URL
-        captions_url=captions_url,
-    )
-
-    # 6) Persist in history (best-effort)
-    await _persist_lecture(
-        db=db,
-        current_user=current_user,
-        lecture_output=lecture_output,
-        rag_used=False,
-        source_files=[],
-    )
-
     return lecture_output
 
 
@@ -225,6 +158,7 @@ async def generate_lecture(
 async def generate_lecture_from_docs(
     prompt: str = Form(..., min_length=10),
     files: List[UploadFile] = File(...),
+    parallel_sections: bool = Form(False),
     current_user: UserPublic = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
@@ -240,84 +174,470 @@ async def generate_lecture_from_docs(
     username = current_user.username
     logger.info(f"📄 RAG lecture generation for user: {username} — files: {len(files)}")
 
-    # 0) Save uploads
-    saved: List[Tuple[str, Optional[str]]] = []
-    for f in files:
-        if not allowed_file_mime(f.content_type):
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {f.content_type}")
-        path = await save_upload_file(f, dest_dir="static/uploads")
-        saved.append((path, f.content_type))
+    saved = await _save_uploads(files)
 
-    # 1) Build RAG context
     try:
-        context = build_context_from_files(saved, prompt, top_k=6)
-    except Exception as e:
-        logger.error(f"RAG context build failed: {e}")
-        raise HTTPException(status_code=500, detail="Failed to process documents.")
+        lecture_output = await generate_lecture_once(
+            db, current_user, prompt, files=saved, parallel_sections=parallel_sections
+        )
+    except LecturePipelineError as e:
+        raise HTTPException(status_code=500, detail=e.detail)
 
-    # 2) Generate structured content using Gemini + context
-    try:
-        content_data = generate_content_with_context(prompt, context)
-        content = GeneratedContent(**content_data)
-        logger.info(f"✅ Context-grounded content generated for topic: {content.topic}")
-    except Exception as e:
-        logger.error(f"LLM content (with context) failed: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate content from docs.")
+    return lecture_output
 
-    # 3) Visuals
-    try:
-        content_with_visuals = generate_visuals_for_content(content.model_dump())
-        content = GeneratedContent(**content_with_visuals)
-        logger.info("🖼️ Visual generation complete (RAG).")
-    except Exception as e:
-        logger.error(f"Visual generation failed: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate visuals.")
 
-    # 4) Azure avatar URL (no download)
-    try:
-        full_text = "\n\n".join(filter(None, [content.introduction, content.main_body, content.conclusion])).strip()
-        words = full_text.split()
-        max_chunk_words = 250
-        chunks = [" ".join(words[i:i + max_chunk_words]) for i in range(0, len(words), max_chunk_words)]
-        job_id = submit_synthesis_with_text(None, chunks, avatar_character="Max", style="business")
-        result_url, captions_url_remote = poll_job_and_get_result(job_id)
-        logger.info(f"✅ Azure Avatar job completed (RAG). Returning URL.")
-        captions_url = None
+# ────────────────────────────────
+# Submit-and-poll (background jobs)
+# ────────────────────────────────
+@router.post(
+    "/content/generate/async",
+    response_model=JobSubmitted,
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Queue lecture generation and return a job id immediately. Poll GET /v1/jobs/{job_id}.",
+)
+async def generate_lecture_async(
+    request: GenerationRequest,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    job_id = await submit_lecture_job(
+        db,
+        user_id,
+        current_user,
+        request.prompt,
+        use_cache=request.use_cache,
+        parallel_sections=request.parallel_sections,
+        callback_url=await _check_callback_url(request.callback_url),
+        library=await _library_selection(db, current_user, request.library_doc_ids),
+    )
+    logger.info(f"🎬 Queued lecture job {job_id} for user: {current_user.username}")
+    return JobSubmitted(job_id=job_id, status_url=f"/v1/jobs/{job_id}")
+
+
+@router.post(
+    "/content/generate-from-docs/async",
+    response_model=JobSubmitted,
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Queue RAG lecture generation and return a job id immediately. Poll GET /v1/jobs/{job_id}.",
+)
+async def generate_lecture_from_docs_async(
+    prompt: str = Form(..., min_length=10),
+    files: List[UploadFile] = File(...),
+    parallel_sections: bool = Form(False),
+    callback_url: Optional[str] = Form(None),
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    callback_url = await _check_callback_url(callback_url)
+    user_id = await _resolve_user_id(db, current_user)
+    saved = await _save_uploads(files)
+    job_id = await submit_lecture_job(
+        db, user_id, current_user, prompt,
+        files=saved, parallel_sections=parallel_sections, callback_url=callback_url,
+    )
+    logger.info(f"📄 Queued RAG lecture job {job_id} for user: {current_user.username}")
+    return JobSubmitted(job_id=job_id, status_url=f"/v1/jobs/{job_id}")
+
+
+# ────────────────────────────────
+# Batch generation
+# ────────────────────────────────
+def _clean_batch_prompts(prompts: List[str]) -> List[str]:
+    cleaned = [p.strip() for p in prompts]
+    if not cleaned:
+        raise HTTPException(status_code=400, detail="At least one prompt is required.")
+    if len(cleaned) > settings.batch_max_items:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {settings.batch_max_items} prompts.")
+    short = [i for i, p in enumerate(cleaned) if len(p) < 10]
+    if short:
+        raise HTTPException(status_code=400, detail=f"Prompts must be at least 10 characters (items {short}).")
+    return cleaned
+
+
+@router.post(
+    "/content/generate-batch",
+    response_model=JobSubmitted,
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Queue one lecture per prompt, pipelined across items. Poll GET /v1/content/batches/{job_id}.",
+)
+async def generate_lecture_batch(
+    request: BatchGenerationRequest,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    prompts = _clean_batch_prompts(request.prompts)
+    user_id = await _resolve_user_id(db, current_user)
+    job_id = await submit_batch_job(
+        db, user_id, current_user, prompts,
+        use_cache=request.use_cache, parallel_sections=request.parallel_sections,
+        callback_url=await _check_callback_url(request.callback_url),
+        library=await _library_selection(db, current_user, request.library_doc_ids),
+    )
+    logger.info(f"📚 Queued batch {job_id} ({len(prompts)} lectures) for user: {current_user.username}")
+    return JobSubmitted(job_id=job_id, status_url=f"/v1/content/batches/{job_id}")
+
+
+@router.post(
+    "/content/generate-batch-from-docs",
+    response_model=JobSubmitted,
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Batch variant of generate-from-docs: every prompt is grounded in the same uploaded documents.",
+)
+async def generate_lecture_batch_from_docs(
+    prompts: List[str] = Form(...),
+    files: List[UploadFile] = File(...),
+    parallel_sections: bool = Form(False),
+    callback_url: Optional[str] = Form(None),
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    cleaned = _clean_batch_prompts(prompts)
+    callback_url = await _check_callback_url(callback_url)
+    user_id = await _resolve_user_id(db, current_user)
+    saved = await _save_uploads(files)
+    job_id = await submit_batch_job(
+        db, user_id, current_user, cleaned,
+        files=saved, parallel_sections=parallel_sections, callback_url=callback_url,
+    )
+    logger.info(f"📚 Queued RAG batch {job_id} ({len(cleaned)} lectures) for user: {current_user.username}")
+    return JobSubmitted(job_id=job_id, status_url=f"/v1/content/batches/{job_id}")
+
+
+@router.get(
+    "/content/batches/{batch_id}",
+    response_model=BatchStatus,
+    status_code=status.HTTP_200_OK,
+    description="Per-item status of a batch; finished lectures are already available in history.",
+)
+async def get_batch_status(
+    batch_id: str,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    doc = await get_job(db, batch_id, user_id=user_id)
+    if not doc or doc.get("job_type") != "batch":
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    items = [BatchItemStatus(**item) for item in doc.get("items") or []]
+    return BatchStatus(
+        id=str(doc["_id"]),
+        status=doc.get("status", "queued"),
+        total=len(items),
+        succeeded=sum(1 for i in items if i.status == "succeeded"),
+        failed=sum(1 for i in items if i.status == "failed"),
+        created_at=doc.get("created_at", datetime.utcnow()),
+        updated_at=doc.get("updated_at", datetime.utcnow()),
+        items=items,
+    )
+
+
+# ────────────────────────────────
+# Document library (persistent per-user RAG index)
+# ────────────────────────────────
+def _library_document(doc: dict) -> LibraryDocument:
+    return LibraryDocument(
+        id=str(doc["_id"]),
+        filename=doc.get("filename", ""),
+        mime=doc.get("mime"),
+        size_bytes=int(doc.get("size_bytes") or 0),
+        chunks=int(doc.get("chunks") or 0),
+        status=doc.get("status", "ready"),
+        error=doc.get("error"),
+        created_at=doc.get("created_at", datetime.utcnow()),
+    )
+
+
+@router.post(
+    "/library/documents",
+    response_model=List[LibraryDocument],
+    status_code=status.HTTP_201_CREATED,
+    description="Add PDF/DOCX/TXT files to your document library; reference their ids in generation requests.",
+)
+async def add_library_documents(
+    files: List[UploadFile] = File(...),
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    incoming = os.path.join(settings.library_dir, user_id, "incoming")
+    names = [f.filename or "upload.bin" for f in files]
+    saved = await _save_uploads(files, dest_dir=incoming)
+    logger.info(f"📥 Library ingest for user: {current_user.username} — files: {len(saved)}")
+    docs = [
+        await library.ingest_document(db, user_id, path, mime, name)
+        for (path, mime), name in zip(saved, names)
+    ]
+    return [_library_document(d) for d in docs]
+
+
+@router.get(
+    "/library/documents",
+    response_model=List[LibraryDocument],
+    status_code=status.HTTP_200_OK,
+    description="List the documents in your library (most recent first).",
+)
+async def list_library_documents(
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    return [_library_document(d) for d in await library.list_documents(db, user_id)]
+
+
+@router.delete(
+    "/library/documents/{doc_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    description="Remove a document from your library and its vectors from the index.",
+)
+async def delete_library_document(
+    doc_id: str,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    if not await library.delete_document(db, user_id, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+
+# ────────────────────────────────
+# Completion webhooks
+# ────────────────────────────────
+def _webhook_config(doc: dict) -> WebhookConfig:
+    return WebhookConfig(
+        url=doc.get("url"),
+        secret=doc["secret"],
+        created_at=doc.get("created_at", datetime.utcnow()),
+        updated_at=doc.get("updated_at", datetime.utcnow()),
+    )
+
+
+@router.get(
+    "/webhooks",
+    response_model=WebhookConfig,
+    status_code=status.HTTP_200_OK,
+    description="Account webhook URL and signing secret (a secret is issued on first access).",
+)
+async def get_webhook_config(
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    return _webhook_config(await webhooks.ensure_endpoint(db, user_id))
+
+
+@router.put(
+    "/webhooks",
+    response_model=WebhookConfig,
+    status_code=status.HTTP_200_OK,
+    description="Register the account-wide URL notified when generation jobs complete or fail.",
+)
+async def set_webhook_config(
+    payload: WebhookConfigIn,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    url = await _check_callback_url(payload.url)
+    user_id = await _resolve_user_id(db, current_user)
+    doc = await webhooks.set_endpoint(db, user_id, url, rotate_secret=payload.rotate_secret)
+    logger.info(f"📮 Webhook endpoint set for user: {current_user.username}")
+    return _webhook_config(doc)
+
+
+@router.delete(
+    "/webhooks",
+    status_code=status.HTTP_204_NO_CONTENT,
+    description="Stop sending account-wide webhooks (per-request callback URLs still apply).",
+)
+async def delete_webhook_config(
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    await webhooks.set_endpoint(db, user_id, None)
+
+
+@router.post(
+    "/webhooks/test",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Queue a signed `ping` event to the account webhook URL.",
+)
+async def send_test_webhook(
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    endpoint = await webhooks.get_endpoint(db, user_id)
+    if not endpoint or not endpoint.get("url"):
+        raise HTTPException(status_code=400, detail="No webhook URL registered.")
+    delivery_id = await webhooks.enqueue_delivery(
+        db, user_id, endpoint["url"], "ping", {"message": "Webhook configured correctly."}
+    )
+    return {"delivery_id": delivery_id}
+
+
+@router.get(
+    "/webhooks/deliveries",
+    response_model=List[WebhookDelivery],
+    status_code=status.HTTP_200_OK,
+    description="Delivery log: recent webhook events with the outcome of every attempt.",
+)
+async def list_webhook_deliveries(
+    limit: int = 50,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    docs = await webhooks.list_deliveries(db, user_id, limit)
+    return [
+        WebhookDelivery(
+            id=str(doc["_id"]),
+            event=doc["event"],
+            url=doc["url"],
+            job_id=doc.get("job_id"),
+            status=doc.get("status", "pending"),
+            attempts=int(doc.get("attempts") or 0),
+            last_status_code=doc.get("last_status_code"),
+            last_error=doc.get("last_error"),
+            next_attempt_at=doc.get("next_attempt_at") if doc.get("status") == "pending" else None,
+            created_at=doc.get("created_at", datetime.utcnow()),
+            delivered_at=doc.get("delivered_at"),
+            log=doc.get("log") or [],
+        )
+        for doc in docs
+    ]
+
+
+@router.post(
+    "/webhooks/deliveries/{delivery_id}/redeliver",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Send a delivery again (e.g. after fixing the receiver).",
+)
+async def redeliver_webhook(
+    delivery_id: str,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    if not await webhooks.redeliver(db, delivery_id, user_id):
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return {"delivery_id": delivery_id, "status": "pending"}
+
+
+# ────────────────────────────────
+# Server-Sent Events progress streams
+# ────────────────────────────────
+def _lecture_event_stream(
+    db: AsyncIOMotorDatabase,
+    current_user: UserPublic,
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    library_selection: Optional[library.LibrarySelection] = None,
+) -> StreamingResponse:
+    """
+    Run the lecture pipeline and stream its progress as SSE:
+    started → progress/content/visual/avatar_submitted/avatar_status/avatar_ready/captions → complete | error.
+    """
+
+    async def _run(emit: Emit) -> None:
+        async def _progress(stage: str, progress: int) -> None:
+            emit("progress", {"stage": stage, "progress": progress})
+
+        emit("started", {"mode": "rag" if files or library_selection is not None else "prompt"})
         try:
-            if captions_url_remote:
-                resp = requests.get(captions_url_remote, headers=_authenticate(), timeout=30)
-                if resp.ok and resp.text.strip():
-                    ensure_dirs()
-                    local_rel = f"static/captions/{job_id}.vtt"
-                    os.makedirs(os.path.dirname(local_rel), exist_ok=True)
-                    save_file(local_rel, resp.content)
-                    captions_url = get_file_url(local_rel)
-        except Exception as e:
-            logger.warning(f"⚠️ Could not cache captions locally: {e}")
-    except Exception as e:
-        logger.error(f"Azure avatar synthesis failed: {e}")
-        raise HTTPException(status_code=500, detail="Avatar synthesis failed.")
-
-    # 5) Return (no backend compilation)
-    lecture_output = LectureOutput(
-        topic=content.topic,
-        introduction=content.introduction,
-        main_body=content.main_body,
-        conclusion=content.conclusion,
-        visualizations=content.visualizations,
-        video_path=result_url,
-        captions_url=captions_url,
+            lecture_output = await generate_lecture_once(
+                db,
+                current_user,
+                prompt,
+                files=files,
+                on_progress=_progress,
+                use_cache=use_cache,
+                on_event=emit,
+                parallel_sections=parallel_sections,
+                library=library_selection,
+            )
+        except LecturePipelineError as e:
+            emit("error", {"stage": e.stage, "detail": e.detail})
+            return
+        emit("complete", lecture_output.model_dump())
+
+    return StreamingResponse(
+        sse_events(_run, name=f"lecture-stream-{current_user.username}"),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
-    await _persist_lecture(
-        db=db,
-        current_user=current_user,
-        lecture_output=lecture_output,
-        rag_used=True,
-        source_files=[path for (path, _mime) in saved],
+
+@router.get(
+    "/content/stream",
+    status_code=status.HTTP_200_OK,
+    description="Generate a lecture and stream progress (content, visuals, avatar status, captions) as Server-Sent Events.",
+)
+async def stream_lecture(
+    prompt: str = Query(..., min_length=10),
+    use_cache: bool = Query(True),
+    parallel_sections: bool = Query(False),
+    library_doc_ids: List[str] = Query([]),
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    logger.info(f"📡 Streaming lecture generation for user: {current_user.username}")
+    selection = await _library_selection(db, current_user, library_doc_ids)
+    return _lecture_event_stream(
+        db, current_user, prompt,
+        use_cache=use_cache, parallel_sections=parallel_sections, library_selection=selection,
     )
 
-    return lecture_output
+
+@router.post(
+    "/content/generate-from-docs/stream",
+    status_code=status.HTTP_200_OK,
+    description="RAG variant of /content/stream: upload documents and stream generation progress as Server-Sent Events.",
+)
+async def stream_lecture_from_docs(
+    prompt: str = Form(..., min_length=10),
+    files: List[UploadFile] = File(...),
+    parallel_sections: bool = Form(False),
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    logger.info(f"📡 Streaming RAG lecture generation for user: {current_user.username} — files: {len(files)}")
+    saved = await _save_uploads(files)
+    return _lecture_event_stream(db, current_user, prompt, files=saved, parallel_sections=parallel_sections)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=JobStatus,
+    status_code=status.HTTP_200_OK,
+    description="Return stage, progress and (when finished) the LectureOutput of a generation job.",
+)
+async def get_job_status(
+    job_id: str,
+    current_user: UserPublic = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    user_id = await _resolve_user_id(db, current_user)
+    doc = await get_job(db, job_id, user_id=user_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    lecture_data = (doc.get("result") or {}).get("lecture")
+    return JobStatus(
+        id=str(doc["_id"]),
+        job_type=doc.get("job_type", "generation"),
+        status=doc.get("status", "queued"),
+        stage=doc.get("stage"),
+        progress=int(doc.get("progress") or 0),
+        error=doc.get("error"),
+        created_at=doc.get("created_at", datetime.utcnow()),
+        updated_at=doc.get("updated_at", datetime.utcnow()),
+        result=LectureOutput(**lecture_data) if lecture_data else None,
+    )
 
 
 @router.get(
@@ -390,3 +710,29 @@ async def get_lecture_history(
     except Exception as e:
         logger.error(f"❌ Failed to load lecture history: {e}")
         raise HTTPException(status_code=500, detail="Failed to load lecture history")
+
+
+@router.get(
+    "/cache/stats",
+    status_code=status.HTTP_200_OK,
+    description="Hit/miss counters for this worker's content, image and embedding caches.",
+)
+async def get_cache_stats(current_user: UserPublic = Depends(get_current_user)):
+    prompt_cache = get_prompt_cache()
+    image_cache = get_image_cache()
+    embedding_cache = get_embedding_cache()
+    return {
+        "prompt_cache": prompt_cache.snapshot() if prompt_cache else None,
+        "image_cache": image_cache.snapshot() if image_cache else None,
+        "embedding_cache": embedding_cache.snapshot() if embedding_cache else None,
+        "query_embedding_cache": get_query_cache().snapshot(),
+    }
+
+
+@router.get(
+    "/http/stats",
+    status_code=status.HTTP_200_OK,
+    description="Per-provider outbound request and connection-reuse counters for this worker.",
+)
+async def get_http_stats(current_user: UserPublic = Depends(get_current_user)):
+    return http_clients.snapshot()
@@ -100,6 +100,19 @@ class GeneratedContent(BaseModel):
 class GenerationRequest(BaseModel):
     """Input schema for content generation endpoint."""
     prompt: str = Field(..., min_length=10, description="User topic or question to generate lecture content.")
+    use_cache: bool = Field(True, description="Allow reuse of cached content for identical or near-identical prompts.")
+    parallel_sections: bool = Field(
+        False,
+        description="Long lectures: generate an outline first, then write the sections in parallel calls.",
+    )
+    callback_url: Optional[str] = Field(
+        None,
+        description="Async endpoints only: POST the signed result here when the job finishes (overrides the account webhook).",
+    )
+    library_doc_ids: List[str] = Field(
+        default_factory=list,
+        description="Ground the lecture in these documents from the user's library (POST /v1/library/documents).",
+    )
 
 
 class LectureOutput(BaseModel):
@@ -113,3 +126,114 @@ class LectureOutput(BaseModel):
     captions_url: Optional[str] = Field(
         default=None, description="Optional URL to WebVTT/SRT captions aligned with avatar speech."
     )
+
+
+# ────────────────────────────────
+# JOB MODELS (submit-and-poll generation)
+# ────────────────────────────────
+
+class JobSubmitted(BaseModel):
+    """Response returned immediately after a generation job is queued."""
+    job_id: str
+    status: str = "queued"
+    status_url: str = Field(..., description="URL to poll for job stage, progress and result.")
+
+
+class JobStatus(BaseModel):
+    """Current state of a background generation job."""
+    id: str
+    job_type: str
+    status: str = Field(..., description="queued | running | succeeded | failed")
+    stage: Optional[str] = Field(None, description="Current pipeline stage (content, visuals, avatar, ...).")
+    progress: int = Field(0, ge=0, le=100, description="Approximate completion percentage.")
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    result: Optional[LectureOutput] = Field(None, description="Final lecture once the job succeeded.")
+
+
+class BatchGenerationRequest(BaseModel):
+    """Input schema for batch generation: one lecture per prompt."""
+    prompts: List[str] = Field(..., min_length=1, description="Lecture topics, processed as one pipelined batch.")
+    use_cache: bool = Field(True, description="Allow reuse of cached content for identical or near-identical prompts.")
+    parallel_sections: bool = Field(False, description="Generate each lecture from an outline in parallel section calls.")
+    callback_url: Optional[str] = Field(None, description="POST the signed batch result here when it finishes.")
+    library_doc_ids: List[str] = Field(default_factory=list, description="Library documents every lecture is grounded in.")
+
+
+class BatchItemStatus(BaseModel):
+    """State of one lecture inside a batch."""
+    index: int
+    prompt: str
+    status: str = Field(..., description="queued | running | succeeded | failed")
+    stage: Optional[str] = None
+    progress: int = Field(0, ge=0, le=100)
+    error: Optional[str] = None
+    topic: Optional[str] = None
+    video_path: Optional[str] = None
+
+
+class BatchStatus(BaseModel):
+    """Current state of a batch generation job; finished lectures are already in history."""
+    id: str
+    status: str = Field(..., description="queued | running | succeeded | failed")
+    total: int
+    succeeded: int = 0
+    failed: int = 0
+    created_at: datetime
+    updated_at: datetime
+    items: List[BatchItemStatus] = Field(default_factory=list)
+
+
+class LibraryDocument(BaseModel):
+    """A document stored in the user's RAG library."""
+    id: str
+    filename: str
+    mime: Optional[str] = None
+    size_bytes: int = 0
+    chunks: int = 0
+    status: str = Field(..., description="processing | ready | failed")
+    error: Optional[str] = None
+    created_at: datetime
+
+
+# ────────────────────────────────
+# WEBHOOK MODELS
+# ────────────────────────────────
+
+
+class WebhookConfigIn(BaseModel):
+    """Account-wide completion webhook."""
+    url: str = Field(..., description="http(s) URL that receives signed job completion events.")
+    rotate_secret: bool = Field(False, description="Issue a new signing secret.")
+
+
+class WebhookConfig(BaseModel):
+    url: Optional[str] = None
+    secret: str = Field(..., description="HMAC-SHA256 key for the X-Teachify-Signature header.")
+    created_at: datetime
+    updated_at: datetime
+
+
+class WebhookAttempt(BaseModel):
+    attempt: int
+    at: datetime
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    duration_ms: float = 0
+
+
+class WebhookDelivery(BaseModel):
+    """One webhook event and its delivery attempts."""
+    id: str
+    event: str
+    url: str
+    job_id: Optional[str] = None
+    status: str = Field(..., description="pending | sending | delivered | failed")
+    attempts: int = 0
+    last_status_code: Optional[int] = None
+    last_error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    created_at: datetime
+    delivered_at: Optional[datetime] = None
+    log: List[WebhookAttempt] = Field(default_factory=list)
@@ -41,6 +41,25 @@ class Settings(BaseSettings):
     bfl_api_key: Optional[str] = None
     bfl_api_base: str = "https://api.bfl.ai"
     bfl_route: str = "/v1/flux-pro-1.1"
+    # Concurrent FLUX generations: per lecture and across the whole process (BFL rate limits)
+    visuals_concurrency_per_lecture: int = 4
+    visuals_concurrency_global: int = 8
+    # Persistent FLUX image cache (exact + optional near-duplicate prompt reuse; not under static/)
+    image_cache_enabled: bool = True
+    image_cache_dir: str = "data/image_cache"
+    image_cache_max_mb: int = 2048
+    image_cache_semantic: bool = False
+    image_cache_semantic_threshold: float = 0.92
+
+    # ────────────────────────────────
+    # Outbound HTTP pools (one keep-alive pool per provider)
+    # ────────────────────────────────
+    http_pool_max_connections: int = 100
+    http_pool_max_keepalive: int = 20
+    http_keepalive_expiry_s: float = 30.0
+    azure_http_timeout_s: float = 60.0
+    bfl_http_timeout_s: float = 30.0
+    default_http_timeout_s: float = 30.0
 
     # ────────────────────────────────
     # Database (MongoDB)
@@ -60,8 +79,89 @@ class Settings(BaseSettings):
     # LLM / AI Integrations
     # ────────────────────────────────
     gemini_api_key: Optional[str] = None
+    gemini_max_retries: int = 5
+    gemini_backoff_base_s: float = 1.0
+    gemini_backoff_cap_s: float = 16.0
+    gemini_breaker_failure_threshold: int = 5   # consecutive UNAVAILABLE errors before opening
+    gemini_breaker_reset_s: float = 30.0        # background probe interval while open
     huggingface_token: Optional[str] = None
     tts_provider: str = "gtts"
+    # Semantic cache for generated lecture content (exact + embedding nearest neighbour)
+    prompt_cache_enabled: bool = True
+    prompt_cache_max_entries: int = 2000
+    prompt_cache_ttl_s: int = 7 * 24 * 3600
+    prompt_cache_similarity: float = 0.95
+
+    # RAG: per-document text/chunks/float16 vectors cached on disk by content hash (not under static/)
+    rag_cache_enabled: bool = True
+    rag_cache_dir: str = "data/rag_cache"
+    rag_cache_max_mb: int = 1024
+    rag_query_cache_size: int = 512
+    # Text extraction runs in a process pool (0 = inline); PDFs are split into page ranges per task
+    rag_extract_workers: int = 2
+    rag_extract_pages_per_task: int = 25
+    # RAG ANN index: "auto" = flat up to rag_ann_flat_max chunks, HNSW up to rag_ann_hnsw_max, IVF beyond
+    # (or force "flat" / "hnsw" / "ivf"); nprobe / efSearch are per-query recall knobs
+    rag_ann_index: str = "auto"
+    rag_ann_flat_max: int = 10000
+    rag_ann_hnsw_max: int = 200000
+    rag_ivf_nlist: int = 0  # 0 = 4 * sqrt(chunks)
+    rag_ivf_nprobe: int = 16
+    rag_hnsw_m: int = 32
+    rag_hnsw_ef_construction: int = 80
+    rag_hnsw_ef_search: int = 64
+    rag_pq_m: int = 48  # PQ bytes per vector (384-dim MiniLM: 8 dims per sub-quantizer)
+    rag_rescore_factor: int = 4  # quantized searches re-score factor x top_k candidates exactly
+    # Per-user document library (POST /v1/library/documents): on-disk FAISS index per user
+    library_dir: str = "data/library"
+    library_open_indexes: int = 64
+    library_chunk_tokens: int = 450
+    library_chunk_overlap: int = 80
+    # Stored vector format of library indexes: "none" (float32), "sq8" (int8, 4x smaller) or "pq" (~32x smaller)
+    library_quantization: str = "none"
+    # IVF filters only see the probed lists: selections of up to this many chunks are scored exactly
+    # from the stored document vectors, larger ones raise nprobe by how selective the filter is
+    library_exact_search_max: int = 20000
+
+    # ────────────────────────────────
+    # Lecture pipeline (per-stage timeouts in seconds, extra retry attempts)
+    # ────────────────────────────────
+    pipeline_context_timeout_s: int = 300
+    pipeline_content_timeout_s: int = 180
+    pipeline_content_retries: int = 0
+    pipeline_visuals_timeout_s: int = 600
+    pipeline_visuals_retries: int = 0
+    pipeline_avatar_timeout_s: int = 1800
+    pipeline_avatar_retries: int = 1
+    # Stream Gemini output and start visuals/avatar as soon as their inputs are complete
+    content_streaming_enabled: bool = False
+    # Outline-then-parallel-sections mode (GenerationRequest.parallel_sections): max concurrent section calls
+    content_outline_max_parallel: int = 6
+    # Persist stage outputs per run so retries resume from the first incomplete stage
+    pipeline_checkpoints_enabled: bool = True
+    pipeline_checkpoint_ttl_h: int = 48
+
+    # Batch generation (/v1/content/generate-batch): process-wide caps per stage,
+    # so Gemini, BFL and Azure work of different items overlaps without overloading any provider
+    batch_max_items: int = 50
+    batch_context_concurrency: int = 2
+    batch_content_concurrency: int = 4
+    batch_visuals_concurrency: int = 2
+    batch_avatar_concurrency: int = 3
+
+    # ────────────────────────────────
+    # Completion webhooks (signed POST when a generation job finishes)
+    # ────────────────────────────────
+    webhooks_enabled: bool = True
+    webhook_timeout_s: float = 10.0
+    webhook_max_attempts: int = 8
+    webhook_backoff_base_s: int = 15
+    webhook_backoff_cap_s: int = 3600
+    webhook_poll_interval_s: float = 2.0
+    webhook_concurrency: int = 4
+    webhook_log_ttl_days: int = 30
+    # Allow localhost/private callback URLs (local receivers in development)
+    webhook_allow_private_urls: bool = False
 
     # ────────────────────────────────
     # Azure Speech + Avatar
@@ -70,6 +170,30 @@ class Settings(BaseSettings):
     speech_key: Optional[str] = None
     avatar_api_base: Optional[str] = None
     avatar_api_key: Optional[str] = None
+    # Reuse finished avatar renders for identical text + avatar configuration
+    avatar_cache_enabled: bool = True
+    avatar_cache_ttl_days: int = 30
+    # Multiplexed job poller: overall deadline per job and consecutive-error budget
+    avatar_poll_deadline_s: int = 1800
+    avatar_poll_max_errors: int = 8
+    # Render each narration chunk as its own Azure job and stitch them into an HLS playlist
+    avatar_parallel_segments: bool = False
+    avatar_segment_concurrency: int = 4      # concurrent segment submissions
+    # Mirror finished Azure videos/captions into our storage (parallel range requests)
+    mirror_enabled: bool = True
+    mirror_parallel_ranges: int = 4
+    mirror_buffer_kb: int = 1024
+    mirror_retries: int = 3
+
+    # ────────────────────────────────
+    # Durable Mongo work queue (TASKS_DRIVER=mongo, `python -m app.worker`)
+    # ────────────────────────────────
+    queue_worker_concurrency: int = 2
+    queue_lease_s: float = 120.0             # visibility timeout; extended by heartbeat while running
+    queue_poll_interval_s: float = 1.0
+    queue_max_attempts: int = 3
+    queue_backoff_base_s: float = 10.0
+    queue_backoff_cap_s: float = 600.0
 
     # ────────────────────────────────
     # Storage (local or S3)
@@ -0,0 +1,360 @@
+# app/content/ann_index.py
+"""
+Approximate nearest-neighbour index selection for RAG.
+
+`build_ann_index` picks the FAISS index type from the number of chunks
+(settings.rag_ann_index = "auto"):
+
+    n <= rag_ann_flat_max    IndexFlatIP      exact, no training
+    n <= rag_ann_hnsw_max    IndexHNSWFlat    graph search, tuned by efSearch
+    larger                   IndexIVFFlat     k-means buckets, tuned by nprobe
+
+Indexes that must support deletions (the per-user library) never use HNSW,
+since FAISS cannot remove vectors from an HNSW graph; they go to IVF instead.
+Recall knobs are applied per query through `search_params`, so they can be
+changed without rebuilding.
+
+Vectors can optionally be stored quantized ("sq8": one byte per dimension,
+"pq": rag_pq_m bytes per vector) instead of as float32. Quantized scores are
+approximate, so callers fetch `rescore_factor() * top_k` candidates and
+re-score them against the exact vectors (see library.py).
+
+Recall-vs-latency report against the exact flat baseline, and memory/recall
+report per storage mode:
+
+    python -m app.content.ann_index --synthetic 50000
+    python -m app.content.ann_index --library <user_id> --nprobe 4 8 16 32 --ef-search 32 64 128
+    python -m app.content.ann_index --library <user_id> --quantization
+"""
+
+from __future__ import annotations
+import math
+import time
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+KINDS = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "sq8", "pq")
+_PQ_MIN_TRAIN = 1024  # below this, PQ codebooks (256 centroids per sub-vector) are too poorly trained
+
+
+def choose_kind(n: int, *, removable: bool = False) -> str:
+    """Index type for `n` vectors according to settings (forced type or "auto")."""
+    kind = (settings.rag_ann_index or "auto").lower()
+    if kind == "auto":
+        if n <= settings.rag_ann_flat_max:
+            kind = "flat"
+        elif n <= settings.rag_ann_hnsw_max:
+            kind = "hnsw"
+        else:
+            kind = "ivf"
+    if kind not in KINDS:
+        raise ValueError(f"Unknown RAG index type: {kind}")
+    if kind == "hnsw" and removable:
+        kind = "ivf"
+    if kind == "ivf" and n < 2 * ivf_nlist(n):  # too few points to train meaningful buckets
+        kind = "flat"
+    return kind
+
+
+def ivf_nlist(n: int) -> int:
+    if settings.rag_ivf_nlist:
+        return settings.rag_ivf_nlist
+    return max(16, min(65536, int(4 * math.sqrt(max(n, 1)))))
+
+
+def pq_m(dim: int) -> int:
+    """Sub-quantizer count: settings.rag_pq_m, lowered to the nearest divisor of `dim`."""
+    m = max(1, min(settings.rag_pq_m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def effective_quantization(quantization: str, n: int) -> str:
+    quantization = (quantization or "none").lower()
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown RAG vector quantization: {quantization}")
+    if quantization == "pq" and n < _PQ_MIN_TRAIN:
+        return "sq8"
+    return quantization
+
+
+def rescore_factor() -> int:
+    return max(1, settings.rag_rescore_factor)
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """Unwrap IndexIDMap/IndexIDMap2 to the index that actually stores the vectors."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVF) and inner.nlist > 1:
+        return "ivf"
+    return "flat"
+
+
+def index_quantization(index: faiss.Index) -> str:
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def factory_string(kind: str, dim: int, n: int, quantization: str = "none") -> str:
+    codec = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{pq_m(dim)}np"}[quantization]  # np: skip slow polysemous training
+    if kind == "ivf":
+        return f"IVF{ivf_nlist(n)},{codec}"
+    if kind == "hnsw":
+        return f"HNSW{settings.rag_hnsw_m}" + ("" if quantization == "none" else f"_{codec}")
+    if quantization == "pq":
+        return f"IVF1,{codec}"  # exhaustive PQ scan; plain IndexPQ rejects id selectors
+    return codec
+
+
+def new_index(kind: str, dim: int, vectors: Optional[np.ndarray] = None, quantization: str = "none") -> faiss.Index:
+    """
+    Empty inner-product index of the given type and storage; IVF buckets and
+    quantizer codebooks are trained on (a sample of) `vectors`.
+    """
+    n = 0 if vectors is None else len(vectors)
+    index = faiss.index_factory(dim, factory_string(kind, dim, n, quantization), faiss.METRIC_INNER_PRODUCT)
+    if kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = settings.rag_hnsw_ef_construction
+    if not index.is_trained:
+        if not n:
+            raise ValueError(f"{kind}/{quantization} index needs training vectors")
+        cap = 64 * max(ivf_nlist(n) if kind == "ivf" else 0, 256 if quantization == "pq" else 0) or n
+        sample = vectors
+        if n > cap:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, cap, replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return index
+
+
+def build_ann_index(
+    vectors: np.ndarray,
+    ids: Optional[np.ndarray] = None,
+    *,
+    kind: Optional[str] = None,
+    removable: bool = False,
+    quantization: str = "none",
+) -> faiss.Index:
+    """Build an index over normalized `vectors`, wrapped in IndexIDMap2 when `ids` are given."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    kind = kind or choose_kind(len(vectors), removable=removable)
+    quantization = effective_quantization(quantization, len(vectors))
+    index = new_index(kind, vectors.shape[1], vectors, quantization)
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(vectors)
+    suffix = "" if quantization == "none" else f" ({quantization})"
+    logger.info(f"🧭 Built {kind}{suffix} RAG index over {len(vectors)} chunks.")
+    return index
+
+
+def search_params(
+    index: faiss.Index,
+    sel: Optional[faiss.IDSelector] = None,
+    *,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> faiss.SearchParameters:
+    """Per-query parameters (recall knobs from settings unless overridden) plus an optional id filter."""
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = min(nprobe or settings.rag_ivf_nprobe, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or settings.rag_hnsw_ef_search
+    else:
+        params = faiss.SearchParameters()
+    if sel is not None:
+        params.sel = sel
+    return params
+
+
+# ────────────────────────────────
+# Recall-vs-latency report
+# ────────────────────────────────
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int, params: faiss.SearchParameters):
+    latencies = []
+    found = []
+    for q in queries:
+        started = time.perf_counter()
+        _D, I = index.search(q[None, :], k, params=params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(I[0])
+    return np.vstack(found), np.asarray(latencies)
+
+
+def _recall(found: Sequence[np.ndarray], truth: np.ndarray, k: int) -> float:
+    return float(np.mean([len(set(f[f >= 0]) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def recall_latency_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    *,
+    k: int = 6,
+    nprobes: Sequence[int] = (1, 4, 8, 16, 32, 64),
+    ef_searches: Sequence[int] = (16, 32, 64, 128, 256),
+) -> List[Dict[str, Any]]:
+    """
+    Recall@k of IVF (per nprobe) and HNSW (per efSearch) against exact flat search,
+    with per-query latency percentiles and build times. Rows are plain dicts.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    rows: List[Dict[str, Any]] = []
+
+    def _row(kind: str, param: str, index: faiss.Index, build_s: float, params: faiss.SearchParameters,
+             truth: Optional[np.ndarray]) -> np.ndarray:
+        found, lat = _timed_search(index, queries, k, params)
+        recall = 1.0 if truth is None else _recall(found, truth, k)
+        rows.append({
+            "index": kind, "param": param, f"recall@{k}": round(recall, 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "build_s": round(build_s, 2),
+        })
+        return found
+
+    started = time.perf_counter()
+    flat = build_ann_index(vectors, kind="flat")
+    truth = _row("flat", "-", flat, time.perf_counter() - started, search_params(flat), None)
+
+    if len(vectors) >= 2 * ivf_nlist(len(vectors)):
+        started = time.perf_counter()
+        ivf = build_ann_index(vectors, kind="ivf")
+        build_s = time.perf_counter() - started
+        nlist = base_index(ivf).nlist
+        for nprobe in nprobes:
+            _row("ivf", f"nlist={nlist} nprobe={nprobe}", ivf, build_s, search_params(ivf, nprobe=nprobe), truth)
+
+    started = time.perf_counter()
+    hnsw = build_ann_index(vectors, kind="hnsw")
+    build_s = time.perf_counter() - started
+    for ef in ef_searches:
+        _row("hnsw", f"M={settings.rag_hnsw_m} efSearch={ef}", hnsw, build_s, search_params(hnsw, ef_search=ef), truth)
+    return rows
+
+
+def quantization_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    *,
+    k: int = 6,
+    kind: Optional[str] = None,
+    factor: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Serialized index size and recall@k per storage mode (same index type for all),
+    both raw and after re-scoring `factor * k` candidates with the exact vectors.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    kind = kind or choose_kind(len(vectors), removable=True)
+    factor = factor or rescore_factor()
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    rows: List[Dict[str, Any]] = []
+    for mode in QUANTIZATIONS:
+        started = time.perf_counter()
+        index = build_ann_index(vectors, kind=kind, quantization=mode)
+        build_s = time.perf_counter() - started
+        params = search_params(index)
+        raw, lat = _timed_search(index, queries, k, params)
+        candidates, _ = _timed_search(index, queries, k * factor, params)
+        rescored = []
+        for q, cand in zip(queries, candidates):
+            cand = cand[cand >= 0]
+            rescored.append(cand[np.argsort(-(vectors[cand] @ q))[:k]])
+        size = len(faiss.serialize_index(index))
+        rows.append({
+            "index": kind, "storage": index_quantization(index),
+            "size_mb": round(size / 1024 / 1024, 2), "bytes/vec": round(size / len(vectors), 1),
+            f"recall@{k}": round(_recall(raw, truth, k), 4),
+            f"recall@{k} rescored x{factor}": round(_recall(rescored, truth, k), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "build_s": round(build_s, 2),
+        })
+    return rows
+
+
+def _library_vectors(user_id: str) -> np.ndarray:
+    from app.content.library import get_user_library  # lazy: pulls in the embedder stack
+    return get_user_library(user_id).all_vectors()[1]
+
+
+def _synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real embedding distributions than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 200), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG ANN index recall-vs-latency report (baseline: exact flat search)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--library", metavar="USER_ID", help="use the vectors of a user's document library")
+    source.add_argument("--npy", help="(n, dim) float array of normalized embeddings")
+    source.add_argument("--synthetic", type=int, metavar="N", help="N clustered random vectors")
+    parser.add_argument("--dim", type=int, default=384, help="dimension for --synthetic")
+    parser.add_argument("--queries", type=int, default=200, help="held-out query count")
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--quantization", action="store_true", help="report memory/recall per storage mode instead")
+    parser.add_argument("--rescore-factor", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.library:
+        data = _library_vectors(args.library)
+    elif args.npy:
+        data = np.load(args.npy).astype(np.float32)
+        faiss.normalize_L2(data)
+    else:
+        data = _synthetic_vectors(args.synthetic + args.queries, args.dim)
+    # Queries are held out of the indexed corpus (like real prompts)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(data))
+    query_vecs, corpus = data[order[: args.queries]], data[order[args.queries:]]
+    print(f"corpus={len(corpus)} dim={corpus.shape[1]} queries={len(query_vecs)} "
+          f"auto choice={choose_kind(len(corpus))}")
+    if args.quantization:
+        _print_table(quantization_report(corpus, query_vecs, k=args.k, factor=args.rescore_factor))
+        raise SystemExit(0)
+    _print_table(recall_latency_report(corpus, query_vecs, k=args.k, nprobes=args.nprobe, ef_searches=args.ef_search))
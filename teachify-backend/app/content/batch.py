@@ -0,0 +1,226 @@
+# app/content/batch.py
+"""
+Batch lecture generation (POST /v1/content/generate-batch).
+
+All items of a batch run concurrently, but every pipeline stage is gated by a
+process-wide semaphore (settings.batch_*_concurrency). Stages of different items
+therefore overlap like an assembly line — Gemini writes item N+1 while BFL
+renders item N and Azure synthesizes item N-1 — without any provider seeing more
+than its cap, even when several batches run at once.
+
+A batch is a `jobs` document (job_type "batch") holding one entry per item under
+`items`; each lecture is persisted to history as soon as it finishes.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.auth.models import UserPublic
+from app.content.pipeline import LecturePipelineError, generate_lecture_once
+from app.content.library import LibrarySelection
+from app.utils.tasks import spawn, uses_durable_queue
+
+logger = logging.getLogger("uvicorn")
+
+_stage_slots: Optional[Dict[str, asyncio.Semaphore]] = None
+
+
+def get_stage_slots() -> Dict[str, asyncio.Semaphore]:
+    """Process-wide per-stage semaphores shared by every batch item."""
+    global _stage_slots
+    if _stage_slots is None:
+        _stage_slots = {
+            "context": asyncio.Semaphore(max(1, settings.batch_context_concurrency)),
+            "content": asyncio.Semaphore(max(1, settings.batch_content_concurrency)),
+            "visuals": asyncio.Semaphore(max(1, settings.batch_visuals_concurrency)),
+            "avatar": asyncio.Semaphore(max(1, settings.batch_avatar_concurrency)),
+        }
+    return _stage_slots
+
+
+def new_batch_items(prompts: List[str]) -> List[Dict[str, Any]]:
+    return [
+        {"index": i, "prompt": p, "status": "queued", "stage": "queued", "progress": 0,
+         "error": None, "topic": None, "video_path": None}
+        for i, p in enumerate(prompts)
+    ]
+
+
+async def _update_item(db: AsyncIOMotorDatabase, job_id: str, index: int, **fields: Any) -> None:
+    """Best-effort update of one item of a batch job."""
+    try:
+        update = {f"items.{index}.{k}": v for k, v in fields.items()}
+        update["updated_at"] = datetime.utcnow()
+        await db.jobs.update_one({"_id": ObjectId(job_id)}, {"$set": update})
+    except Exception as e:  # status tracking must never break the batch
+        logger.error(f"❌ Failed to update batch {job_id} item {index}: {e}")
+
+
+# ────────────────────────────────
+# Execution
+# ────────────────────────────────
+async def run_batch(
+    db: AsyncIOMotorDatabase,
+    job_id: str,
+    current_user: UserPublic,
+    prompts: List[str],
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    library: Optional[LibrarySelection] = None,
+    skip: Collection[int] = (),
+) -> Dict[str, int]:
+    """
+    Generate every prompt (except indexes in `skip`) under the shared stage caps,
+    recording per-item status on the batch job. Returns {"succeeded": n, "failed": m}.
+    """
+    from app.utils.jobs import mark_job_progress  # lazy import to avoid cycles
+
+    slots = get_stage_slots()
+    pending = [i for i in range(len(prompts)) if i not in skip]
+    counts = {"succeeded": len(prompts) - len(pending), "failed": 0}
+
+    async def _item(index: int) -> None:
+        async def _progress(stage: str, progress: int) -> None:
+            await _update_item(db, job_id, index, status="running", stage=stage, progress=progress)
+
+        try:
+            lecture = await generate_lecture_once(
+                db, current_user, prompts[index],
+                files=files, on_progress=_progress, use_cache=use_cache,
+                parallel_sections=parallel_sections, stage_slots=slots, library=library,
+            )
+        except Exception as e:
+            detail = e.detail if isinstance(e, LecturePipelineError) else "Lecture generation failed."
+            logger.error(f"❌ Batch {job_id} item {index} failed: {e}")
+            counts["failed"] += 1
+            await _update_item(db, job_id, index, status="failed", error=detail)
+        else:
+            counts["succeeded"] += 1
+            await _update_item(
+                db, job_id, index, status="succeeded", stage="done", progress=100,
+                error=None, topic=lecture.topic, video_path=lecture.video_path,
+            )
+        done = counts["succeeded"] + counts["failed"]
+        await mark_job_progress(db, job_id, "items", int(100 * done / max(1, len(prompts))))
+
+    logger.info(f"📚 Batch {job_id}: {len(pending)} lecture(s) for {current_user.username}")
+    await asyncio.gather(*(_item(i) for i in pending))
+    return counts
+
+
+async def run_batch_job(
+    db: AsyncIOMotorDatabase,
+    job_id: str,
+    current_user: UserPublic,
+    prompts: List[str],
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    library: Optional[LibrarySelection] = None,
+) -> None:
+    """In-process runner: executes the batch and records the overall outcome on the job."""
+    from app.utils.jobs import mark_job_running, mark_job_succeeded, mark_job_failed
+
+    await mark_job_running(db, job_id)
+    try:
+        counts = await run_batch(
+            db, job_id, current_user, prompts,
+            files=files, use_cache=use_cache, parallel_sections=parallel_sections, library=library,
+        )
+    except Exception as e:
+        logger.error(f"❌ Batch job {job_id} crashed: {e}")
+        await mark_job_failed(db, job_id, "Batch generation failed.")
+        return
+
+    if counts["succeeded"]:
+        await mark_job_succeeded(db, job_id, counts)
+    else:
+        await mark_job_failed(db, job_id, "Every lecture in the batch failed.", stage="items")
+    logger.info(f"✅ Batch job {job_id} finished: {counts}")
+
+
+# ────────────────────────────────
+# Submission (in-process task or durable queue)
+# ────────────────────────────────
+async def submit_batch_job(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    current_user: UserPublic,
+    prompts: List[str],
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    library: Optional[LibrarySelection] = None,
+    callback_url: Optional[str] = None,
+) -> str:
+    """Create a batch job and start it (see submit_lecture_job for the queue semantics)."""
+    from app.utils.jobs import create_job  # lazy import to avoid cycles
+
+    payload: Dict[str, Any] = {
+        "prompts": prompts,
+        "mode": "rag" if files or library is not None else "prompt",
+        "use_cache": use_cache,
+        "parallel_sections": parallel_sections,
+        "callback_url": callback_url,
+    }
+    if files:
+        payload["source_files"] = [path for (path, _mime) in files]
+        payload["files"] = [[path, mime] for (path, mime) in files]
+    if library is not None:
+        payload["library"] = library.to_payload()
+
+    queued = uses_durable_queue()
+    job_id = await create_job(
+        db, user_id, "batch", payload,
+        queued=queued, max_attempts=settings.queue_max_attempts if queued else 1,
+        extra={"items": new_batch_items(prompts)},
+    )
+    if not queued:
+        spawn(
+            run_batch_job(
+                db, job_id, current_user, prompts,
+                files=files, use_cache=use_cache, parallel_sections=parallel_sections, library=library,
+            ),
+            name=f"batch-job-{job_id}",
+        )
+    return job_id
+
+
+async def batch_job_handler(db: AsyncIOMotorDatabase, job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queue handler for "batch" jobs (see app.worker). Items that succeeded in an
+    earlier attempt are skipped; the attempt fails (and is retried) only when
+    no lecture of the batch succeeded.
+    """
+    from app.auth.routes import _map_user_to_public  # lazy import to avoid cycles
+
+    job_id = str(job["_id"])
+    payload = job.get("payload") or {}
+    user = await db.users.find_one({"_id": ObjectId(job["user_id"])})
+    if not user:
+        raise LecturePipelineError("queued", "User not found.")
+
+    done = {item["index"] for item in job.get("items") or [] if item.get("status") == "succeeded"}
+    files = [(path, mime) for path, mime in payload.get("files") or []] or None
+    counts = await run_batch(
+        db, job_id, _map_user_to_public(user), payload["prompts"],
+        files=files,
+        use_cache=payload.get("use_cache", True),
+        parallel_sections=payload.get("parallel_sections", False),
+        library=LibrarySelection.from_payload(payload.get("library")),
+        skip=done,
+    )
+    if not counts["succeeded"]:
+        raise LecturePipelineError("items", "Every lecture in the batch failed.")
+    return counts
@@ -0,0 +1,136 @@
+# app/content/checkpoints.py
+"""
+Per-run checkpoints for the lecture pipeline (MongoDB `pipeline_runs` collection).
+
+Every finished stage (context, content JSON, visuals with image paths, avatar
+URLs + captions) is written under the run id as soon as it completes, and so is
+every Azure avatar job id at submission time. When the same request is retried —
+by the user, the job queue, or after a worker crash — the pipeline starts from
+the first incomplete stage and reattaches to Azure jobs that are still running
+instead of submitting new ones. The checkpoint is discarded once the lecture has
+been persisted; abandoned runs expire via a TTL index.
+"""
+
+from __future__ import annotations
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.auth.models import GeneratedContent
+
+logger = logging.getLogger("uvicorn")
+
+
+# ────────────────────────────────
+# Stage (de)serialization
+# ────────────────────────────────
+def encode_stage(name: str, value: Any) -> Any:
+    if isinstance(value, GeneratedContent):
+        return value.model_dump()
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def decode_stage(name: str, raw: Any) -> Optional[Any]:
+    """Rebuild a stage result; None if it can no longer be trusted (e.g. image files gone)."""
+    if name == "content":
+        return GeneratedContent(**raw)
+    if name == "visuals":
+        content = GeneratedContent(**raw)
+        for v in content.visualizations:
+            path = v.image_path
+            if path and not path.startswith(("http://", "https://")) and not os.path.exists(path):
+                return None
+        return content
+    if name == "avatar":
+        return tuple(raw)
+    return raw
+
+
+class PipelineCheckpoint:
+    """Checkpoint document for one pipeline run; also the avatar job ledger for that run."""
+
+    def __init__(self, db: AsyncIOMotorDatabase, run_id: str, doc: Optional[Dict[str, Any]] = None):
+        self.db = db
+        self.run_id = run_id
+        doc = doc or {}
+        self._stages: Dict[str, Any] = dict(doc.get("stages") or {})
+        self._avatar_jobs: Dict[str, str] = dict(doc.get("avatar_jobs") or {})
+        self._frozen = False
+
+    @classmethod
+    async def open(cls, db: Optional[AsyncIOMotorDatabase], run_id: str) -> Optional["PipelineCheckpoint"]:
+        """Load (or start) the checkpoint for `run_id`; None when checkpoints are disabled/unavailable."""
+        if db is None or not settings.pipeline_checkpoints_enabled:
+            return None
+        try:
+            doc = await db.pipeline_runs.find_one({"run_id": run_id})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load pipeline checkpoint {run_id[:12]}: {e}")
+            return None
+        if doc and doc.get("stages"):
+            logger.info(f"⏯️ Resuming pipeline run {run_id[:12]}: completed stages {sorted(doc['stages'])}")
+        return cls(db, run_id, doc)
+
+    # ────────────────────────────────
+    # Stage results
+    # ────────────────────────────────
+    def completed(self) -> Dict[str, Any]:
+        """Decoded results of the stages that already finished (usable as StagePipeline `initial`)."""
+        out: Dict[str, Any] = {}
+        for name, raw in self._stages.items():
+            try:
+                value = decode_stage(name, raw)
+            except Exception as e:
+                logger.warning(f"⚠️ Ignoring unreadable checkpoint for stage '{name}': {e}")
+                continue
+            if value is not None:
+                out[name] = value
+        return out
+
+    async def _update(self, fields: Dict[str, Any]) -> None:
+        now = datetime.utcnow()
+        fields.update({
+            "updated_at": now,
+            "expires_at": now + timedelta(hours=settings.pipeline_checkpoint_ttl_h),
+        })
+        try:
+            await self.db.pipeline_runs.update_one(
+                {"run_id": self.run_id},
+                {"$set": fields, "$setOnInsert": {"created_at": now}},
+                upsert=True,
+            )
+        except Exception as e:  # checkpoints are best-effort
+            logger.warning(f"⚠️ Failed to write pipeline checkpoint {self.run_id[:12]}: {e}")
+
+    def freeze(self) -> None:
+        """Stop saving stage results for the rest of this run (they would pin a retry to a fallback)."""
+        self._frozen = True
+
+    async def save_stage(self, name: str, value: Any) -> None:
+        if self._frozen:
+            return
+        raw = encode_stage(name, value)
+        self._stages[name] = raw
+        await self._update({f"stages.{name}": raw})
+
+    # ────────────────────────────────
+    # Avatar job ledger
+    # ────────────────────────────────
+    def pending_job(self, key: str) -> Optional[str]:
+        return self._avatar_jobs.get(key)
+
+    async def record_job(self, key: str, job_id: str) -> None:
+        self._avatar_jobs[key] = job_id
+        await self._update({f"avatar_jobs.{key}": job_id})
+
+    async def discard(self) -> None:
+        try:
+            await self.db.pipeline_runs.delete_one({"run_id": self.run_id})
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to discard pipeline checkpoint {self.run_id[:12]}: {e}")
@@ -0,0 +1,227 @@
+# app/content/embedding_cache.py
+"""
+Persistent cache of extracted + embedded RAG documents.
+
+Entries are keyed by SHA-256 of (file bytes digest, embedder name, chunker
+parameters), so re-uploading the same document skips text extraction and
+encoding entirely, while a different model or chunk size never reuses stale
+vectors. Each entry is one `<key>.npz` holding the cleaned text, the chunk
+boundaries (word offsets into that text) and the chunk vectors as float16;
+a small SQLite index (safe to share across uvicorn workers) tracks sizes for
+LRU eviction and keeps hit/miss counters.
+
+Query embeddings get a separate in-memory LRU, since the same lecture prompt
+is typically retrieved against several times (retries, batches, library docs).
+"""
+
+from __future__ import annotations
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    key        TEXT PRIMARY KEY,
+    file_hash  TEXT NOT NULL,
+    embedder   TEXT NOT NULL,
+    chunks     INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_documents_last_used ON documents(last_used);
+"""
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def document_cache_key(file_hash: str, embedder: str, max_tokens: int, overlap: int) -> str:
+    """Content address for a document embedded with a given model and chunker configuration."""
+    return hashlib.sha256(f"{file_hash}\x1f{embedder}\x1f{max_tokens}\x1f{overlap}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class DocumentEmbedding:
+    """Cleaned text of one document, its chunk spans (word offsets) and float32 chunk vectors."""
+    text: str
+    spans: np.ndarray    # (n, 2) int32: [start_word, end_word)
+    vectors: np.ndarray  # (n, dim) float32, L2-normalized
+
+    def chunks(self) -> List[str]:
+        words = self.text.split()
+        return [" ".join(words[s:e]) for s, e in self.spans.tolist()]
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._session() as conn:
+            conn.executescript(_SCHEMA)
+
+    # ────────────────────────────────
+    # Internals
+    # ────────────────────────────────
+    @contextmanager
+    def _session(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (total,) = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM documents").fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size_bytes FROM documents ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    # ────────────────────────────────
+    # Public API
+    # ────────────────────────────────
+    def get(self, key: str) -> Optional[DocumentEmbedding]:
+        try:
+            with np.load(self._path(key), allow_pickle=False) as data:
+                doc = DocumentEmbedding(
+                    text=str(data["text"]),
+                    spans=data["spans"].astype(np.int32),
+                    vectors=data["vectors"].astype(np.float32),
+                )
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        except Exception as e:  # truncated/corrupt entry: treat as a miss and overwrite later
+            logger.warning(f"⚠️ Unreadable embedding cache entry {key[:12]}: {e}")
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock, self._session() as conn:
+            conn.execute("UPDATE documents SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.stats["hits"] += 1
+        logger.info(f"♻️ Embedding cache hit: {key[:12]} ({len(doc.spans)} chunks)")
+        return doc
+
+    def put(self, key: str, file_hash: str, embedder: str, doc: DocumentEmbedding) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(
+            tmp,
+            text=np.array(doc.text),
+            spans=doc.spans.astype(np.int32),
+            vectors=doc.vectors.astype(np.float16),
+        )
+        os.replace(tmp, path)  # atomic for concurrent writers
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock, self._session() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (key, file_hash, embedder, chunks, size_bytes, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, file_hash, embedder, len(doc.spans), size, now, now),
+            )
+            self.stats["stores"] += 1
+            self._evict(conn)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock, self._session() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM documents").fetchone()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return {**self.stats, "entries": entries, "size_bytes": total, "hit_rate": round(hit_rate, 4)}
+
+
+class QueryEmbeddingLRU:
+    """Small thread-safe LRU of query vectors keyed by (embedder, query text)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(0, max_entries)
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+        self._items: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, embedder: str, query: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        key = (embedder, query)
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is not None:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return vec
+            self.stats["misses"] += 1
+        vec = compute(query)  # outside the lock: encoding is the slow part
+        vec.setflags(write=False)
+        if self.max_entries:
+            with self._lock:
+                self._items[key] = vec
+                self._items.move_to_end(key)
+                while len(self._items) > self.max_entries:
+                    self._items.popitem(last=False)
+        return vec
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._items)}
+
+
+# ────────────────────────────────
+# Process-wide instances
+# ────────────────────────────────
+_embedding_cache: Optional[EmbeddingCache] = None
+_query_cache = QueryEmbeddingLRU(settings.rag_query_cache_size)
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the shared document cache, or None when disabled/unavailable."""
+    global _embedding_cache
+    if not settings.rag_cache_enabled:
+        return None
+    if _embedding_cache is None:
+        try:
+            _embedding_cache = EmbeddingCache(settings.rag_cache_dir, settings.rag_cache_max_mb * 1024 * 1024)
+            logger.info(f"✅ RAG embedding cache ready at {settings.rag_cache_dir}")
+        except Exception as e:
+            logger.warning(f"⚠️ RAG embedding cache unavailable: {e}")
+            return None
+    return _embedding_cache
+
+
+def get_query_cache() -> QueryEmbeddingLRU:
+    return _query_cache
@@ -0,0 +1,228 @@
+# app/content/extraction.py
+"""
+Document text extraction (PDF/DOCX/TXT) in a process pool.
+
+PDF parsing is pure-Python CPU work that holds the GIL, so running it on a
+thread still stalls the event loop's process. `PageStream` submits a file to a
+shared ProcessPoolExecutor — PDFs split into ranges of
+settings.rag_extract_pages_per_task pages — and yields page texts in order
+as soon as each range is done, so the caller can chunk and embed the first
+pages while later ones are still being parsed. Streams of several files run
+in the pool concurrently.
+
+This module is what the pool workers import: keep it free of heavy imports
+(no sentence-transformers / FAISS).
+"""
+
+from __future__ import annotations
+import os
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from docx import Document
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+
+# ────────────────────────────────
+# Extractors (run inside pool workers)
+# ────────────────────────────────
+_pdf_local = threading.local()  # per-thread: PdfReader is not safe to share across threads
+
+
+def _open_pdf(path: str) -> PdfReader:
+    """
+    Parsed PdfReader for `path`, reused while this worker handles further page
+    ranges of the same file (keyed by mtime and size, so a replaced file is re-read).
+    """
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    readers: "OrderedDict[Tuple[str, int, int], PdfReader]" = getattr(_pdf_local, "readers", None) or OrderedDict()
+    _pdf_local.readers = readers
+    reader = readers.get(key)
+    if reader is None:
+        reader = readers[key] = PdfReader(path)
+        while len(readers) > 2:
+            readers.popitem(last=False)
+    readers.move_to_end(key)
+    return reader
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    try:
+        pages = _open_pdf(path).pages
+        return [pages[i].extract_text() or "" for i in range(start, min(end, len(pages)))]
+    except Exception as e:
+        logger.error(f"PDF extract failed for {path} (pages {start}-{end}): {e}")
+        return []
+
+
+def _extract_pdf_head(path: str, count: int) -> Tuple[int, List[str]]:
+    """(page count, texts of the first `count` pages) — lets PageStream size the remaining ranges."""
+    return _pdf_page_count(path), _extract_pdf_pages(path, 0, count)
+
+
+def _extract_text_from_pdf(path: str) -> str:
+    return "\n".join(_extract_pdf_pages(path, 0, _pdf_page_count(path)))
+
+def _extract_text_from_docx(path: str) -> str:
+    try:
+        doc = Document(path)
+        return "\n".join(p.text for p in doc.paragraphs if p.text)
+    except Exception as e:
+        logger.error(f"DOCX extract failed for {path}: {e}")
+        return ""
+
+def _extract_text_from_txt(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"TXT read failed for {path}: {e}")
+        return ""
+
+
+def _is_pdf(path: str, mime: Optional[str]) -> bool:
+    return bool(mime and "pdf" in mime) or os.path.splitext(path)[1].lower() == ".pdf"
+
+
+def _extract_single(path: str, mime: Optional[str]) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if mime and ("word" in mime or "docx" in mime) or ext == ".docx":
+        return _extract_text_from_docx(path)
+    return _extract_text_from_txt(path)
+
+
+def _pdf_page_count(path: str) -> int:
+    try:
+        return len(_open_pdf(path).pages)
+    except Exception as e:
+        logger.error(f"PDF extract failed for {path}: {e}")
+        return 0
+
+
+def extract_text(path: str, mime: Optional[str] = None) -> str:
+    """Whole-document text, extracted inline on the calling thread."""
+    if _is_pdf(path, mime):
+        return _extract_text_from_pdf(path)
+    return _extract_single(path, mime)
+
+
+# ────────────────────────────────
+# Process pool
+# ────────────────────────────────
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """Shared extraction pool, or None when settings.rag_extract_workers is 0 (inline extraction)."""
+    global _pool
+    if settings.rag_extract_workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: workers never inherit the parent's threads, event loop or model weights
+            ctx = multiprocessing.get_context("forkserver" if os.name == "posix" else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=settings.rag_extract_workers, mp_context=ctx)
+            logger.info(f"🧵 Document extraction pool started ({settings.rag_extract_workers} processes).")
+        return _pool
+
+
+def shutdown_extraction_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PageStream:
+    """
+    Page texts of one document, extracted in the pool. Work is submitted on
+    construction without touching the file on the calling thread: a PDF's first
+    range task also returns the page count, and the remaining ranges are queued
+    as soon as it completes. Iterating yields pages in document order (DOCX/TXT
+    yield a single "page"). A task lost to a crashed worker is redone inline.
+    """
+
+    def __init__(self, path: str, mime: Optional[str] = None):
+        self.path = path
+        self.mime = mime
+        self._pool = get_extraction_pool()
+        self._step = max(1, settings.rag_extract_pages_per_task)
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._ranges: Dict[int, Future] = {}
+        self._ranges_queued = threading.Event()
+        self._pdf = _is_pdf(path, mime)
+        self._first = (_extract_pdf_head, path, self._step) if self._pdf else (_extract_single, path, mime)
+        self._first_future = self._submit(self._first)
+        if self._pdf and self._first_future is not None:
+            self._first_future.add_done_callback(self._queue_ranges)
+        else:
+            self._ranges_queued.set()
+
+    def _submit(self, call: Tuple) -> Optional[Future]:
+        if self._pool is None:
+            return None
+        try:
+            return self._pool.submit(*call)
+        except RuntimeError:  # pool shut down: extract inline
+            return None
+
+    def _range_call(self, start: int, pages: int) -> Tuple:
+        return (_extract_pdf_pages, self.path, start, min(pages, start + self._step))
+
+    def _queue_ranges(self, head: Future) -> None:
+        """Done-callback of the first PDF task: submit the remaining ranges now that the page count is known."""
+        try:
+            if head.cancelled() or head.exception() is not None:
+                return
+            pages, _texts = head.result()
+            with self._lock:
+                if self._cancelled:
+                    return
+                for start in range(self._step, pages, self._step):
+                    future = self._submit(self._range_call(start, pages))
+                    if future is not None:
+                        self._ranges[start] = future
+        finally:
+            self._ranges_queued.set()
+
+    def _result(self, call: Tuple, future: Optional[Future]):
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as e:
+                logger.warning(f"⚠️ Pooled extraction failed for {self.path}, retrying inline: {e}")
+        func, *args = call
+        return func(*args)
+
+    def __iter__(self) -> Iterator[str]:
+        first = self._result(self._first, self._first_future)
+        if not self._pdf:
+            yield first
+            return
+        pages, texts = first
+        yield from texts
+        self._ranges_queued.wait()
+        for start in range(self._step, pages, self._step):
+            with self._lock:
+                future = self._ranges.get(start)
+            yield from self._result(self._range_call(start, pages), future)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            futures = [self._first_future, *self._ranges.values()]
+        for future in futures:
+            if future is not None:
+                future.cancel()
@@ -4,8 +4,15 @@ import logging
 from google import genai
 from google.genai import types
 from app.config import settings
+from typing import List, Optional
+from pydantic import BaseModel, Field
 from app.auth.models import GeneratedContent
+from app.content.prompt_cache import PromptCache, get_prompt_cache
+from app.utils.circuit_breaker import CircuitBreaker
+from app.content.json_stream import LectureStreamParser, SectionCallback, VisualCallback
 import time
+import random
+import asyncio
 logger = logging.getLogger("uvicorn")
 
 # ────────────────────────────────
@@ -19,6 +26,26 @@ except Exception as e:
     gemini_client = None
 
 
+# ────────────────────────────────
+# Model + system prompts
+# ────────────────────────────────
+GEMINI_MODEL = "gemini-2.5-flash"
+
+LECTURE_SYSTEM_PROMPT = (
+    "You are an expert educational content assistant. "
+    "Generate a concise, structured lecture in JSON with the following fields: "
+    "topic, introduction, main_body, conclusion, and visualizations[]. "
+    "Ensure the output strictly matches the provided JSON schema."
+)
+
+CONTEXT_SYSTEM_PROMPT = (
+    "You are an expert educational content assistant. "
+    "Use the provided CONTEXT to ground your answer. If the context is insufficient, say so and avoid fabricating facts. "
+    "Return a structured lecture in JSON with: topic, introduction, main_body, conclusion, visualizations[]. "
+    "Each visualization should target a concrete paragraph; keep them precise and helpful."
+)
+
+
 # ────────────────────────────────
 # Helper: Fallback heuristic
 # ────────────────────────────────
@@ -26,8 +53,10 @@ def _heuristic_content(prompt: str) -> dict:
     """
     Local fallback generator when Gemini is unavailable or fails.
     Produces a deterministic structured response to avoid recursion loops.
+    Marked with `fallback: True` (see is_fallback); GeneratedContent drops the key.
     """
     return {
+        "fallback": True,
         "topic": prompt[:120],
         "introduction": f"An introduction to {prompt}, explaining its basic concepts.",
         "main_body": f"This section elaborates on {prompt}, discussing its key aspects, examples, and relevance.",
@@ -49,6 +78,11 @@ def _heuristic_content(prompt: str) -> dict:
     }
 
 
+def is_fallback(data: dict) -> bool:
+    """True for heuristic content returned in place of a Gemini result."""
+    return bool(data.get("fallback"))
+
+
 # ────────────────────────────────
 # Helper: Sanitize Gemini output
 # ────────────────────────────────
@@ -71,150 +105,452 @@ def sanitize_output(data: dict) -> dict:
 
 
 # ────────────────────────────────
-# Main: Generate Content
+# Async generation (non-blocking retries + circuit breaker)
 # ────────────────────────────────
-def generate_content(prompt: str) -> dict:
+def _is_unavailable(err: Exception) -> bool:
+    return "503" in str(err) or "UNAVAILABLE" in str(err)
+
+
+async def _cached_lookup(cache: Optional[PromptCache], prompt: str, mode: str) -> Optional[dict]:
+    """Prompt-cache hit for this generation mode, or None (cache errors are logged, never raised)."""
+    if not cache:
+        return None
+    try:
+        return await asyncio.to_thread(cache.get, prompt, mode)
+    except Exception as e:
+        logger.warning(f"⚠️ Prompt cache lookup failed: {e}")
+        return None
+
+
+async def _cache_store(cache: Optional[PromptCache], prompt: str, mode: str, result: dict, latency_s: float) -> None:
+    if not cache:
+        return
+    try:
+        await asyncio.to_thread(cache.put, prompt, result, latency_s, mode)
+    except Exception as e:
+        logger.warning(f"⚠️ Prompt cache store failed: {e}")
+
+
+def _attach_visual_anchors(data: dict) -> dict:
+    """Attach paragraph index + snippet for each visualization."""
+    for vis in data.get("visualizations", []):
+        section = vis.get("section", "").lower()
+        text_section = data.get(section, "")
+        if not text_section:
+            continue
+        paragraphs = [p.strip() for p in text_section.split("\n") if p.strip()]
+        if paragraphs:
+            vis["paragraph_index"] = min(len(paragraphs) - 1, 0)
+            vis["snippet"] = paragraphs[0][:120]
+    return data
+
+
+async def _probe_gemini() -> None:
+    """Cheapest real generation call; succeeds only when the model serves again."""
+    await gemini_client.aio.models.generate_content(
+        model=GEMINI_MODEL,
+        contents="ping",
+        config=types.GenerateContentConfig(max_output_tokens=1),
+    )
+
+
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=settings.gemini_breaker_failure_threshold,
+    reset_timeout=settings.gemini_breaker_reset_s,
+    probe=_probe_gemini,
+)
+
+
+async def _generate_json_async(contents, system_prompt: str, temperature: float, schema=GeneratedContent) -> dict | None:
+    """
+    Call Gemini through the SDK's async surface.
+    503/UNAVAILABLE errors are retried with capped exponential backoff + full jitter
+    (asyncio.sleep, never blocking the loop) and reported to the shared breaker.
+    Returns parsed JSON, or None when Gemini stays unavailable / the circuit is open.
+    """
+    attempts = settings.gemini_max_retries
+    for attempt in range(attempts):
+        if not gemini_breaker.allow():
+            logger.warning("🚫 Gemini circuit open — skipping call, using fallback.")
+            return None
+        try:
+            response = await gemini_client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_prompt,
+                    response_mime_type="application/json",
+                    response_schema=schema.model_json_schema(),
+                    temperature=temperature,
+                ),
+            )
+        except Exception as e:
+            if not _is_unavailable(e):
+                raise
+            gemini_breaker.record_failure()
+            wait = random.uniform(0, min(settings.gemini_backoff_cap_s, settings.gemini_backoff_base_s * 2 ** attempt))
+            logger.warning(f"⚠️ Gemini overloaded (attempt {attempt + 1}/{attempts}) — retrying in {wait:.1f}s...")
+            await asyncio.sleep(wait)
+            continue
+        gemini_breaker.record_success()
+        return json.loads(response.text)
+
+    logger.error(f"❌ Gemini remained unavailable after {attempts} retries — using fallback.")
+    return None
+
+
+async def generate_content_async(prompt: str, use_cache: bool = True) -> dict:
     """
-    Generates structured educational content using Gemini,
-    falling back to a heuristic method if necessary.
+    Generates structured educational content using Gemini, falling back to a
+    heuristic method if necessary. Successful Gemini results are served from /
+    stored in the prompt cache unless `use_cache` is False.
     """
     if not gemini_client or not settings.gemini_api_key:
         logger.warning("⚠️ Gemini client unavailable — using fallback generator.")
         return sanitize_output(_heuristic_content(prompt))
 
-    # Build JSON schema from model
-    lecture_schema = GeneratedContent.model_json_schema()
-
-    system_prompt = (
-        "You are an expert educational content assistant. "
-        "Generate a concise, structured lecture in JSON with the following fields: "
-        "topic, introduction, main_body, conclusion, and visualizations[]. "
-        "Ensure the output strictly matches the provided JSON schema."
-    )
+    cache = get_prompt_cache() if use_cache else None
+    cached = await _cached_lookup(cache, prompt, "single")
+    if cached:
+        return cached
+    started = time.monotonic()
 
     try:
-        # ────────────────────────────────
-        # Retry logic for Gemini overloads (503)
-        # ────────────────────────────────
-        for attempt in range(5):
-            try:
-                response = gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=prompt if 'context' not in locals() else contents,
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_prompt,
-                        response_mime_type="application/json",
-                        response_schema=lecture_schema,
-                        temperature=0.3 if 'context' not in locals() else 0.2,
-                    ),
-                )
-                break
-            except Exception as e:
-                if "503" in str(e) or "UNAVAILABLE" in str(e):
-                    wait = 2 ** attempt
-                    logger.warning(f"⚠️ Gemini overloaded (attempt {attempt + 1}/5) — retrying in {wait}s...")
-                    time.sleep(wait)
-                    continue
-                else:
-                    raise
-        else:
-            logger.error("❌ Gemini remained unavailable after 5 retries — using fallback.")
-            return sanitize_output(_heuristic_content(prompt))
-
-        # Parse response JSON
-        data = json.loads(response.text)
-        logger.info("✅ Gemini content generation successful.")
-
-        # Attach paragraph indices for each visualization
-        for vis in data.get("visualizations", []):
-            section = vis.get("section", "").lower()
-            text_section = data.get(section, "")
-            if not text_section:
-                continue
-
-            # Find snippet and paragraph position
-            paragraphs = [p.strip() for p in text_section.split("\n") if p.strip()]
-            if paragraphs:
-                vis["paragraph_index"] = min(len(paragraphs) - 1, 0)
-                vis["snippet"] = paragraphs[0][:120]
-
-        return sanitize_output(data)
-
+        data = await _generate_json_async(prompt, LECTURE_SYSTEM_PROMPT, 0.3)
     except Exception as e:
         logger.error(f"❌ Gemini API call failed: {e}")
+        data = None
+    if data is None:
         logger.warning("Using fallback heuristic instead.")
         return sanitize_output(_heuristic_content(prompt))
 
+    logger.info("✅ Gemini content generation successful.")
+    result = sanitize_output(_attach_visual_anchors(data))
+    await _cache_store(cache, prompt, "single", result, time.monotonic() - started)
+    return result
+
+
+async def generate_content_with_context_async(prompt: str, context: str) -> dict:
+    """
+    Same as generate_content_async, but includes retrieved context for higher fidelity answers.
+    """
+    if not gemini_client or not settings.gemini_api_key:
+        logger.warning("⚠️ Gemini unavailable — using fallback with context ignored.")
+        return sanitize_output(_heuristic_content(prompt))
+
+    contents = [
+        {"role": "user", "parts": [
+            {"text": f"PROMPT:\n{prompt}\n\nCONTEXT:\n{context or '(none)'}"}
+        ]}
+    ]
+    try:
+        data = await _generate_json_async(contents, CONTEXT_SYSTEM_PROMPT, 0.2)
+    except Exception as e:
+        logger.error(f"❌ Gemini (context) failed: {e}")
+        data = None
+    if data is None:
+        return sanitize_output(_heuristic_content(prompt))
+
+    logger.info("✅ Gemini content (with context) generated.")
+    return sanitize_output(_attach_visual_anchors(data))
+
+
 # ────────────────────────────────
-# Context-aware content generation (RAG)
+# Blocking wrappers (scripts / REPL; never call from a running event loop)
 # ────────────────────────────────
+def generate_content(prompt: str, use_cache: bool = True) -> dict:
+    """Blocking wrapper around generate_content_async."""
+    return asyncio.run(generate_content_async(prompt, use_cache))
+
+
 def generate_content_with_context(prompt: str, context: str) -> dict:
+    """Blocking wrapper around generate_content_with_context_async."""
+    return asyncio.run(generate_content_with_context_async(prompt, context))
+
+
+# ────────────────────────────────
+# Streaming generation (incremental JSON → early stage hand-off)
+# ────────────────────────────────
+async def _stream_json_async(contents, system_prompt: str, temperature: float, parser: LectureStreamParser) -> dict | None:
+    """
+    Stream structured output from Gemini into `parser` as it arrives.
+    UNAVAILABLE errors before the first chunk are retried like _generate_json_async;
+    a failure mid-stream is raised (already-emitted events cannot be retracted).
+    """
+    attempts = settings.gemini_max_retries
+    for attempt in range(attempts):
+        if not gemini_breaker.allow():
+            logger.warning("🚫 Gemini circuit open — skipping call, using fallback.")
+            return None
+        received = False
+        try:
+            stream = await gemini_client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_prompt,
+                    response_mime_type="application/json",
+                    response_schema=GeneratedContent.model_json_schema(),
+                    temperature=temperature,
+                ),
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    received = True
+                    parser.feed(chunk.text)
+        except Exception as e:
+            if received or not _is_unavailable(e):
+                raise
+            gemini_breaker.record_failure()
+            wait = random.uniform(0, min(settings.gemini_backoff_cap_s, settings.gemini_backoff_base_s * 2 ** attempt))
+            logger.warning(f"⚠️ Gemini overloaded (attempt {attempt + 1}/{attempts}) — retrying in {wait:.1f}s...")
+            await asyncio.sleep(wait)
+            continue
+        gemini_breaker.record_success()
+        return json.loads(parser.text)
+
+    logger.error(f"❌ Gemini remained unavailable after {attempts} retries — using fallback.")
+    return None
+
+
+async def stream_content_async(
+    prompt: str,
+    *,
+    context: str | None = None,
+    use_cache: bool = True,
+    on_section: SectionCallback | None = None,
+    on_visual: VisualCallback | None = None,
+) -> dict:
     """
-    Same as generate_content, but includes retrieved context for higher fidelity answers.
+    Streaming variant of generate_content_async / generate_content_with_context_async.
+    `on_section(name, text)` fires when a top-level section string completes and
+    `on_visual(index, visualization)` when an object in `visualizations` closes,
+    while the rest of the response is still being generated.
+    Returns the same sanitized structure as the non-streaming calls; callbacks
+    do not fire for prompt-cache hits or fallback content.
     """
     if not gemini_client or not settings.gemini_api_key:
-        logger.warning("⚠️ Gemini unavailable — using fallback with context ignored.")
+        logger.warning("⚠️ Gemini client unavailable — using fallback generator.")
         return sanitize_output(_heuristic_content(prompt))
 
-    lecture_schema = GeneratedContent.model_json_schema()
-    system_prompt = (
-        "You are an expert educational content assistant. "
-        "Use the provided CONTEXT to ground your answer. If the context is insufficient, say so and avoid fabricating facts. "
-        "Return a structured lecture in JSON with: topic, introduction, main_body, conclusion, visualizations[]. "
-        "Each visualization should target a concrete paragraph; keep them precise and helpful."
-    )
-
-    try:
+    if context is not None:
         contents = [
             {"role": "user", "parts": [
                 {"text": f"PROMPT:\n{prompt}\n\nCONTEXT:\n{context or '(none)'}"}
             ]}
         ]
+        system_prompt, temperature = CONTEXT_SYSTEM_PROMPT, 0.2
+        cache = None  # grounded content depends on the documents, not just the prompt
+    else:
+        contents, system_prompt, temperature = prompt, LECTURE_SYSTEM_PROMPT, 0.3
+        cache = get_prompt_cache() if use_cache else None
 
-        # ────────────────────────────────
-        # Retry logic for Gemini overloads (503)
-        # ────────────────────────────────
-        for attempt in range(5):
-            try:
-                response = gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=prompt if 'context' not in locals() else contents,
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_prompt,
-                        response_mime_type="application/json",
-                        response_schema=lecture_schema,
-                        temperature=0.3 if 'context' not in locals() else 0.2,
-                    ),
-                )
-                break
-            except Exception as e:
-                if "503" in str(e) or "UNAVAILABLE" in str(e):
-                    wait = 2 ** attempt
-                    logger.warning(f"⚠️ Gemini overloaded (attempt {attempt + 1}/5) — retrying in {wait}s...")
-                    time.sleep(wait)
-                    continue
-                else:
-                    raise
-        else:
-            logger.error("❌ Gemini remained unavailable after 5 retries — using fallback.")
-            return sanitize_output(_heuristic_content(prompt))
-
-        data = json.loads(response.text)
-        logger.info("✅ Gemini content (with context) generated.")
-
-        for vis in data.get("visualizations", []):
-            section = vis.get("section", "").lower()
-            text_section = data.get(section, "")
-            if not text_section:
-                continue
-            paragraphs = [p.strip() for p in text_section.split("\n") if p.strip()]
-            if paragraphs:
-                vis["paragraph_index"] = min(len(paragraphs) - 1, 0)
-                vis["snippet"] = paragraphs[0][:120]
-
-        return sanitize_output(data)
+    cached = await _cached_lookup(cache, prompt, "single")
+    if cached:
+        return cached
+    started = time.monotonic()
 
+    parser = LectureStreamParser(on_section=on_section, on_visual=on_visual)
+    try:
+        data = await _stream_json_async(contents, system_prompt, temperature, parser)
     except Exception as e:
-        logger.error(f"❌ Gemini (context) failed: {e}")
+        logger.error(f"❌ Gemini streaming call failed: {e}")
+        data = None
+    if data is None:
+        logger.warning("Using fallback heuristic instead.")
+        return sanitize_output(_heuristic_content(prompt))
+
+    logger.info("✅ Gemini streamed content generation successful.")
+    result = sanitize_output(_attach_visual_anchors(data))
+    await _cache_store(cache, prompt, "single", result, time.monotonic() - started)
+    return result
+
+
+# ────────────────────────────────
+# Outline-then-parallel-sections generation (long lectures)
+# ────────────────────────────────
+NARRATION_KEYS = ("introduction", "main_body", "conclusion")
+
+OUTLINE_SYSTEM_PROMPT = (
+    "You are an expert educational content assistant. "
+    "Plan a lecture as a short JSON outline: topic, key points for the introduction, "
+    "the ordered main points of the body (one per subsection), key points for the conclusion, "
+    "and visualizations[]. Each visualization names its section (introduction, main_body or conclusion) "
+    "and, for main_body, the index of the main point it illustrates. Do not write the lecture itself."
+)
+
+SECTION_SYSTEM_PROMPT = (
+    "You are an expert educational content assistant writing one part of a lecture from its outline. "
+    "Write only the requested part as flowing prose in paragraphs separated by newlines, "
+    "consistent with the rest of the outline, without headings or repetition of other parts. "
+    "Return JSON with a single field: text."
+)
+
+
+class _OutlineVisual(BaseModel):
+    section: str
+    point_index: int = 0
+    prompt: str
+
+
+class _LectureOutline(BaseModel):
+    topic: str = Field(..., max_length=120)
+    introduction_points: List[str]
+    main_points: List[str]
+    conclusion_points: List[str]
+    visualizations: List[_OutlineVisual] = Field(default_factory=list)
+
+
+class _SectionDraft(BaseModel):
+    text: str
+
+
+def _paragraphs(text: str) -> List[str]:
+    """Paragraph split used for visualization anchors (same rule as _attach_visual_anchors)."""
+    return [p.strip() for p in text.split("\n") if p.strip()]
+
+
+def _outline_brief(outline: dict) -> str:
+    lines = [f"TOPIC: {outline['topic']}", "INTRODUCTION:"]
+    lines += [f"- {p}" for p in outline["introduction_points"]]
+    lines.append("MAIN POINTS:")
+    lines += [f"{i + 1}. {p}" for i, p in enumerate(outline["main_points"])]
+    lines.append("CONCLUSION:")
+    lines += [f"- {p}" for p in outline["conclusion_points"]]
+    return "\n".join(lines)
+
+
+async def _write_section(brief: str, task: str, context: Optional[str]) -> str:
+    text = f"OUTLINE:\n{brief}\n\nWRITE: {task}"
+    if context is not None:
+        text += f"\n\nCONTEXT (ground the text in it; do not fabricate):\n{context or '(none)'}"
+    data = await _generate_json_async(
+        [{"role": "user", "parts": [{"text": text}]}], SECTION_SYSTEM_PROMPT, 0.3, schema=_SectionDraft
+    )
+    if not data or not (data.get("text") or "").strip():
+        raise RuntimeError(f"empty section draft for: {task[:60]}")
+    return data["text"].strip()
+
+
+def _merge_outlined(outline: dict, intro: str, body_parts: List[str], conclusion: str) -> dict:
+    """
+    Assemble section drafts into one lecture. Visualization anchors point at the
+    first paragraph of the part they illustrate, so they stay consistent after merging.
+    """
+    point_offsets, offset = [], 0
+    for part in body_parts:
+        point_offsets.append(offset)
+        offset += len(_paragraphs(part))
+
+    data = {
+        "topic": outline["topic"],
+        "introduction": intro,
+        "main_body": "\n\n".join(body_parts),
+        "conclusion": conclusion,
+        "visualizations": [],
+    }
+    for vis in outline.get("visualizations", []):
+        section = (vis.get("section") or "").strip().lower().replace(" ", "_")
+        if section not in NARRATION_KEYS:
+            section = "main_body"
+        paragraphs = _paragraphs(data[section])
+        index = 0
+        if section == "main_body" and point_offsets:
+            index = point_offsets[max(0, min(int(vis.get("point_index") or 0), len(point_offsets) - 1))]
+        entry = {"section": section, "prompt": vis.get("prompt") or ""}
+        if paragraphs:
+            index = min(index, len(paragraphs) - 1)
+            entry["paragraph_index"] = index
+            entry["snippet"] = paragraphs[index][:120]
+        data["visualizations"].append(entry)
+    return data
+
+
+async def generate_content_outlined_async(
+    prompt: str,
+    *,
+    context: str | None = None,
+    use_cache: bool = True,
+    on_section: SectionCallback | None = None,
+    on_visual: VisualCallback | None = None,
+) -> dict:
+    """
+    Opt-in mode for long lectures: request a short outline first, then write the
+    introduction, each main point and the conclusion in concurrent Gemini calls
+    (bounded by content_outline_max_parallel) and merge them into one lecture.
+    `on_visual` fires as soon as the outline is known, `on_section` as each
+    section is complete. Falls back to the single-call generation if the outline
+    or any section fails.
+    """
+    if not gemini_client or not settings.gemini_api_key:
+        logger.warning("⚠️ Gemini client unavailable — using fallback generator.")
         return sanitize_output(_heuristic_content(prompt))
 
+    async def _single_call() -> dict:
+        if context is not None:
+            return await generate_content_with_context_async(prompt, context)
+        return await generate_content_async(prompt, use_cache)
+
+    cache = get_prompt_cache() if use_cache and context is None else None
+    cached = await _cached_lookup(cache, prompt, "outlined")
+    if cached:
+        return cached
+    started = time.monotonic()
+
+    outline_text = f"PROMPT:\n{prompt}"
+    if context is not None:
+        outline_text += f"\n\nCONTEXT:\n{context or '(none)'}"
+    try:
+        outline = await _generate_json_async(
+            [{"role": "user", "parts": [{"text": outline_text}]}], OUTLINE_SYSTEM_PROMPT, 0.3, schema=_LectureOutline
+        )
+        if outline is not None:
+            outline = _LectureOutline(**outline).model_dump()
+    except Exception as e:
+        logger.error(f"❌ Gemini outline failed: {e}")
+        outline = None
+    if not outline or not outline["main_points"]:
+        logger.warning("Outline unavailable — using single-call generation instead.")
+        return await _single_call()
+
+    logger.info(f"🧭 Outline ready: {len(outline['main_points'])} main points — writing sections in parallel.")
+    for i, vis in enumerate(outline["visualizations"]):
+        if on_visual:
+            on_visual(i, {"section": vis["section"], "prompt": vis["prompt"]})
+
+    brief = _outline_brief(outline)
+    slots = asyncio.Semaphore(max(1, settings.content_outline_max_parallel))
+
+    async def _bounded(task: str) -> str:
+        async with slots:
+            return await _write_section(brief, task, context)
+
+    async def _section(name: str, tasks: List[str]) -> str:
+        parts = await asyncio.gather(*(_bounded(t) for t in tasks))
+        text = "\n\n".join(parts)
+        if on_section:
+            on_section(name, text)
+        return text
+
+    n = len(outline["main_points"])
+    body_tasks = [
+        f"the body subsection for main point {i + 1} of {n}: {point}"
+        for i, point in enumerate(outline["main_points"])
+    ]
+    try:
+        intro, body_parts, conclusion = await asyncio.gather(
+            _section("introduction", ["the introduction"]),
+            asyncio.gather(*(_bounded(t) for t in body_tasks)),
+            _section("conclusion", ["the conclusion"]),
+        )
+    except Exception as e:
+        logger.error(f"❌ Parallel section generation failed: {e} — using single-call generation instead.")
+        return await _single_call()
+    if on_section:
+        on_section("main_body", "\n\n".join(body_parts))
+
+    logger.info("✅ Gemini outlined content generation successful.")
+    result = sanitize_output(_merge_outlined(outline, intro, list(body_parts), conclusion))
+    await _cache_store(cache, prompt, "outlined", result, time.monotonic() - started)
+    return result
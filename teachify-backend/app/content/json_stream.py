@@ -0,0 +1,127 @@
+# app/content/json_stream.py
+"""
+Incremental parser for the streamed lecture JSON emitted by Gemini.
+
+Feed raw text chunks as they arrive; the parser reports
+- each top-level string field (topic, introduction, main_body, conclusion)
+  as soon as its closing quote is seen, and
+- each object in the top-level `visualizations` array as soon as it closes,
+so downstream stages (images, avatar) can start before the response ends.
+It only tracks structure (depth, strings, escapes); values are decoded with json.loads.
+"""
+
+from __future__ import annotations
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("uvicorn")
+
+SectionCallback = Callable[[str, str], None]
+VisualCallback = Callable[[int, Dict[str, Any]], None]
+
+
+class LectureStreamParser:
+    def __init__(self, on_section: Optional[SectionCallback] = None, on_visual: Optional[VisualCallback] = None):
+        self.on_section = on_section
+        self.on_visual = on_visual
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key: Optional[str] = None     # last string seen at depth 1 (key or value)
+        self._expect_value = False               # a ':' followed a depth-1 key
+        self._current_key: Optional[str] = None  # key whose value is being parsed at depth 1
+        self._in_visuals = False
+        self._object_start = -1
+        self._visual_count = 0
+        self.sections: Dict[str, str] = {}
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._on_string_end(self._string_start, self._pos + 1)
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "{[":
+                self._on_open(ch)
+            elif ch in "}]":
+                self._on_close(ch)
+            elif ch == ":" and self._depth == 1:
+                self._current_key = self._last_key
+                self._expect_value = True
+            elif ch == "," and self._depth == 1:
+                self._expect_value = False
+                self._current_key = None
+            self._pos += 1
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    # ────────────────────────────────
+    # Structural events
+    # ────────────────────────────────
+    def _on_string_end(self, start: int, end: int) -> None:
+        if self._depth != 1:
+            return
+        raw = self._text[start:end]
+        if self._expect_value and self._current_key:
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                return
+            self.sections[self._current_key] = value
+            self._expect_value = False
+            if self.on_section:
+                self._safe(self.on_section, self._current_key, value)
+        else:
+            try:
+                self._last_key = json.loads(raw)
+            except ValueError:
+                self._last_key = None
+
+    def _on_open(self, ch: str) -> None:
+        if self._depth == 1 and ch == "[" and self._expect_value and self._current_key == "visualizations":
+            self._in_visuals = True
+        elif self._in_visuals and self._depth == 2 and ch == "{":
+            self._object_start = self._pos
+        self._depth += 1
+
+    def _on_close(self, ch: str) -> None:
+        self._depth -= 1
+        if self._in_visuals and self._depth == 2 and ch == "}" and self._object_start >= 0:
+            raw = self._text[self._object_start:self._pos + 1]
+            self._object_start = -1
+            try:
+                obj = json.loads(raw)
+            except ValueError:
+                return
+            idx = self._visual_count
+            self._visual_count += 1
+            if self.on_visual and isinstance(obj, dict):
+                self._safe(self.on_visual, idx, obj)
+        elif self._in_visuals and self._depth == 1 and ch == "]":
+            self._in_visuals = False
+            self._expect_value = False
+
+    @staticmethod
+    def _safe(cb: Callable, *args: Any) -> None:
+        try:
+            cb(*args)
+        except Exception as e:  # a consumer bug must not break parsing
+            logger.warning(f"⚠️ Stream consumer failed: {e}")
@@ -0,0 +1,454 @@
+# app/content/library.py
+"""
+Per-user persistent document library for RAG (POST /v1/library/documents).
+
+Documents are ingested once — extracted, chunked and embedded through
+`embed_document` (so the embedding cache applies) — and added to the user's
+on-disk FAISS index. Generation requests then reference library document ids
+instead of re-uploading files.
+
+Layout under settings.library_dir/<user_id>/:
+    index.faiss       IndexIDMap2 over every live chunk; id = doc_seq << CHUNK_BITS | chunk_no
+    docs/<seq>.npz    cleaned text + chunk spans (chunk texts for retrieved ids) + float16 vectors
+    files/<seq><ext>  the original upload (kept for re-embedding with a new model)
+    .lock             advisory lock serializing writers across processes
+
+Readers load the index memory-mapped and read-only, and reload it when the file
+changes. Writers load a private copy, add vectors (incremental — existing chunks
+are never re-embedded) or remove one document's id range with `remove_ids`
+(no rebuild), and atomically replace the file. Document metadata lives in the
+`library_documents` collection.
+
+The wrapped index starts exact (flat) and is rebuilt as IVF from the stored
+document vectors once the library outgrows settings.rag_ann_flat_max chunks,
+then retrained whenever it has grown enough to need twice as many buckets
+(see ann_index.py; HNSW is never used here since it cannot remove vectors).
+With settings.library_quantization the index stores int8 / PQ codes instead of
+float32 (codebooks retrained each time the library doubles); searches then
+re-score the top candidates against the float16 vectors in docs/<seq>.npz.
+An IVF index applies the per-document filter only inside the probed lists, so
+small selections (settings.library_exact_search_max chunks) are scored exactly
+from those stored vectors and larger ones probe proportionally more lists.
+"""
+
+from __future__ import annotations
+import os
+import math
+import fcntl
+import shutil
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.config import settings
+from app.content.ann_index import (
+    base_index,
+    build_ann_index,
+    choose_kind,
+    effective_quantization,
+    index_kind,
+    index_quantization,
+    ivf_nlist,
+    rescore_factor,
+    search_params,
+)
+from app.content.embedding_cache import DocumentEmbedding, file_sha256
+from app.content.rag_processor import embed_document, embed_query, format_context
+
+logger = logging.getLogger("uvicorn")
+
+CHUNK_BITS = 20  # up to ~1M chunks per document
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class LibraryError(Exception):
+    """Raised for unknown / unusable library documents (mapped to 4xx by the API)."""
+
+
+def chunk_id(seq: int, chunk_no: int) -> int:
+    return (seq << CHUNK_BITS) | chunk_no
+
+
+@dataclass(frozen=True)
+class LibrarySelection:
+    """Library documents (by per-user sequence number) a generation request is grounded in."""
+    user_id: str
+    seqs: Tuple[int, ...]
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {"user_id": self.user_id, "seqs": list(self.seqs)}
+
+    @classmethod
+    def from_payload(cls, data: Optional[Dict[str, Any]]) -> Optional["LibrarySelection"]:
+        if not data:
+            return None
+        return cls(user_id=data["user_id"], seqs=tuple(int(s) for s in data["seqs"]))
+
+
+# ────────────────────────────────
+# On-disk index (sync; call via asyncio.to_thread)
+# ────────────────────────────────
+class UserLibraryIndex:
+    def __init__(self, root: str, user_id: str):
+        self.directory = os.path.join(root, user_id)
+        self.index_path = os.path.join(self.directory, "index.faiss")
+        self._lock = threading.Lock()        # brief swaps of the reader / parsed-text cache only
+        self._write_lock = threading.Lock()  # serializes writers in this process (flock covers other processes)
+        self._reader: Optional[faiss.Index] = None
+        self._reader_version: Tuple[int, int] = (0, 0)
+        self._texts: "OrderedDict[int, Tuple[List[str], np.ndarray, Optional[np.ndarray]]]" = OrderedDict()
+        os.makedirs(os.path.join(self.directory, "docs"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "files"), exist_ok=True)
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        with self._write_lock, open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _doc_path(self, seq: int) -> str:
+        return os.path.join(self.directory, "docs", f"{seq}.npz")
+
+    def _load_writable(self, dim: int) -> faiss.Index:
+        if os.path.exists(self.index_path):
+            return faiss.read_index(self.index_path)
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def _needs_rebuild(self, index: faiss.Index, n: int) -> Optional[Tuple[str, str]]:
+        """(index type, quantization) to rebuild as once the library holds `n` chunks, or None to add in place."""
+        kind = choose_kind(n, removable=True)
+        quantization = effective_quantization(settings.library_quantization, n)
+        if kind != index_kind(index) or quantization != index_quantization(index):
+            return kind, quantization
+        if kind == "ivf" and base_index(index).nlist * 2 <= ivf_nlist(n):
+            return kind, quantization
+        if quantization != "none" and n.bit_length() > index.ntotal.bit_length():
+            return kind, quantization  # retrain codebooks each time the library crosses a power of two
+        return None
+
+    def _doc_vectors(self, seq: int, index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+        with np.load(self._doc_path(seq), allow_pickle=False) as data:
+            if "vectors" in data.files:
+                return data["vectors"].astype(np.float32)
+        # documents ingested before vectors were stored alongside the text
+        return np.vstack([index.reconstruct(int(i)) for i in ids])
+
+    def _live_vectors(self, index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.sort(faiss.vector_to_array(index.id_map).astype(np.int64))
+        parts = []
+        for seq in np.unique(ids >> CHUNK_BITS).tolist():
+            doc_ids = ids[(ids >> CHUNK_BITS) == seq]
+            parts.append(self._doc_vectors(seq, index, doc_ids)[doc_ids & ((1 << CHUNK_BITS) - 1)])
+        dim = index.d
+        return ids, (np.vstack(parts) if parts else np.zeros((0, dim), dtype=np.float32))
+
+    def all_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, float32 vectors) of every live chunk in the library."""
+        if not os.path.exists(self.index_path):
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+        return self._live_vectors(faiss.read_index(self.index_path))
+
+    def _save(self, index: faiss.Index) -> None:
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, self.index_path)  # mmap'd readers keep the old inode until they reload
+
+    def store_file(self, seq: int, src: str) -> str:
+        dest = os.path.join(self.directory, "files", f"{seq}{os.path.splitext(src)[1].lower()}")
+        shutil.move(src, dest)
+        return dest
+
+    def add(self, seq: int, doc: DocumentEmbedding) -> None:
+        """
+        Append one document's chunk vectors; existing vectors are untouched unless
+        the library crossed an index-type threshold, in which case the index is
+        rebuilt from the stored vectors (nothing is re-embedded).
+        """
+        tmp = f"{self._doc_path(seq)}.tmp.npz"
+        np.savez(tmp, text=np.array(doc.text), spans=doc.spans.astype(np.int32), vectors=doc.vectors.astype(np.float16))
+        os.replace(tmp, self._doc_path(seq))
+        ids = np.array([chunk_id(seq, i) for i in range(len(doc.spans))], dtype=np.int64)
+        with self._writing():
+            index = self._load_writable(doc.vectors.shape[1])
+            if index.d != doc.vectors.shape[1]:
+                raise LibraryError(f"Embedding dimension {doc.vectors.shape[1]} does not match library index ({index.d}).")
+            vectors = np.ascontiguousarray(doc.vectors, dtype=np.float32)
+            rebuild = self._needs_rebuild(index, index.ntotal + len(ids))
+            if rebuild is None:
+                index.add_with_ids(vectors, ids)
+            else:
+                kind, quantization = rebuild
+                old_ids, old_vectors = self._live_vectors(index)
+                index = build_ann_index(
+                    np.vstack([old_vectors, vectors]), np.concatenate([old_ids, ids]),
+                    kind=kind, quantization=quantization,
+                )
+                logger.info(f"🧭 Library {os.path.basename(self.directory)} index rebuilt as {kind}/{quantization} ({index.ntotal} chunks).")
+            self._save(index)
+
+    def remove(self, seq: int) -> int:
+        """Drop one document's id range from the index. Returns the number of vectors removed."""
+        removed = 0
+        with self._writing():
+            if os.path.exists(self.index_path):
+                index = faiss.read_index(self.index_path)
+                removed = index.remove_ids(faiss.IDSelectorRange(chunk_id(seq, 0), chunk_id(seq + 1, 0)))
+                self._save(index)
+        for path in [self._doc_path(seq), *self._files(seq)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._texts.pop(seq, None)
+        return removed
+
+    def _files(self, seq: int) -> List[str]:
+        folder = os.path.join(self.directory, "files")
+        return [os.path.join(folder, f) for f in os.listdir(folder) if os.path.splitext(f)[0] == str(seq)]
+
+    def reader(self) -> Optional[faiss.Index]:
+        """Memory-mapped read-only view of the index, reloaded when the file was replaced."""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        version = (st.st_ino, st.st_mtime_ns)  # os.replace() always yields a new inode
+        with self._lock:
+            if self._reader is not None and version == self._reader_version:
+                return self._reader
+        # load outside the lock so searches on the current reader are not held up
+        try:
+            reader = faiss.read_index(self.index_path, _MMAP_FLAGS)
+        except RuntimeError:  # index type without mmap support
+            reader = faiss.read_index(self.index_path)
+        with self._lock:
+            self._reader, self._reader_version = reader, version
+            return reader
+
+    def _entry(self, seq: int) -> Optional[Tuple[List[str], np.ndarray, Optional[np.ndarray]]]:
+        """(words, chunk spans, float16 vectors or None) of one document, through a small LRU."""
+        with self._lock:
+            entry = self._texts.get(seq)
+        if entry is None:
+            try:
+                with np.load(self._doc_path(seq), allow_pickle=False) as data:
+                    vectors = data["vectors"] if "vectors" in data.files else None
+                    entry = (str(data["text"]).split(), data["spans"], vectors)
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                self._texts[seq] = entry
+                while len(self._texts) > 16:  # small LRU of parsed documents
+                    self._texts.popitem(last=False)
+        return entry
+
+    def _chunk_count(self, seq: int) -> int:
+        with self._lock:
+            entry = self._texts.get(seq)
+        if entry is not None:
+            return len(entry[1])
+        try:
+            with np.load(self._doc_path(seq), allow_pickle=False) as data:
+                return len(data["spans"])  # reads only the spans member
+        except FileNotFoundError:
+            return 0
+
+    def _chunk(self, seq: int, chunk_no: int) -> Optional[Tuple[str, Optional[np.ndarray]]]:
+        """Text of one chunk and its stored vector (None for documents saved without vectors)."""
+        entry = self._entry(seq)
+        if entry is None:
+            return None
+        words, spans, vectors = entry
+        if chunk_no >= len(spans):
+            return None
+        start, end = spans[chunk_no]
+        return " ".join(words[start:end]), (None if vectors is None else vectors[chunk_no])
+
+    def _exact_search(self, query: np.ndarray, seqs: Tuple[int, ...], top_k: int) -> Optional[List[Tuple[str, float]]]:
+        """Brute-force top_k over the selected documents' stored vectors; None if any lacks them."""
+        scored: List[Tuple[float, int, int]] = []
+        for seq in seqs:
+            entry = self._entry(seq)
+            if entry is None:
+                continue
+            if entry[2] is None:
+                return None
+            scores = entry[2].astype(np.float32) @ query[0]
+            best = np.argsort(-scores)[:top_k]
+            scored.extend((float(scores[i]), seq, int(i)) for i in best)
+        scored.sort(key=lambda s: s[0], reverse=True)
+        hits = []
+        for score, seq, chunk_no in scored:
+            chunk = self._chunk(seq, chunk_no)
+            if chunk and chunk[0]:
+                hits.append((chunk[0], score))
+            if len(hits) == top_k:
+                break
+        return hits
+
+    def search(self, query: np.ndarray, seqs: Tuple[int, ...], top_k: int) -> List[Tuple[str, float]]:
+        index = self.reader()
+        if index is None or index.ntotal == 0:
+            return []
+        quantized = index_quantization(index) != "none"
+        inner = base_index(index)
+        nprobe = None
+        if isinstance(inner, faiss.IndexIVF) and inner.nlist > 1:
+            # The id filter is applied inside the probed lists only, so a selective filter over
+            # an IVF index can miss most of the selected chunks
+            selected = sum(self._chunk_count(seq) for seq in seqs)
+            if selected <= settings.library_exact_search_max:
+                hits = self._exact_search(query, seqs, top_k)
+                if hits is not None:
+                    return hits
+            nprobe = math.ceil(settings.rag_ivf_nprobe * index.ntotal / max(1, selected))
+        # OR of one id range per selected document; keep every selector alive during search
+        keep: List[Any] = [faiss.IDSelectorRange(chunk_id(seq, 0), chunk_id(seq + 1, 0)) for seq in seqs]
+        selector = keep[0]
+        for other in keep[1:]:
+            selector = faiss.IDSelectorOr(selector, other)
+            keep.append(selector)
+        k = top_k * rescore_factor() if quantized else top_k
+        D, I = index.search(query, k, params=search_params(index, selector, nprobe=nprobe))
+        hits = []
+        for score, cid in zip(D[0], I[0]):
+            if cid == -1:
+                continue
+            chunk = self._chunk(int(cid) >> CHUNK_BITS, int(cid) & ((1 << CHUNK_BITS) - 1))
+            if not chunk or not chunk[0]:
+                continue
+            text, vector = chunk
+            if quantized and vector is not None:
+                score = float(vector.astype(np.float32) @ query[0])  # exact score instead of the code distance
+            hits.append((text, float(score)))
+        if quantized:
+            hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:top_k]
+
+
+_libraries: "OrderedDict[str, UserLibraryIndex]" = OrderedDict()
+_libraries_lock = threading.Lock()
+
+
+def get_user_library(user_id: str) -> UserLibraryIndex:
+    """Process-wide handle per user (bounded; evicted handles just drop their mmap)."""
+    with _libraries_lock:
+        lib = _libraries.get(user_id)
+        if lib is None:
+            lib = _libraries[user_id] = UserLibraryIndex(settings.library_dir, user_id)
+        _libraries.move_to_end(user_id)
+        while len(_libraries) > max(1, settings.library_open_indexes):
+            _libraries.popitem(last=False)
+        return lib
+
+
+def build_context_from_library(selection: LibrarySelection, prompt: str, top_k: int = 6) -> str:
+    """Retrieve the top chunks for `prompt` among the selected library documents."""
+    hits = get_user_library(selection.user_id).search(embed_query(prompt), selection.seqs, top_k)
+    logger.info(f"📚 Built library RAG context with {len(hits)} chunks from {len(selection.seqs)} document(s).")
+    return format_context(hits)
+
+
+# ────────────────────────────────
+# Documents (Mongo metadata + index updates)
+# ────────────────────────────────
+async def _next_seq(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    doc = await db.library_counters.find_one_and_update(
+        {"_id": user_id}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return int(doc["seq"])
+
+
+async def ingest_document(
+    db: AsyncIOMotorDatabase, user_id: str, path: str, mime: Optional[str], filename: str
+) -> Dict[str, Any]:
+    """Embed one uploaded file and add it to the user's index. Returns the metadata document."""
+    seq = await _next_seq(db, user_id)
+    lib = get_user_library(user_id)
+    now = datetime.utcnow()
+    record: Dict[str, Any] = {
+        "user_id": user_id,
+        "seq": seq,
+        "filename": filename,
+        "mime": mime,
+        "file_hash": await asyncio.to_thread(file_sha256, path),
+        "size_bytes": os.path.getsize(path),
+        "chunks": 0,
+        "status": "processing",
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    res = await db.library_documents.insert_one(record)
+    record["_id"] = res.inserted_id
+
+    fields: Dict[str, Any]
+    try:
+        stored = await asyncio.to_thread(lib.store_file, seq, path)
+        doc = await asyncio.to_thread(
+            embed_document, stored, mime, max_tokens=settings.library_chunk_tokens, overlap=settings.library_chunk_overlap
+        )
+        if doc is None:
+            fields = {"status": "failed", "error": "No text could be extracted."}
+        else:
+            await asyncio.to_thread(lib.add, seq, doc)
+            fields = {"status": "ready", "chunks": len(doc.spans)}
+    except Exception as e:
+        logger.error(f"❌ Library ingest failed for {filename}: {e}")
+        fields = {"status": "failed", "error": "Failed to process document."}
+    fields["updated_at"] = datetime.utcnow()
+    await db.library_documents.update_one({"_id": record["_id"]}, {"$set": fields})
+    record.update(fields)
+    logger.info(f"📥 Library document {filename} ({record['status']}, {record['chunks']} chunks) for user {user_id}")
+    return record
+
+
+async def list_documents(db: AsyncIOMotorDatabase, user_id: str) -> List[Dict[str, Any]]:
+    cursor = db.library_documents.find({"user_id": user_id}).sort("created_at", -1)
+    return [doc async for doc in cursor]
+
+
+async def delete_document(db: AsyncIOMotorDatabase, user_id: str, doc_id: str) -> bool:
+    try:
+        oid = ObjectId(doc_id)
+    except (InvalidId, TypeError):
+        return False
+    doc = await db.library_documents.find_one_and_delete({"_id": oid, "user_id": user_id})
+    if not doc:
+        return False
+    removed = await asyncio.to_thread(get_user_library(user_id).remove, int(doc["seq"]))
+    logger.info(f"🗑️ Library document {doc.get('filename')} removed ({removed} vectors) for user {user_id}")
+    return True
+
+
+async def select_documents(db: AsyncIOMotorDatabase, user_id: str, doc_ids: List[str]) -> LibrarySelection:
+    """Resolve library document ids for a generation request; raises LibraryError if any is unusable."""
+    try:
+        oids = [ObjectId(d) for d in dict.fromkeys(doc_ids)]
+    except (InvalidId, TypeError):
+        raise LibraryError("Invalid library document id.")
+    docs = [d async for d in db.library_documents.find({"_id": {"$in": oids}, "user_id": user_id})]
+    found = {d["_id"]: d for d in docs}
+    missing = [str(o) for o in oids if o not in found]
+    if missing:
+        raise LibraryError(f"Library documents not found: {', '.join(missing)}")
+    not_ready = [str(d["_id"]) for d in docs if d.get("status") != "ready"]
+    if not_ready:
+        raise LibraryError(f"Library documents not ready: {', '.join(not_ready)}")
+    return LibrarySelection(user_id=user_id, seqs=tuple(sorted(int(found[o]["seq"]) for o in oids)))
@@ -0,0 +1,699 @@
+# app/content/pipeline.py
+"""
+Lecture generation pipeline shared by the synchronous routes and background jobs.
+Stages: (RAG context) → structured content → {visuals ∥ Azure avatar + captions}.
+"""
+
+from __future__ import annotations
+import os
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.auth.models import GeneratedContent, LectureOutput, UserPublic
+from app.content.generator import (
+    generate_content_async,
+    generate_content_with_context_async,
+    generate_content_outlined_async,
+    is_fallback,
+    stream_content_async,
+)
+from app.content.rag_processor import build_context_from_files
+from app.content.library import LibrarySelection, build_context_from_library
+from app.media.visuals import (
+    PER_LECTURE_CONCURRENCY,
+    generate_visuals_for_content_async,
+    start_visual_render,
+    visual_prompt_key,
+)
+from app.media.avatar_azure import (
+    submit_or_reattach_async,
+    poll_job_and_get_result_async,
+    _get_async_client as _get_azure_client,
+    _authenticate,  # reuse Azure auth header
+)
+from app.media.avatar_segments import synthesize_segmented
+from app.media.mirror import is_remote, mirror_lecture_assets
+from app.media.avatar_cache import avatar_cache_key, lookup_avatar, store_avatar, cached_result
+from app.database.connection import get_db
+from app.utils.storage import ensure_dirs, save_file, get_file_url, get_local_url
+from app.utils.stages import Stage, StageError, StagePipeline
+from app.content.checkpoints import PipelineCheckpoint
+from app.utils.tasks import spawn, uses_durable_queue
+from app.utils.singleflight import SingleFlightFailed, flight_key, run_single_flight
+from app.content.prompt_cache import normalize_prompt
+
+logger = logging.getLogger("uvicorn")
+
+ProgressCallback = Callable[[str, int], Awaitable[None]]
+EventCallback = Callable[[str, Dict[str, Any]], None]  # (event name, JSON-serializable payload)
+
+MAX_CHUNK_WORDS = 250
+
+
+class LecturePipelineError(Exception):
+    """Raised when a pipeline stage fails; `detail` is safe to return to clients."""
+
+    def __init__(self, stage: str, detail: str):
+        super().__init__(detail)
+        self.stage = stage
+        self.detail = detail
+
+
+async def _noop_progress(stage: str, progress: int) -> None:
+    return None
+
+
+def _noop_event(event: str, data: Dict[str, Any]) -> None:
+    return None
+
+
+async def _get_db_or_none() -> Optional[AsyncIOMotorDatabase]:
+    """Caches are best-effort: a missing DB must never fail generation."""
+    try:
+        return await get_db()
+    except Exception as e:
+        logger.warning(f"⚠️ Database unavailable for pipeline caches: {e}")
+        return None
+
+
+# ────────────────────────────────
+# Helpers
+# ────────────────────────────────
+NARRATION_SECTIONS = ("introduction", "main_body", "conclusion")
+
+
+def _chunk_sections(sections: List[Optional[str]], max_chunk_words: int = MAX_CHUNK_WORDS) -> List[str]:
+    full_text = "\n\n".join(filter(None, sections)).strip()
+    words = full_text.split()
+    return [" ".join(words[i:i + max_chunk_words]) for i in range(0, len(words), max_chunk_words)]
+
+
+def split_narration(content: GeneratedContent, max_chunk_words: int = MAX_CHUNK_WORDS) -> List[str]:
+    """Join the lecture sections and split the narration into word-bounded chunks."""
+    return _chunk_sections([getattr(content, name) for name in NARRATION_SECTIONS], max_chunk_words)
+
+
+async def cache_captions_locally(job_id: str, captions_url_remote: Optional[str]) -> Optional[str]:
+    """
+    Materialize Azure captions under static/captions so the frontend
+    can fetch them without Azure auth. Returns the public URL or None.
+    """
+    if not captions_url_remote:
+        return None
+    try:
+        resp = await _get_azure_client().get(captions_url_remote, headers=_authenticate(), timeout=30)
+        if resp.is_success and resp.text.strip():
+            ensure_dirs()
+            local_rel = f"static/captions/{job_id}.vtt"
+            os.makedirs(os.path.dirname(local_rel), exist_ok=True)
+            await asyncio.to_thread(save_file, local_rel, resp.content)
+            return get_file_url(local_rel)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not cache captions locally: {e}")
+    return None
+
+
+async def _synthesize_avatar(
+    chunks: List[str],
+    on_event: EventCallback = _noop_event,
+    checkpoint: Optional[PipelineCheckpoint] = None,
+) -> Tuple[str, Optional[str]]:
+    avatar_character, style = "Max", "business"
+    db = await _get_db_or_none()
+
+    if settings.avatar_parallel_segments and len(chunks) > 1:
+        return await synthesize_segmented(
+            db, chunks, avatar_character=avatar_character, style=style, on_event=on_event, ledger=checkpoint
+        )
+
+    key = avatar_cache_key(chunks, avatar_character, style)
+    hit = await lookup_avatar(db, key)
+    if hit:
+        job_id, result_url, captions_url_remote = cached_result(hit)
+        on_event("avatar_ready", {"job_id": job_id, "video_url": result_url, "cached": True})
+        local_rel = f"static/captions/{job_id}.vtt"
+        if os.path.exists(local_rel):
+            captions_url = get_file_url(local_rel)
+        else:
+            captions_url = await cache_captions_locally(job_id, captions_url_remote)
+        on_event("captions", {"job_id": job_id, "captions_url": captions_url})
+        return result_url, captions_url
+
+    job_id = await submit_or_reattach_async(key, chunks, avatar_character, style, ledger=checkpoint)
+    on_event("avatar_submitted", {"job_id": job_id, "chunks": len(chunks)})
+
+    def _on_status(status: str, elapsed: float) -> None:
+        on_event("avatar_status", {"job_id": job_id, "status": status, "elapsed_s": round(elapsed, 1)})
+
+    result_url, captions_url_remote = await poll_job_and_get_result_async(job_id, on_status=_on_status)
+    logger.info(f"✅ Azure Avatar job completed. Returning video URL: {result_url}")
+    on_event("avatar_ready", {"job_id": job_id, "video_url": result_url, "cached": False})
+    await store_avatar(db, key, job_id, result_url, captions_url_remote)
+    captions_url = await cache_captions_locally(job_id, captions_url_remote)
+    on_event("captions", {"job_id": job_id, "captions_url": captions_url})
+    return result_url, captions_url
+
+
+class EarlyStarts:
+    """
+    Downstream work started while the content is still streaming from Gemini.
+
+    Each visualization starts rendering as soon as its JSON object closes, and the
+    avatar job is submitted once all narration sections are complete. The visuals
+    and avatar stages claim these tasks when they match the final content and
+    otherwise fall back to their normal path.
+    """
+
+    def __init__(self, on_event: EventCallback = _noop_event, checkpoint: Optional[PipelineCheckpoint] = None) -> None:
+        self.on_event = on_event
+        self.checkpoint = checkpoint
+        self.sections: Dict[str, str] = {}
+        self.visuals: Dict[str, "asyncio.Task[str]"] = {}
+        self.avatar: Optional["asyncio.Task[Tuple[str, Optional[str]]]"] = None
+        self.avatar_chunks: Optional[List[str]] = None
+        self.lecture_slots = asyncio.Semaphore(PER_LECTURE_CONCURRENCY)
+
+    def on_section(self, name: str, text: str) -> None:
+        self.sections[name] = text
+        if self.avatar is None and all(k in self.sections for k in NARRATION_SECTIONS):
+            chunks = _chunk_sections([self.sections[k] for k in NARRATION_SECTIONS])
+            if chunks:
+                logger.info("🧠 Narration complete in stream — submitting avatar early.")
+                self.avatar_chunks = chunks
+                self.avatar = asyncio.create_task(
+                    _synthesize_avatar(chunks, self.on_event, self.checkpoint), name="avatar-early"
+                )
+
+    def on_visual(self, index: int, visualization: Dict[str, Any]) -> None:
+        key = visual_prompt_key(visualization)
+        if key and key not in self.visuals:
+            self.visuals[key] = start_visual_render(index + 1, visualization, self.lecture_slots)
+
+    def take_visuals(self) -> Dict[str, "asyncio.Task[str]"]:
+        taken, self.visuals = self.visuals, {}
+        return taken
+
+    def take_avatar(self, chunks: List[str]) -> Optional["asyncio.Task[Tuple[str, Optional[str]]]"]:
+        task, self.avatar = self.avatar, None
+        if task is not None and self.avatar_chunks != chunks:
+            task.cancel()  # final narration differs from what was streamed
+            return None
+        return task
+
+    def cancel(self) -> None:
+        for task in [*self.visuals.values(), self.avatar]:
+            if task is not None and not task.done():
+                task.cancel()
+        self.visuals, self.avatar = {}, None
+
+
+# ────────────────────────────────
+# Pipeline
+# ────────────────────────────────
+# Client-facing error details per stage: (prompt mode, RAG mode)
+_STAGE_ERRORS: Dict[str, Tuple[str, str]] = {
+    "context": ("Failed to process documents.", "Failed to process documents."),
+    "content": ("Failed to generate structured content.", "Failed to generate content from docs."),
+    "visuals": ("Failed to generate visuals for lecture.", "Failed to generate visuals."),
+    "avatar": ("Avatar synthesis failed. Please retry.", "Avatar synthesis failed."),
+}
+
+
+def build_lecture_stages(
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    early: Optional[EarlyStarts] = None,
+    on_event: Optional[EventCallback] = None,
+    parallel_sections: bool = False,
+    checkpoint: Optional[PipelineCheckpoint] = None,
+    stage_slots: Optional[Dict[str, asyncio.Semaphore]] = None,
+    library: Optional[LibrarySelection] = None,
+) -> StagePipeline:
+    """
+    Declare the lecture stage graph:
+
+        [context] → content → visuals ┐
+                            → avatar  ┴→ (assembled by the caller)
+
+    Visuals (BFL) and avatar synthesis (Azure) only need the text, so they run concurrently.
+    With `early`, content is streamed and both may already be underway when their stage starts.
+    `on_event` receives intermediate results (content text, saved visuals, avatar status).
+    `parallel_sections` writes the content from an outline in concurrent section calls.
+    `checkpoint` records Azure job ids so a resumed run reattaches to them.
+    `stage_slots` maps stage names to semaphores shared with other pipelines (batch caps).
+    `library` grounds the content in the user's library documents (with or without `files`).
+    """
+    rag = bool(files) or library is not None
+    emit = on_event or _noop_event
+    slots = stage_slots or {}
+
+    def _visual_saved(index: int, image_path: str) -> None:
+        emit("visual", {"index": index, "image_path": image_path, "url": get_local_url(image_path)})
+
+    async def _context(results: Dict[str, Any]) -> str:
+        parts = []
+        if files:
+            parts.append(await asyncio.to_thread(build_context_from_files, files, prompt, 6))
+        if library is not None:
+            parts.append(await asyncio.to_thread(build_context_from_library, library, prompt, 6))
+        return "\n\n".join(p for p in parts if p)
+
+    async def _content(results: Dict[str, Any]) -> GeneratedContent:
+        if parallel_sections:
+            content_data = await generate_content_outlined_async(
+                prompt,
+                context=results["context"] if rag else None,
+                use_cache=use_cache,
+                on_section=early.on_section if early is not None else None,
+                on_visual=early.on_visual if early is not None else None,
+            )
+        elif early is not None:
+            content_data = await stream_content_async(
+                prompt,
+                context=results["context"] if rag else None,
+                use_cache=use_cache,
+                on_section=early.on_section,
+                on_visual=early.on_visual,
+            )
+        elif rag:
+            content_data = await generate_content_with_context_async(prompt, results["context"])
+        else:
+            content_data = await generate_content_async(prompt, use_cache)
+        content = GeneratedContent(**content_data)
+        if is_fallback(content_data) and checkpoint is not None:
+            # keep this run resumable only up to here, so a retry asks Gemini again
+            checkpoint.freeze()
+            logger.warning("⚠️ Fallback content — not checkpointing this run's remaining stages.")
+        logger.info(f"✅ Content generation successful for topic: {content.topic}")
+        emit("content", content.model_dump())
+        return content
+
+    async def _visuals(results: Dict[str, Any]) -> GeneratedContent:
+        if early is not None:
+            content_with_visuals = await generate_visuals_for_content_async(
+                results["content"].model_dump(),
+                started=early.take_visuals(),
+                lecture_slots=early.lecture_slots,
+                on_saved=_visual_saved,
+            )
+        else:
+            content_with_visuals = await generate_visuals_for_content_async(
+                results["content"].model_dump(), on_saved=_visual_saved
+            )
+        logger.info("🖼️ Visual generation complete.")
+        return GeneratedContent(**content_with_visuals)
+
+    async def _avatar(results: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        chunks = split_narration(results["content"])
+        started = early.take_avatar(chunks) if early is not None else None
+        if started is not None:
+            return await started
+        logger.info("🧠 Submitting text to Azure Avatar for synthesis...")
+        return await _synthesize_avatar(chunks, emit, checkpoint)
+
+    content_deps: Tuple[str, ...] = ("context",) if rag else ()
+    stages = [
+        Stage("content", _content, deps=content_deps, slots=slots.get("content"),
+              timeout=settings.pipeline_content_timeout_s, retries=settings.pipeline_content_retries),
+        Stage("visuals", _visuals, deps=("content",), slots=slots.get("visuals"),
+              timeout=settings.pipeline_visuals_timeout_s, retries=settings.pipeline_visuals_retries),
+        Stage("avatar", _avatar, deps=("content",), slots=slots.get("avatar"),
+              timeout=settings.pipeline_avatar_timeout_s, retries=settings.pipeline_avatar_retries),
+    ]
+    if rag:
+        stages.insert(0, Stage("context", _context, slots=slots.get("context"),
+                               timeout=settings.pipeline_context_timeout_s))
+    return StagePipeline(stages)
+
+
+def assemble_lecture(results: Dict[str, Any]) -> LectureOutput:
+    """Merge stage results into the final response (frontend handles compilation)."""
+    content: GeneratedContent = results["visuals"]
+    result_url, captions_url = results["avatar"]
+    return LectureOutput(
+        topic=content.topic,
+        introduction=content.introduction,
+        main_body=content.main_body,
+        conclusion=content.conclusion,
+        visualizations=content.visualizations,
+        video_path=result_url,  # direct Azure URL
+        captions_url=captions_url,
+    )
+
+
+async def run_lecture_pipeline(
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    use_cache: bool = True,
+    on_event: Optional[EventCallback] = None,
+    parallel_sections: bool = False,
+    checkpoint: Optional[PipelineCheckpoint] = None,
+    stage_slots: Optional[Dict[str, asyncio.Semaphore]] = None,
+    library: Optional[LibrarySelection] = None,
+) -> LectureOutput:
+    """
+    Run the full lecture pipeline and return the assembled LectureOutput.
+    When `files` and/or `library` are given the content is grounded in the documents (RAG).
+    `use_cache=False` bypasses the prompt content cache.
+    `on_event` receives intermediate results as they become available.
+    `parallel_sections` opts into outline-then-parallel-sections content generation.
+    With `checkpoint`, stages it already holds are skipped and new results are saved to it.
+    `stage_slots` caps stages across concurrent pipelines; early starts are disabled
+    then, since they would render visuals/avatars outside those caps.
+    Raises LecturePipelineError on stage failure.
+    """
+    progress = on_progress or _noop_progress
+    rag = bool(files) or library is not None
+    completed = checkpoint.completed() if checkpoint is not None else {}
+    early = None
+    if settings.content_streaming_enabled and "content" not in completed and not stage_slots:
+        early = EarlyStarts(on_event or _noop_event, checkpoint)
+    pipeline = build_lecture_stages(
+        prompt,
+        files=files,
+        use_cache=use_cache,
+        early=early,
+        on_event=on_event,
+        parallel_sections=parallel_sections,
+        checkpoint=checkpoint,
+        stage_slots=stage_slots,
+        library=library,
+    )
+    total = len(pipeline.stages)
+    finished: List[str] = [name for name in completed if name in pipeline.stages]
+
+    async def _on_start(stage: str) -> None:
+        await progress(stage, 5 + int(90 * len(finished) / total))
+
+    async def _on_done(stage: str) -> None:
+        finished.append(stage)
+
+    async def _on_result(stage: str, value: Any) -> None:
+        if checkpoint is not None:
+            await checkpoint.save_stage(stage, value)
+
+    try:
+        results = await pipeline.run(completed, on_start=_on_start, on_done=_on_done, on_result=_on_result)
+    except StageError as e:
+        logger.error(f"❌ Lecture stage '{e.stage}' failed: {e.cause}")
+        prompt_detail, rag_detail = _STAGE_ERRORS.get(e.stage, ("Lecture generation failed.",) * 2)
+        raise LecturePipelineError(e.stage, rag_detail if rag else prompt_detail)
+    finally:
+        if early is not None:
+            early.cancel()
+
+    await progress("finalizing", 95)
+    return assemble_lecture(results)
+
+
+# ────────────────────────────────
+# History persistence
+# ────────────────────────────────
+async def persist_lecture(
+    db: AsyncIOMotorDatabase,
+    current_user: UserPublic,
+    lecture_output: LectureOutput,
+    *,
+    rag_used: bool,
+    source_files: Optional[List[str]] = None,
+) -> Optional[str]:
+    """Best-effort insert of a lecture document for history view. Returns the lecture id."""
+    if db is None:
+        return None
+
+    try:
+        user = await db.users.find_one({"username": current_user.username})
+        if not user:
+            return None
+
+        user_id = str(user.get("_id"))
+        now = datetime.utcnow()
+
+        record = {
+            "user_id": user_id,
+            "topic": lecture_output.topic,
+            "introduction": lecture_output.introduction,
+            "main_body": lecture_output.main_body,
+            "conclusion": lecture_output.conclusion,
+            "visuals": [
+                v.image_path
+                for v in (lecture_output.visualizations or [])
+                if v and getattr(v, "image_path", None)
+            ],
+            "avatar_video_url": lecture_output.video_path,
+            "rag_used": bool(rag_used),
+            "source_files": source_files or [],
+            "status": "ready",
+            "created_at": now,
+            "updated_at": now,
+            "meta": {
+                "lecture_output": lecture_output.model_dump(),
+                "captions_url": lecture_output.captions_url,
+                "source": "rag" if rag_used else "prompt",
+            },
+        }
+
+        inserted = await db.lectures.insert_one(record)
+        return str(inserted.inserted_id)
+    except Exception as e:  # history is non-critical
+        logger.error(f"❌ Failed to persist lecture history: {e}")
+        return None
+
+
+def schedule_mirroring(db: Optional[AsyncIOMotorDatabase], lecture_id: Optional[str], lecture_output: LectureOutput) -> None:
+    """Copy the Azure video/captions into our storage in the background and repoint the lecture record."""
+    if db is None or not lecture_id or not settings.mirror_enabled:
+        return
+    if not (is_remote(lecture_output.video_path) or is_remote(lecture_output.captions_url)):
+        return
+    spawn(
+        mirror_lecture_assets(db, lecture_id, lecture_output.video_path, lecture_output.captions_url),
+        name=f"mirror-{lecture_id}",
+    )
+
+
+# ────────────────────────────────
+# Coalesced generation (single-flight across workers)
+# ────────────────────────────────
+def lecture_flight_key(
+    username: str,
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    library: Optional[LibrarySelection] = None,
+) -> str:
+    """Identity of a generation request: user, normalized prompt, mode (+ document contents)."""
+    mode = "rag" if files or library is not None else "prompt"
+    docs = []
+    for path, _mime in files or []:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        docs.append(h.hexdigest())
+    if library is not None:  # library seqs are never reused, so they identify the content
+        docs.extend(f"library:{library.user_id}:{seq}" for seq in library.seqs)
+    return flight_key(username, normalize_prompt(prompt), mode, use_cache, parallel_sections, *sorted(docs))
+
+
+async def generate_lecture_once(
+    db: Optional[AsyncIOMotorDatabase],
+    current_user: UserPublic,
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    use_cache: bool = True,
+    on_event: Optional[EventCallback] = None,
+    parallel_sections: bool = False,
+    stage_slots: Optional[Dict[str, asyncio.Semaphore]] = None,
+    library: Optional[LibrarySelection] = None,
+) -> LectureOutput:
+    """
+    Run the pipeline and persist the lecture, sharing one execution between
+    identical in-flight requests (double-clicks, frontend retries) across all workers.
+    Intermediate events are only delivered to the caller that leads the execution.
+    Raises LecturePipelineError on failure (also for coalesced followers).
+    """
+    key = await asyncio.to_thread(
+        lecture_flight_key, current_user.username, prompt,
+        files=files, use_cache=use_cache, parallel_sections=parallel_sections, library=library,
+    )
+
+    async def _work() -> Dict[str, Any]:
+        # Same request identity → same run: a retry resumes from the first incomplete stage
+        checkpoint = await PipelineCheckpoint.open(db, key)
+        lecture_output = await run_lecture_pipeline(
+            prompt,
+            files=files,
+            on_progress=on_progress,
+            use_cache=use_cache,
+            on_event=on_event,
+            parallel_sections=parallel_sections,
+            checkpoint=checkpoint,
+            stage_slots=stage_slots,
+            library=library,
+        )
+        lecture_id = await persist_lecture(
+            db=db,
+            current_user=current_user,
+            lecture_output=lecture_output,
+            rag_used=bool(files) or library is not None,
+            source_files=[path for (path, _mime) in (files or [])],
+        )
+        schedule_mirroring(db, lecture_id, lecture_output)
+        if checkpoint is not None:
+            await checkpoint.discard()
+        return lecture_output.model_dump()
+
+    try:
+        data = await run_single_flight(
+            db, key, _work, error_message=lambda e: getattr(e, "detail", "Lecture generation failed.")
+        )
+    except SingleFlightFailed as e:
+        raise LecturePipelineError("coalesced", str(e))
+    return LectureOutput(**data)
+
+
+# ────────────────────────────────
+# Background job runner
+# ────────────────────────────────
+async def run_lecture_job(
+    db: AsyncIOMotorDatabase,
+    job_id: str,
+    current_user: UserPublic,
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    library: Optional[LibrarySelection] = None,
+) -> None:
+    """
+    Execute the pipeline for a queued job, recording stage/progress
+    and the final LectureOutput in the `jobs` collection.
+    """
+    from app.utils.jobs import (  # lazy import to avoid cycles
+        mark_job_running,
+        mark_job_progress,
+        mark_job_succeeded,
+        mark_job_failed,
+    )
+
+    async def _progress(stage: str, progress: int) -> None:
+        await mark_job_progress(db, job_id, stage, progress)
+
+    await mark_job_running(db, job_id)
+    try:
+        lecture_output = await generate_lecture_once(
+            db, current_user, prompt,
+            files=files, on_progress=_progress, use_cache=use_cache, parallel_sections=parallel_sections,
+            library=library,
+        )
+    except LecturePipelineError as e:
+        await mark_job_failed(db, job_id, e.detail, stage=e.stage)
+        return
+    except Exception as e:
+        logger.error(f"❌ Lecture job {job_id} crashed: {e}")
+        await mark_job_failed(db, job_id, "Lecture generation failed.")
+        return
+
+    await mark_job_succeeded(db, job_id, {"lecture": lecture_output.model_dump()})
+    logger.info(f"✅ Lecture job {job_id} finished.")
+
+
+# ────────────────────────────────
+# Submission (in-process task or durable queue)
+# ────────────────────────────────
+async def submit_lecture_job(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    current_user: UserPublic,
+    prompt: str,
+    *,
+    files: Optional[List[Tuple[str, Optional[str]]]] = None,
+    use_cache: bool = True,
+    parallel_sections: bool = False,
+    priority: int = 0,
+    callback_url: Optional[str] = None,
+    library: Optional[LibrarySelection] = None,
+) -> str:
+    """
+    Create a generation job and start it: on the durable Mongo queue when
+    TASKS_DRIVER=mongo (run by `python -m app.worker`), otherwise as a task in this process.
+    Uploaded files must be on storage shared with the workers in queue mode.
+    `callback_url` receives the completion webhook instead of the account endpoint.
+    """
+    from app.utils.jobs import create_job  # lazy import to avoid cycles
+
+    payload: Dict[str, Any] = {
+        "prompt": prompt,
+        "mode": "rag" if files or library is not None else "prompt",
+        "use_cache": use_cache,
+        "parallel_sections": parallel_sections,
+        "callback_url": callback_url,
+    }
+    if files:
+        payload["source_files"] = [path for (path, _mime) in files]
+        payload["files"] = [[path, mime] for (path, mime) in files]
+    if library is not None:
+        payload["library"] = library.to_payload()
+
+    queued = uses_durable_queue()
+    job_id = await create_job(
+        db, user_id, "generation", payload,
+        queued=queued, priority=priority, max_attempts=settings.queue_max_attempts if queued else 1,
+    )
+    if not queued:
+        spawn(
+            run_lecture_job(
+                db, job_id, current_user, prompt,
+                files=files, use_cache=use_cache, parallel_sections=parallel_sections, library=library,
+            ),
+            name=f"lecture-job-{job_id}",
+        )
+    return job_id
+
+
+async def lecture_job_handler(db: AsyncIOMotorDatabase, job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queue handler for "generation" jobs (see app.worker). Raising hands the
+    failure to the queue, which retries with backoff until max_attempts.
+    """
+    from bson import ObjectId
+    from app.auth.routes import _map_user_to_public  # lazy import to avoid cycles
+    from app.utils.jobs import mark_job_progress
+
+    job_id = str(job["_id"])
+    payload = job.get("payload") or {}
+    user = await db.users.find_one({"_id": ObjectId(job["user_id"])})
+    if not user:
+        raise LecturePipelineError("queued", "User not found.")
+
+    async def _progress(stage: str, progress: int) -> None:
+        await mark_job_progress(db, job_id, stage, progress)
+
+    files = [(path, mime) for path, mime in payload.get("files") or []] or None
+    lecture_output = await generate_lecture_once(
+        db,
+        _map_user_to_public(user),
+        payload["prompt"],
+        files=files,
+        on_progress=_progress,
+        use_cache=payload.get("use_cache", True),
+        parallel_sections=payload.get("parallel_sections", False),
+        library=LibrarySelection.from_payload(payload.get("library")),
+    )
+    return {"lecture": lecture_output.model_dump()}
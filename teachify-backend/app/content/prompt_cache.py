@@ -0,0 +1,176 @@
+# app/content/prompt_cache.py
+"""
+Semantic cache for structured lecture content produced by Gemini.
+
+Lookup order:
+1. Exact match on the normalized prompt.
+2. Nearest neighbour among stored prompt embeddings (FAISS inner product over
+   normalized MiniLM vectors from rag_processor) above a similarity threshold.
+
+Entries are scoped by generation mode ("single" call vs "outlined" parallel
+sections), so one mode never serves the other's lectures. Entries expire after
+a TTL and the cache is LRU-bounded. Counters track hit
+rate and the Gemini latency saved by hits. The cache lives in-process.
+"""
+
+from __future__ import annotations
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join((prompt or "").lower().split())
+
+
+_Key = Tuple[str, str]  # (mode, normalized prompt)
+
+
+@dataclass
+class _Entry:
+    id: int
+    mode: str
+    prompt: str
+    content: Dict[str, Any]
+    created_at: float
+    latency_s: float  # how long the original generation took
+
+
+class PromptCache:
+    def __init__(self, max_entries: int, ttl_s: float, similarity: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self._entries: "OrderedDict[_Key, _Entry]" = OrderedDict()  # (mode, normalized prompt) → entry (LRU order)
+        self._by_id: Dict[int, _Key] = {}
+        self._indexes: Dict[str, faiss.IndexIDMap2] = {}  # one prompt-embedding index per mode
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "latency_saved_s": 0.0,
+        }
+
+    # ────────────────────────────────
+    # Internals
+    # ────────────────────────────────
+    @staticmethod
+    def _embed(text: str) -> np.ndarray:
+        from app.content.rag_processor import _get_embedder  # lazy: heavy model import
+        return _get_embedder().encode([text], convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+
+    def _drop(self, key: _Key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._by_id.pop(entry.id, None)
+        index = self._indexes.get(entry.mode)
+        if index is not None:
+            index.remove_ids(np.array([entry.id], dtype=np.int64))
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.time() - entry.created_at > self.ttl_s
+
+    def _hit(self, key: _Key, entry: _Entry, kind: str) -> Dict[str, Any]:
+        self._entries.move_to_end(key)
+        self.stats[kind] += 1
+        self.stats["latency_saved_s"] += entry.latency_s
+        return copy.deepcopy(entry.content)
+
+    # ────────────────────────────────
+    # Public API
+    # ────────────────────────────────
+    def get(self, prompt: str, mode: str = "single") -> Optional[Dict[str, Any]]:
+        norm = normalize_prompt(prompt)
+        key = (mode, norm)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry):
+                logger.info("♻️ Prompt cache exact hit.")
+                return self._hit(key, entry, "exact_hits")
+            if entry:
+                self._drop(key)
+            index = self._indexes.get(mode)
+            has_vectors = index is not None and index.ntotal > 0
+
+        if has_vectors:
+            vec = self._embed(norm)  # outside the lock: encoding is the slow part
+            with self._lock:
+                index = self._indexes.get(mode)
+                if index is not None and index.ntotal > 0:
+                    D, I = index.search(vec, 1)
+                    score, eid = float(D[0][0]), int(I[0][0])
+                    match = self._by_id.get(eid)
+                    if match and score >= self.similarity:
+                        entry = self._entries[match]
+                        if not self._expired(entry):
+                            logger.info(f"♻️ Prompt cache semantic hit (sim={score:.3f}).")
+                            return self._hit(match, entry, "semantic_hits")
+                        self._drop(match)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, prompt: str, content: Dict[str, Any], latency_s: float, mode: str = "single") -> None:
+        norm = normalize_prompt(prompt)
+        key = (mode, norm)
+        vec = self._embed(norm)
+        with self._lock:
+            self._drop(key)
+            index = self._indexes.get(mode)
+            if index is None:
+                index = self._indexes[mode] = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+            eid = self._next_id
+            self._next_id += 1
+            index.add_with_ids(vec, np.array([eid], dtype=np.int64))
+            self._entries[key] = _Entry(eid, mode, norm, copy.deepcopy(content), time.time(), latency_s)
+            self._by_id[eid] = key
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "latency_saved_s": round(self.stats["latency_saved_s"], 3),
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ────────────────────────────────
+# Process-wide instance
+# ────────────────────────────────
+_prompt_cache: Optional[PromptCache] = None
+
+
+def get_prompt_cache() -> Optional[PromptCache]:
+    """Return the shared cache, or None when disabled."""
+    global _prompt_cache
+    if not settings.prompt_cache_enabled:
+        return None
+    if _prompt_cache is None:
+        _prompt_cache = PromptCache(
+            max_entries=settings.prompt_cache_max_entries,
+            ttl_s=settings.prompt_cache_ttl_s,
+            similarity=settings.prompt_cache_similarity,
+        )
+    return _prompt_cache
@@ -3,6 +3,13 @@
 RAG pipeline: ingest files, extract text, chunk, embed (SentenceTransformers),
 build FAISS index, and retrieve the most relevant context for a prompt.
 Production-safe: no external paid APIs; supports PDF/DOCX/TXT.
+
+Per-document text, chunk spans and vectors are cached on disk by content hash
+(see embedding_cache.py), so repeat uploads skip extraction and encoding.
+Extraction runs in a process pool and streams pages back (see extraction.py);
+chunks are embedded in batches while later pages are still being parsed.
+The index type (exact flat / HNSW / IVF) is picked from the chunk count
+(see ann_index.py).
 """
 
 import os
@@ -10,18 +17,28 @@ import io
 import re
 import faiss
 import logging
-from typing import List, Tuple, Dict, Optional
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
-from PyPDF2 import PdfReader
-from docx import Document
+
+from app.content.ann_index import build_ann_index, search_params
+from app.content.embedding_cache import (
+    DocumentEmbedding,
+    document_cache_key,
+    file_sha256,
+    get_embedding_cache,
+    get_query_cache,
+)
+from app.content.extraction import PageStream
 
 logger = logging.getLogger("uvicorn")
 
 # One-time global model load (fast + cached in process)
 _EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"  # 384-dim, lightweight & strong
 _embedder: Optional[SentenceTransformer] = None
+_EMBED_BATCH = 64  # chunks encoded per call while pages are still streaming in
 
 def _get_embedder() -> SentenceTransformer:
     global _embedder
@@ -31,48 +48,6 @@ def _get_embedder() -> SentenceTransformer:
     return _embedder
 
 
-# ────────────────────────────────
-# File text extraction
-# ────────────────────────────────
-def _extract_text_from_pdf(path: str) -> str:
-    try:
-        with open(path, "rb") as f:
-            reader = PdfReader(f)
-            texts = []
-            for page in reader.pages:
-                txt = page.extract_text() or ""
-                texts.append(txt)
-        return "\n".join(texts)
-    except Exception as e:
-        logger.error(f"PDF extract failed for {path}: {e}")
-        return ""
-
-def _extract_text_from_docx(path: str) -> str:
-    try:
-        doc = Document(path)
-        return "\n".join(p.text for p in doc.paragraphs if p.text)
-    except Exception as e:
-        logger.error(f"DOCX extract failed for {path}: {e}")
-        return ""
-
-def _extract_text_from_txt(path: str) -> str:
-    try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-    except Exception as e:
-        logger.error(f"TXT read failed for {path}: {e}")
-        return ""
-
-
-def extract_text(path: str, mime: Optional[str] = None) -> str:
-    ext = os.path.splitext(path)[1].lower()
-    if mime and "pdf" in mime or ext == ".pdf":
-        return _extract_text_from_pdf(path)
-    if mime and ("word" in mime or "docx" in mime) or ext == ".docx":
-        return _extract_text_from_docx(path)
-    return _extract_text_from_txt(path)
-
-
 # ────────────────────────────────
 # Chunking
 # ────────────────────────────────
@@ -81,6 +56,21 @@ def clean_text(text: str) -> str:
     t = re.sub(r"\n{3,}", "\n\n", t)
     return t.strip()
 
+def chunk_spans(text: str, max_tokens: int = 400, overlap: int = 50) -> List[Tuple[int, int]]:
+    """
+    Word-window boundaries [start, end) over text.split() for an already cleaned text.
+    """
+    n = len(text.split())
+    spans, start = [], 0
+    while start < n:
+        end = min(n, start + max_tokens)
+        spans.append((start, end))
+        if end == n:
+            break
+        start = max(0, end - overlap)
+    return spans
+
+
 def chunk_text(text: str, max_tokens: int = 400, overlap: int = 50) -> List[str]:
     """
     Simple size-based chunker (chars as proxy for tokens).
@@ -89,23 +79,14 @@ def chunk_text(text: str, max_tokens: int = 400, overlap: int = 50) -> List[str]
     if not text:
         return []
     words = text.split()
-    chunks, start = [], 0
-    while start < len(words):
-        end = min(len(words), start + max_tokens)
-        chunk = " ".join(words[start:end]).strip()
-        if chunk:
-            chunks.append(chunk)
-        if end == len(words):
-            break
-        start = max(0, end - overlap)
-    return chunks
+    return [" ".join(words[s:e]) for s, e in chunk_spans(text, max_tokens, overlap)]
 
 
 # ────────────────────────────────
 # Embedding + FAISS
 # ────────────────────────────────
 class RagIndex(BaseModel):
-    index: faiss.IndexFlatIP
+    index: faiss.Index
     dim: int
     chunks: List[str]
 
@@ -114,18 +95,110 @@ class RagIndex(BaseModel):
     }
 
 
-def build_faiss_index(chunks: List[str]) -> RagIndex:
-    emb = _get_embedder()
-    vectors = emb.encode(chunks, convert_to_numpy=True, normalize_embeddings=True)
+def embed_query(query: str) -> np.ndarray:
+    """Normalized (1, dim) query vector, memoized in a small in-process LRU."""
+    def _encode(q: str) -> np.ndarray:
+        return _get_embedder().encode([q], convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+    return get_query_cache().get_or_compute(_EMBED_MODEL_NAME, query, _encode)
+
+
+def embed_document(
+    path: str, mime: Optional[str] = None, *, max_tokens: int = 450, overlap: int = 80
+) -> Optional[DocumentEmbedding]:
+    """
+    Extract, chunk and embed one file — or load all three from the embedding
+    cache when the same bytes were processed before with this model and chunker.
+    Returns None when no text could be extracted.
+    """
+    hit, key, file_hash = _cached_document(path, max_tokens, overlap)
+    if hit is not None:
+        return hit
+    doc = _embed_pages(PageStream(path, mime), max_tokens, overlap)
+    _store_document(path, key, file_hash, doc)
+    return doc
+
+
+def _cached_document(
+    path: str, max_tokens: int, overlap: int
+) -> Tuple[Optional[DocumentEmbedding], Optional[str], Optional[str]]:
+    """(cache hit or None, cache key, file hash); key/hash are None when the cache is disabled."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return None, None, None
+    file_hash = file_sha256(path)
+    key = document_cache_key(file_hash, _EMBED_MODEL_NAME, max_tokens, overlap)
+    return cache.get(key), key, file_hash
+
+
+def _store_document(path: str, key: Optional[str], file_hash: Optional[str], doc: Optional[DocumentEmbedding]) -> None:
+    cache = get_embedding_cache()
+    if cache is None or key is None or doc is None:
+        return  # extraction failures are not cached: they may be transient
+    try:
+        cache.put(key, file_hash, _EMBED_MODEL_NAME, doc)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not cache embeddings for {path}: {e}")
+
+
+def _embed_pages(pages: Iterable[str], max_tokens: int, overlap: int) -> Optional[DocumentEmbedding]:
+    """
+    Chunk and embed a document page by page. A window is emitted as soon as
+    more words than it covers are known, so the spans match `chunk_spans` over
+    the whole text and cache entries are identical to a one-shot extraction.
+    """
+    texts: List[str] = []
+    words: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    pending: List[str] = []
+    vectors: List[np.ndarray] = []
+    start = 0
+
+    def _flush(final: bool = False) -> None:
+        if pending and (final or len(pending) >= _EMBED_BATCH):
+            vectors.append(_get_embedder().encode(pending, convert_to_numpy=True, normalize_embeddings=True))
+            pending.clear()
+
+    def _emit(end: int) -> None:
+        spans.append((start, end))
+        pending.append(" ".join(words[start:end]))
+        _flush()
+
+    for page in pages:
+        texts.append(page)
+        words.extend(page.split())
+        while len(words) > start + max_tokens:  # strictly more: this window cannot be the last one
+            _emit(start + max_tokens)
+            start = max(0, start + max_tokens - overlap)
+
+    text = clean_text("\n".join(texts))
+    if not text:
+        return None
+    while start < len(words):
+        end = min(len(words), start + max_tokens)
+        _emit(end)
+        if end == len(words):
+            break
+        start = max(0, end - overlap)
+    _flush(final=True)
+    return DocumentEmbedding(
+        text=text,
+        spans=np.asarray(spans, dtype=np.int32).reshape(-1, 2),
+        vectors=np.vstack(vectors).astype(np.float32),
+    )
+
+
+def build_faiss_index(chunks: List[str], vectors: Optional[np.ndarray] = None) -> RagIndex:
+    """Index `chunks`; pass precomputed normalized `vectors` to skip encoding."""
+    if vectors is None:
+        vectors = _get_embedder().encode(chunks, convert_to_numpy=True, normalize_embeddings=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
     dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(vectors)
+    index = build_ann_index(vectors)
     return RagIndex(index=index, dim=dim, chunks=chunks)
 
 def search(index: RagIndex, query: str, top_k: int = 6) -> List[Tuple[str, float]]:
-    emb = _get_embedder()
-    q = emb.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-    D, I = index.index.search(q, top_k)
+    q = embed_query(query)
+    D, I = index.index.search(q, top_k, params=search_params(index.index))
     hits = []
     for score, idx in zip(D[0], I[0]):
         if idx == -1:
@@ -141,27 +214,39 @@ def build_context_from_files(files: List[Tuple[str, Optional[str]]], prompt: str
     """
     files: list of (path, mime)
     Returns a concatenated context string from top relevant chunks.
+
+    Each file is chunked on its own (so its chunks and vectors can be cached by
+    content hash): a chunk never spans two files, and each file's last window
+    may be shorter than max_tokens. Before the embedding cache, the files were
+    joined and chunked as one text.
     """
-    all_text = []
-    for path, mime in files:
-        txt = extract_text(path, mime)
-        if not txt:
+    chunks: List[str] = []
+    vectors: List[np.ndarray] = []
+    # Look up every file first, then start extraction of all misses so the pool parses them concurrently
+    lookups = [_cached_document(path, 450, 80) for path, _mime in files]
+    streams = [None if hit is not None else PageStream(path, mime) for (path, mime), (hit, _k, _h) in zip(files, lookups)]
+    for (path, _mime), (hit, key, file_hash), stream in zip(files, lookups, streams):
+        doc = hit
+        if stream is not None:
+            doc = _embed_pages(stream, 450, 80)
+            _store_document(path, key, file_hash, doc)
+        if doc is None:
             logger.warning(f"⚠️ Empty text from {path}")
             continue
-        all_text.append(txt)
-
-    big_text = "\n\n".join(all_text)
-    chunks = chunk_text(big_text, max_tokens=450, overlap=80)
+        chunks.extend(doc.chunks())
+        vectors.append(doc.vectors)
     if not chunks:
         return ""
 
-    idx = build_faiss_index(chunks)
+    idx = build_faiss_index(chunks, np.vstack(vectors))
     hits = search(idx, prompt, top_k=top_k)
+    logger.info(f"📚 Built RAG context with {len(hits)} chunks.")
+    return format_context(hits)
 
+
+def format_context(hits: List[Tuple[str, float]]) -> str:
+    """Render retrieved (chunk, score) pairs as the context block passed to Gemini."""
     context_sections = []
     for i, (chunk, score) in enumerate(hits, start=1):
         context_sections.append(f"[DOC#{i} score={score:.3f}]\n{chunk}")
-
-    context = "\n\n".join(context_sections)
-    logger.info(f"📚 Built RAG context with {len(hits)} chunks.")
-    return context
+    return "\n\n".join(context_sections)
@@ -55,7 +55,10 @@ async def ensure_indexes(db):
     for coll_name, idx_list in MONGO_INDEXES.items():
         coll = db[coll_name]
         for idx in idx_list:
-            await coll.create_index(idx["keys"], unique=idx.get("unique", False))
+            opts = {"unique": idx.get("unique", False)}
+            if "expire_after_seconds" in idx:
+                opts["expireAfterSeconds"] = idx["expire_after_seconds"]  # TTL index
+            await coll.create_index(idx["keys"], **opts)
 
 
 
@@ -51,13 +51,23 @@ class AssetDB(BaseModel):
 class JobDB(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     user_id: str
-    job_type: Literal["generation","visuals","avatar","compile"]
+    job_type: Literal["generation","visuals","avatar","compile","batch"]
     status: Literal["queued","running","succeeded","failed"] = "queued"
+    stage: Optional[str] = None                                  # current pipeline stage
+    progress: int = 0                                            # 0..100
     payload: Dict[str, Any] = Field(default_factory=dict)
     result: Dict[str, Any] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     error: Optional[str] = None
+    # Durable work queue (app.utils.queue)
+    queued: bool = False
+    priority: int = 0
+    attempts: int = 0
+    max_attempts: int = 1
+    available_at: Optional[datetime] = None
+    lease_until: Optional[datetime] = None
+    worker: Optional[str] = None
 
 class AuditLogDB(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
@@ -100,6 +110,32 @@ MONGO_INDEXES = {
     "jobs": [
         {"keys": [("user_id", 1), ("created_at", -1)]},
         {"keys": [("status", 1), ("job_type", 1)]},
+        {"keys": [("queued", 1), ("status", 1), ("priority", -1), ("available_at", 1)]},
+        {"keys": [("status", 1), ("lease_until", 1)]},
+    ],
+    "avatar_cache": [
+        {"keys": [("key", 1)], "unique": True},
+        {"keys": [("expires_at", 1)], "expire_after_seconds": 0},
+    ],
+    "inflight": [
+        {"keys": [("key", 1)], "unique": True},
+        {"keys": [("expires_at", 1)], "expire_after_seconds": 0},
+    ],
+    "pipeline_runs": [
+        {"keys": [("run_id", 1)], "unique": True},
+        {"keys": [("expires_at", 1)], "expire_after_seconds": 0},
+    ],
+    "library_documents": [
+        {"keys": [("user_id", 1), ("seq", 1)], "unique": True},
+        {"keys": [("user_id", 1), ("created_at", -1)]},
+    ],
+    "webhook_endpoints": [
+        {"keys": [("user_id", 1)], "unique": True},
+    ],
+    "webhook_deliveries": [
+        {"keys": [("status", 1), ("next_attempt_at", 1)]},
+        {"keys": [("user_id", 1), ("created_at", -1)]},
+        {"keys": [("expires_at", 1)], "expire_after_seconds": 0},
     ],
     "audit_logs": [
         {"keys": [("user_id", 1), ("created_at", -1)]},
@@ -9,6 +9,10 @@ from app.auth import routes as auth_routes
 from app.api import v1 as api_v1
 from app.database.connection import close_mongo_connection, get_db, ensure_indexes
 from app.utils.storage import ensure_dirs
+from app.utils import http_clients
+from app.media.avatar_poller import stop_avatar_poller
+from app.utils.webhooks import start_webhook_dispatcher, stop_webhook_dispatcher
+from app.content.extraction import shutdown_extraction_pool
 from app.config import settings
 from app.logging_config import setup_logging
 
@@ -62,13 +66,19 @@ if settings.google_credentials and os.path.exists(settings.google_credentials):
 @app.on_event("startup")
 async def on_startup():
     ensure_dirs()  # Create static dirs
+    await http_clients.startup()  # pooled keep-alive clients per provider
     db = await get_db()
     await ensure_indexes(db)
+    start_webhook_dispatcher(db)  # sends pending completion webhooks (durable in Mongo)
     print("✅ Teachify backend started successfully.")
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await stop_avatar_poller()
+    await stop_webhook_dispatcher()
+    shutdown_extraction_pool()
+    await http_clients.shutdown()
     await close_mongo_connection()
     print("🛑 MongoDB connection closed.")
 
@@ -9,9 +9,11 @@ import time
 import uuid
 import json
 import logging
+import httpx
 import requests
 from azure.identity import DefaultAzureCredential
 from app.config import settings
+from app.utils import http_clients
 
 logger = logging.getLogger("uvicorn")
 
@@ -22,8 +24,24 @@ SPEECH_ENDPOINT = settings.speech_endpoint or "https://eastus.api.cognitive.micr
 SPEECH_KEY = settings.speech_key
 PASSWORDLESS_AUTHENTICATION = False
 API_VERSION = "2024-04-15-preview"
-REQUEST_TIMEOUT = 60
+REQUEST_TIMEOUT = settings.azure_http_timeout_s
 POLL_INTERVAL = 5
+MAX_POLL_BACKOFF = 30
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class AvatarJobTimeout(RuntimeError):
+    """The Azure job did not finish before its deadline."""
+
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client shared by all Azure calls in this process."""
+    return http_clients.get_async_client("azure")
+
+
+def _session() -> requests.Session:
+    return http_clients.get_sync_session("azure")
 
 
 # ────────────────────────────────
@@ -50,17 +68,8 @@ def _create_job_id() -> str:
 # ────────────────────────────────
 # Submit synthesis job
 # ────────────────────────────────
-def submit_synthesis_with_text(
-    job_id: str | None,
-    text_chunks: list[str],
-    avatar_character: str = "Max",
-    style: str = "business"
-) -> str:
-    job_id = job_id or _create_job_id()
-    url = f"{SPEECH_ENDPOINT}/avatar/batchsyntheses/{job_id}?api-version={API_VERSION}"
-    headers = {"Content-Type": "application/json"}
-    headers.update(_authenticate())
-
+def _build_synthesis_payload(text_chunks: list[str], avatar_character: str, style: str) -> dict:
+    """Build the batch synthesis request body."""
     # ✅ Combine all text chunks into one single input
     combined_text = "\n\n".join(text_chunks)
 
@@ -79,9 +88,24 @@ def submit_synthesis_with_text(
             "backgroundColor": "#FFFFFFFF"
         },
     }
+    return payload
+
+
+def submit_synthesis_with_text(
+    job_id: str | None,
+    text_chunks: list[str],
+    avatar_character: str = "Max",
+    style: str = "business"
+) -> str:
+    job_id = job_id or _create_job_id()
+    url = f"{SPEECH_ENDPOINT}/avatar/batchsyntheses/{job_id}?api-version={API_VERSION}"
+    headers = {"Content-Type": "application/json"}
+    headers.update(_authenticate())
+
+    payload = _build_synthesis_payload(text_chunks, avatar_character, style)
 
     try:
-        response = requests.put(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = _session().put(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
         if response.status_code < 400:
             logger.info(f"✅ Azure avatar synthesis job submitted: {job_id}")
             return job_id
@@ -96,48 +120,66 @@ def submit_synthesis_with_text(
 # ────────────────────────────────
 # Poll job status until done
 # ────────────────────────────────
+def _parse_succeeded_job(data: dict) -> tuple[str, str | None]:
+    """Extract the MP4 result URL and captions URL from a succeeded job."""
+    outputs = data.get("outputs", {}) or {}
+    result = outputs.get("result")
+    if not result:
+        raise RuntimeError("Azure job succeeded but no result URL found.")
+    # Some regions return captions explicitly; try common keys, else infer
+    captions = (
+        outputs.get("resultSubtitle")
+        or outputs.get("subtitles")
+        or outputs.get("subtitleUrl")
+    )
+    if not captions:
+        # Try to infer a .vtt next to the MP4
+        if result.endswith(".mp4"):
+            captions = result.replace(".mp4", ".vtt")
+    logger.info(f"✅ Azure job completed. Result URL: {result}, captions: {captions}")
+    return result, captions
+
+
 def poll_job_and_get_result(job_id: str) -> tuple[str, str | None]:
     """
     Poll Azure Avatar job status until it's finished.
     Returns the final result URL (MP4 download link).
+    Same limits as the async poller: settings.avatar_poll_deadline_s overall,
+    settings.avatar_poll_max_errors consecutive request errors (with backoff),
+    and a "Failed" job raises immediately.
     """
     url = f"{SPEECH_ENDPOINT}/avatar/batchsyntheses/{job_id}?api-version={API_VERSION}"
     headers = _authenticate()
+    deadline = time.monotonic() + settings.avatar_poll_deadline_s
+    errors = 0
 
     logger.info(f"⏳ Polling Azure job status: {job_id}")
     while True:
+        if time.monotonic() >= deadline:
+            raise AvatarJobTimeout(f"Azure job {job_id} exceeded {settings.avatar_poll_deadline_s}s")
         try:
-            resp = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            resp = _session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
             if resp.status_code >= 400:
                 raise RuntimeError(f"Azure job polling failed: {resp.status_code} {resp.text}")
             data = resp.json()
-            status = data.get("status")
-
-            if status == "Succeeded":
-                outputs = data.get("outputs", {}) or {}
-                result = outputs.get("result")
-                if not result:
-                    raise RuntimeError("Azure job succeeded but no result URL found.")
-                # Some regions return captions explicitly; try common keys, else infer
-                captions = (
-                    outputs.get("resultSubtitle")
-                    or outputs.get("subtitles")
-                    or outputs.get("subtitleUrl")
-                )
-                if not captions:
-                    # Try to infer a .vtt next to the MP4
-                    if result.endswith(".mp4"):
-                        captions = result.replace(".mp4", ".vtt")
-                logger.info(f"✅ Azure job completed. Result URL: {result}, captions: {captions}")
-                return result, captions
-            elif status == "Failed":
-                raise RuntimeError(f"Azure job failed: {data}")
-            else:
-                logger.info(f"⌛ Azure job still running ({status})...")
-                time.sleep(POLL_INTERVAL)
         except Exception as e:
-            logger.error(f"⚠️ Error while polling job {job_id}: {e}")
-            time.sleep(POLL_INTERVAL)
+            errors += 1
+            if errors > settings.avatar_poll_max_errors:
+                logger.error(f"❌ Azure job {job_id}: error budget exhausted ({e})")
+                raise RuntimeError(f"Azure job polling failed repeatedly: {e}")
+            logger.warning(f"⚠️ Error while polling job {job_id} ({errors}/{settings.avatar_poll_max_errors}): {e}")
+            time.sleep(min(MAX_POLL_BACKOFF, POLL_INTERVAL * (2 ** errors)))
+            continue
+
+        errors = 0
+        status = data.get("status")
+        if status == "Succeeded":
+            return _parse_succeeded_job(data)
+        if status == "Failed":  # terminal: outside the try, so it is never retried
+            logger.error(f"❌ Azure job {job_id} failed: {data.get('properties', {}).get('error', data)}")
+            raise RuntimeError(f"Azure job failed: {data}")
+        logger.info(f"⌛ Azure job still running ({status})...")
+        time.sleep(POLL_INTERVAL)
 
 
 # ────────────────────────────────
@@ -149,10 +191,107 @@ def download_file(url: str, out_path: str) -> None:
     """
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     try:
-        with requests.get(url, stream=True, timeout=REQUEST_TIMEOUT) as r:
+        with _session().get(url, stream=True, timeout=REQUEST_TIMEOUT) as r:
+            r.raise_for_status()
+            with open(out_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+        logger.info(f"🎥 Downloaded Azure avatar video: {out_path}")
+    except Exception as e:
+        logger.error(f"❌ Failed to download Azure avatar video: {e}")
+        raise
+
+
+# ────────────────────────────────
+# Async variants (non-blocking, pooled client)
+# ────────────────────────────────
+async def submit_synthesis_with_text_async(
+    job_id: str | None,
+    text_chunks: list[str],
+    avatar_character: str = "Max",
+    style: str = "business"
+) -> str:
+    """Async counterpart of submit_synthesis_with_text."""
+    job_id = job_id or _create_job_id()
+    url = f"{SPEECH_ENDPOINT}/avatar/batchsyntheses/{job_id}?api-version={API_VERSION}"
+    headers = {"Content-Type": "application/json"}
+    headers.update(_authenticate())
+    payload = _build_synthesis_payload(text_chunks, avatar_character, style)
+
+    try:
+        response = await _get_async_client().put(url, json=payload, headers=headers)
+        if response.status_code < 400:
+            logger.info(f"✅ Azure avatar synthesis job submitted: {job_id}")
+            return job_id
+        raise RuntimeError(f"Azure job submission failed: {response.status_code} {response.text}")
+    except Exception as e:
+        logger.error(f"❌ Failed to submit Azure synthesis job: {e}")
+        raise
+
+
+async def fetch_job_async(job_id: str) -> dict:
+    """Fetch the current batch synthesis job document (status, outputs with fresh SAS URLs)."""
+    url = f"{SPEECH_ENDPOINT}/avatar/batchsyntheses/{job_id}?api-version={API_VERSION}"
+    resp = await _get_async_client().get(url, headers=_authenticate())
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Azure job lookup failed: {resp.status_code} {resp.text}")
+    return resp.json()
+
+
+REATTACHABLE_STATUSES = ("NotStarted", "Running", "Succeeded")
+
+
+async def submit_or_reattach_async(
+    key: str,
+    text_chunks: list[str],
+    avatar_character: str = "Max",
+    style: str = "business",
+    ledger=None,
+) -> str:
+    """
+    Submit a synthesis job, or reuse the job recorded for `key` in `ledger` if
+    Azure still has it queued, running or finished (resume after a crash/retry).
+    `ledger` provides pending_job(key) and async record_job(key, job_id); the
+    job id is recorded *before* submission so a crash in between is recoverable.
+    """
+    if ledger is not None:
+        previous = ledger.pending_job(key)
+        if previous:
+            try:
+                status = (await fetch_job_async(previous)).get("status")
+            except Exception as e:
+                status = None
+                logger.warning(f"⚠️ Could not look up previous Azure job {previous}: {e}")
+            if status in REATTACHABLE_STATUSES:
+                logger.info(f"🔗 Reattaching to Azure job {previous} ({status})")
+                return previous
+
+    job_id = _create_job_id()
+    if ledger is not None:
+        await ledger.record_job(key, job_id)
+    return await submit_synthesis_with_text_async(job_id, text_chunks, avatar_character=avatar_character, style=style)
+
+
+async def poll_job_and_get_result_async(job_id: str, on_status=None) -> tuple[str, str | None]:
+    """
+    Async counterpart of poll_job_and_get_result.
+    Delegates to the process-wide multiplexed poller (adaptive intervals,
+    deadline and error budget) instead of running a loop per job.
+    `on_status(status, elapsed_s)` is called on each observed status change.
+    """
+    from app.media.avatar_poller import get_avatar_poller  # lazy import to avoid cycles
+    return await get_avatar_poller().wait(job_id, on_status=on_status)
+
+
+async def download_file_async(url: str, out_path: str) -> None:
+    """Async counterpart of download_file (streams with 1 MB chunks)."""
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    try:
+        async with _get_async_client().stream("GET", url) as r:
             r.raise_for_status()
             with open(out_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
+                async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
                     if chunk:
                         f.write(chunk)
         logger.info(f"🎥 Downloaded Azure avatar video: {out_path}")
@@ -0,0 +1,147 @@
+# app/media/avatar_cache.py
+"""
+Durable cache of finished Azure avatar videos (MongoDB `avatar_cache` collection).
+
+Keyed by SHA-256 of the normalized narration text plus the `synthesisConfig`
+and `avatarConfig` sent to Azure, so re-generating an identical lecture reuses
+the previous batch job instead of paying for a new multi-minute render.
+Entries are validated before reuse; expired SAS URLs are refreshed by
+re-reading the original Azure job, and dead entries are dropped.
+"""
+
+from __future__ import annotations
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.media.avatar_azure import (
+    _build_synthesis_payload,
+    _get_async_client,
+    _parse_succeeded_job,
+    fetch_job_async,
+)
+
+logger = logging.getLogger("uvicorn")
+
+# Refresh URLs that expire within this margin (the frontend needs time to play them)
+URL_EXPIRY_MARGIN = timedelta(hours=1)
+
+
+def avatar_cache_key(text_chunks: list[str], avatar_character: str, style: str) -> str:
+    """Hash of normalized text + the synthesis/avatar configuration actually submitted."""
+    payload = _build_synthesis_payload(text_chunks, avatar_character, style)
+    text = " ".join(" ".join(text_chunks).split())
+    material = {
+        "text": text,
+        "synthesisConfig": payload.get("synthesisConfig"),
+        "avatarConfig": payload.get("avatarConfig"),
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _sas_expiry(url: Optional[str]) -> Optional[datetime]:
+    """Parse the `se=` (signed expiry) parameter of an Azure SAS URL, if present."""
+    if not url:
+        return None
+    try:
+        se = parse_qs(urlparse(url).query).get("se")
+        if not se:
+            return None
+        return datetime.fromisoformat(se[0].replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
+async def _url_alive(url: str) -> bool:
+    try:
+        resp = await _get_async_client().head(url, timeout=10)
+        return resp.status_code < 400
+    except Exception:
+        return False
+
+
+# ────────────────────────────────
+# Lookup / Store
+# ────────────────────────────────
+async def lookup_avatar(db: AsyncIOMotorDatabase, key: str) -> Optional[Dict[str, Any]]:
+    """
+    Return a valid cache entry ({job_id, result_url, captions_url}) or None.
+    Refreshes expired URLs from the original Azure job when possible.
+    """
+    if db is None or not settings.avatar_cache_enabled:
+        return None
+    try:
+        doc = await db.avatar_cache.find_one({"key": key})
+        if not doc:
+            return None
+
+        now = datetime.now(timezone.utc)
+        expires_at = _sas_expiry(doc.get("result_url"))
+        fresh = expires_at is None or expires_at - URL_EXPIRY_MARGIN > now
+        if fresh and await _url_alive(doc["result_url"]):
+            await db.avatar_cache.update_one({"_id": doc["_id"]}, {"$set": {"last_used": now}, "$inc": {"hits": 1}})
+            logger.info(f"♻️ Avatar cache hit: {key[:12]} (job {doc['job_id']})")
+            return doc
+
+        # Stale URL → ask Azure for fresh SAS links on the original job
+        data = await fetch_job_async(doc["job_id"])
+        if data.get("status") != "Succeeded":
+            raise RuntimeError(f"cached job status {data.get('status')}")
+        result_url, captions_url = _parse_succeeded_job(data)
+        await db.avatar_cache.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"result_url": result_url, "captions_url": captions_url, "last_used": now, "updated_at": now},
+             "$inc": {"hits": 1}},
+        )
+        logger.info(f"♻️ Avatar cache hit with refreshed URL: {key[:12]} (job {doc['job_id']})")
+        doc.update(result_url=result_url, captions_url=captions_url)
+        return doc
+    except Exception as e:
+        logger.warning(f"⚠️ Dropping unusable avatar cache entry {key[:12]}: {e}")
+        try:
+            await db.avatar_cache.delete_one({"key": key})
+        except Exception:
+            pass
+        return None
+
+
+async def store_avatar(
+    db: AsyncIOMotorDatabase,
+    key: str,
+    job_id: str,
+    result_url: str,
+    captions_url: Optional[str],
+) -> None:
+    """Best-effort upsert of a finished avatar job."""
+    if db is None or not settings.avatar_cache_enabled:
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        await db.avatar_cache.update_one(
+            {"key": key},
+            {
+                "$set": {
+                    "job_id": job_id,
+                    "result_url": result_url,
+                    "captions_url": captions_url,
+                    "updated_at": now,
+                    "last_used": now,
+                    "expires_at": now + timedelta(days=settings.avatar_cache_ttl_days),
+                },
+                "$setOnInsert": {"created_at": now, "hits": 0},
+            },
+            upsert=True,
+        )
+    except Exception as e:  # cache is non-critical
+        logger.error(f"❌ Failed to store avatar cache entry: {e}")
+
+
+def cached_result(doc: Dict[str, Any]) -> Tuple[str, str, Optional[str]]:
+    """(job_id, result_url, captions_url) from a cache entry."""
+    return doc["job_id"], doc["result_url"], doc.get("captions_url")
@@ -0,0 +1,230 @@
+# app/media/avatar_poller.py
+"""
+Process-wide multiplexed poller for Azure avatar batch synthesis jobs.
+
+Instead of one polling loop per lecture, a single background task tracks every
+outstanding job in this worker and wakes awaiting callers through futures.
+Poll intervals adapt to each job's elapsed time and to the durations observed
+for previously completed jobs, so fresh jobs are polled rarely and jobs near
+their expected finish are polled more often. Each job has an overall deadline
+and a consecutive-error budget. Jobs are dropped from the poll set once every
+caller waiting on them has been cancelled.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.media.avatar_azure import AvatarJobTimeout, fetch_job_async, _parse_succeeded_job
+
+logger = logging.getLogger("uvicorn")
+
+StatusListener = Callable[[str, float], None]   # (Azure status, seconds elapsed)
+
+MIN_INTERVAL = 2.0
+MAX_INTERVAL = 30.0
+INITIAL_EXPECTED_DURATION = 180.0   # seconds, until we have observations
+EWMA_ALPHA = 0.2
+
+
+@dataclass
+class _Watched:
+    job_id: str
+    future: asyncio.Future
+    started: float
+    deadline: float
+    next_poll: float
+    errors: int = 0
+    waiters: int = 0
+    last_status: Optional[str] = field(default=None)
+    listeners: List[StatusListener] = field(default_factory=list)
+
+
+class AvatarJobPoller:
+    def __init__(self, *, deadline_s: float, max_errors: int, max_parallel_polls: int = 16):
+        self.deadline_s = deadline_s
+        self.max_errors = max_errors
+        self.expected_duration = INITIAL_EXPECTED_DURATION
+        self._jobs: Dict[str, _Watched] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._poll_slots = asyncio.Semaphore(max_parallel_polls)
+
+    # ────────────────────────────────
+    # Scheduling
+    # ────────────────────────────────
+    def _interval(self, elapsed: float) -> float:
+        """Poll sparsely while far from the expected finish, densely near/after it."""
+        remaining = self.expected_duration - elapsed
+        if remaining > 0:
+            interval = remaining / 4
+        else:
+            interval = MIN_INTERVAL + (-remaining) / 10  # overdue: back off slowly
+        return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+    def _observe(self, duration: float) -> None:
+        self.expected_duration = (1 - EWMA_ALPHA) * self.expected_duration + EWMA_ALPHA * duration
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="avatar-poller")
+
+    # ────────────────────────────────
+    # Public API
+    # ────────────────────────────────
+    async def wait(self, job_id: str, on_status: Optional[StatusListener] = None) -> Tuple[str, Optional[str]]:
+        """
+        Register a submitted job and wait for (result_url, captions_url).
+        `on_status(status, elapsed_s)` is called whenever the polled Azure status changes.
+        """
+        existing = self._jobs.get(job_id)
+        if existing is None:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            existing = _Watched(
+                job_id=job_id,
+                future=loop.create_future(),
+                started=now,
+                deadline=now + self.deadline_s,
+                next_poll=now + self._interval(0.0),
+            )
+            self._jobs[job_id] = existing
+            logger.info(f"⏳ Tracking Azure job {job_id} ({len(self._jobs)} outstanding)")
+            self._ensure_running()
+            self._wakeup.set()
+        if on_status is not None:
+            existing.listeners.append(on_status)
+        existing.waiters += 1
+        try:
+            return await asyncio.shield(existing.future)
+        finally:
+            existing.waiters -= 1
+            if on_status in existing.listeners:
+                existing.listeners.remove(on_status)
+            if existing.waiters == 0 and not existing.future.done():
+                # every caller gave up (cancelled): stop polling this job
+                existing.future.cancel()
+                if self._jobs.get(job_id) is existing:
+                    del self._jobs[job_id]
+                logger.info(f"🛑 Stopped tracking abandoned Azure job {job_id} ({len(self._jobs)} outstanding)")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for w in self._jobs.values():
+            if not w.future.done():
+                w.future.set_exception(RuntimeError("Avatar poller stopped."))
+        self._jobs.clear()
+
+    def snapshot(self) -> Dict[str, float]:
+        return {"outstanding": len(self._jobs), "expected_duration_s": round(self.expected_duration, 1)}
+
+    # ────────────────────────────────
+    # Loop
+    # ────────────────────────────────
+    def _resolve(self, w: _Watched, *, result=None, error: Optional[BaseException] = None) -> None:
+        if self._jobs.get(w.job_id) is w:
+            del self._jobs[w.job_id]
+        if w.future.done():
+            return
+        if error is not None:
+            w.future.set_exception(error)
+        else:
+            w.future.set_result(result)
+
+    @staticmethod
+    def _notify(w: _Watched, status: str, elapsed: float) -> None:
+        for listener in list(w.listeners):
+            try:
+                listener(status, elapsed)
+            except Exception as e:  # a listener bug must not stall the poller
+                logger.warning(f"⚠️ Status listener for job {w.job_id} failed: {e}")
+
+    async def _poll_one(self, w: _Watched) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._poll_slots:
+            try:
+                data = await fetch_job_async(w.job_id)
+            except Exception as e:
+                w.errors += 1
+                if w.errors > self.max_errors:
+                    logger.error(f"❌ Azure job {w.job_id}: error budget exhausted ({e})")
+                    self._resolve(w, error=RuntimeError(f"Azure job polling failed repeatedly: {e}"))
+                    return
+                backoff = min(MAX_INTERVAL, MIN_INTERVAL * (2 ** w.errors))
+                logger.warning(f"⚠️ Error while polling job {w.job_id} ({w.errors}/{self.max_errors}): {e}")
+                w.next_poll = loop.time() + backoff
+                return
+
+        w.errors = 0
+        status = data.get("status")
+        elapsed = loop.time() - w.started
+        if status == "Succeeded":
+            self._notify(w, status, elapsed)
+            self._observe(elapsed)
+            try:
+                self._resolve(w, result=_parse_succeeded_job(data))
+            except Exception as e:
+                self._resolve(w, error=e)
+        elif status == "Failed":
+            logger.error(f"❌ Azure job {w.job_id} failed: {data.get('properties', {}).get('error', data)}")
+            self._resolve(w, error=RuntimeError(f"Azure job failed: {data}"))
+        else:
+            if status != w.last_status:
+                logger.info(f"⌛ Azure job {w.job_id} is {status} ({elapsed:.0f}s elapsed)")
+                self._notify(w, status, elapsed)
+            w.last_status = status
+            w.next_poll = loop.time() + self._interval(elapsed)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+
+            for w in list(self._jobs.values()):
+                if now >= w.deadline:
+                    self._resolve(w, error=AvatarJobTimeout(f"Azure job {w.job_id} exceeded {self.deadline_s:.0f}s"))
+
+            due = [w for w in self._jobs.values() if w.next_poll <= now]
+            if due:
+                await asyncio.gather(*(self._poll_one(w) for w in due))
+                continue
+
+            if self._jobs:
+                sleep_for = min(min(w.next_poll, w.deadline) for w in self._jobs.values()) - now
+            else:
+                sleep_for = None  # idle until a job is registered
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+
+# ────────────────────────────────
+# Process-wide instance
+# ────────────────────────────────
+_poller: Optional[AvatarJobPoller] = None
+
+
+def get_avatar_poller() -> AvatarJobPoller:
+    global _poller
+    if _poller is None:
+        _poller = AvatarJobPoller(
+            deadline_s=settings.avatar_poll_deadline_s,
+            max_errors=settings.avatar_poll_max_errors,
+        )
+    return _poller
+
+
+async def stop_avatar_poller() -> None:
+    """Cancel the poller and fail outstanding waiters (called on app shutdown)."""
+    global _poller
+    if _poller is not None:
+        await _poller.stop()
+        _poller = None
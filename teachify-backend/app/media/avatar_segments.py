@@ -0,0 +1,267 @@
+# app/media/avatar_segments.py
+"""
+Segmented avatar synthesis: one Azure batch job per narration chunk.
+
+All segments are submitted and polled concurrently, so wall-clock time tracks
+the longest segment instead of the whole lecture. Finished segment MP4s are
+mirrored into storage, remuxed (stream copy, no re-encode) to MPEG-TS and
+listed in a VOD HLS playlist; the per-segment WebVTT captions are merged into
+one track with each cue shifted by the running segment offset.
+
+Each segment is an ordinary single-input Azure job, so unchanged segments are
+reused through the avatar cache when a lecture is regenerated. Segments run in
+a TaskGroup: the first failure cancels the others (their job ids stay in the
+checkpoint ledger, so a retried run reattaches instead of resubmitting).
+Segment downloads use the mirror's resumable, retried range fetch.
+"""
+
+from __future__ import annotations
+import os
+import re
+import math
+import uuid
+import asyncio
+import logging
+import tempfile
+import subprocess
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from app.config import settings
+from app.media.avatar_azure import (
+    submit_or_reattach_async,
+    poll_job_and_get_result_async,
+    _get_async_client,
+    _authenticate,
+)
+from app.media.avatar_cache import avatar_cache_key, lookup_avatar, store_avatar, cached_result
+from app.media.mirror import ranged_download
+from app.utils.storage import save_file, get_file_url
+
+logger = logging.getLogger("uvicorn")
+
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_CUE_RE = re.compile(r"^(\S+)\s+-->\s+(\S+)(.*)$")
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Segment:
+    index: int
+    job_id: str
+    video_url: str
+    captions_url: Optional[str]
+    duration: float = 0.0
+    captions: str = ""
+
+
+# ────────────────────────────────
+# Remux + timing helpers
+# ────────────────────────────────
+def _ffmpeg_exe() -> str:
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"  # fall back to PATH
+
+
+def _remux_to_ts(mp4_path: str, ts_path: str) -> float:
+    """Stream-copy an H.264 MP4 into MPEG-TS for HLS. Returns the input duration in seconds."""
+    proc = subprocess.run(
+        [_ffmpeg_exe(), "-hide_banner", "-y", "-i", mp4_path,
+         "-c", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", ts_path],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg remux failed: {proc.stderr.strip()[-300:]}")
+    m = _DURATION_RE.search(proc.stderr)
+    if not m:
+        return 0.0
+    h, mnt, sec = m.groups()
+    return int(h) * 3600 + int(mnt) * 60 + float(sec)
+
+
+def _store_file(key: str, path: str) -> None:
+    with open(path, "rb") as f:
+        save_file(key, f.read())
+
+
+def _parse_timestamp(ts: str) -> float:
+    parts = ts.replace(",", ".").split(":")
+    seconds = 0.0
+    for p in parts:
+        seconds = seconds * 60 + float(p)
+    return seconds
+
+
+def _format_timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def _last_cue_end(vtt: str) -> float:
+    end = 0.0
+    for line in vtt.splitlines():
+        m = _CUE_RE.match(line.strip())
+        if m:
+            end = max(end, _parse_timestamp(m.group(2)))
+    return end
+
+
+def merge_webvtt(tracks: List[Tuple[str, float]]) -> str:
+    """
+    Concatenate WebVTT tracks, shifting each by its (cumulative) start offset in seconds.
+    Headers, NOTE/STYLE blocks and cue identifiers are dropped; timings and text are kept.
+    """
+    out = ["WEBVTT", ""]
+    for vtt, offset in tracks:
+        cue: List[str] = []
+        for raw in vtt.splitlines() + [""]:
+            line = raw.strip()
+            m = _CUE_RE.match(line)
+            if m:
+                start = _format_timestamp(_parse_timestamp(m.group(1)) + offset)
+                end = _format_timestamp(_parse_timestamp(m.group(2)) + offset)
+                cue = [f"{start} --> {end}{m.group(3)}"]
+            elif not line:
+                if cue:
+                    out.extend(cue + [""])
+                cue = []
+            elif cue:
+                cue.append(raw.rstrip())
+    return "\n".join(out)
+
+
+def build_hls_playlist(segments: List[Tuple[str, float]]) -> str:
+    """VOD HLS playlist (version 3, MPEG-TS segments) for (uri, duration) pairs."""
+    target = max(1, math.ceil(max((d for _u, d in segments), default=1.0)))
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for i, (uri, duration) in enumerate(segments):
+        if i:
+            lines.append("#EXT-X-DISCONTINUITY")  # independently encoded segments
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(uri)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+# ────────────────────────────────
+# Segment lifecycle
+# ────────────────────────────────
+async def _all_or_cancel(coros: Iterable[Awaitable[T]]) -> List[T]:
+    """Run concurrently; the first failure cancels the rest and is re-raised as is."""
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(c) for c in coros]
+    except BaseExceptionGroup as eg:
+        raise eg.exceptions[0]
+    return [t.result() for t in tasks]
+
+
+async def _render_segment(
+    db, index: int, chunk: str, avatar_character: str, style: str,
+    slots: asyncio.Semaphore, on_event: EventCallback, ledger=None,
+) -> _Segment:
+    key = avatar_cache_key([chunk], avatar_character, style)
+    hit = await lookup_avatar(db, key)
+    if hit:
+        job_id, video_url, captions_url = cached_result(hit)
+        on_event("avatar_status", {"job_id": job_id, "segment": index, "status": "Cached", "elapsed_s": 0.0})
+        return _Segment(index, job_id, video_url, captions_url)
+
+    async with slots:  # bound concurrent submissions, not the renders themselves
+        job_id = await submit_or_reattach_async(key, [chunk], avatar_character, style, ledger=ledger)
+    on_event("avatar_submitted", {"job_id": job_id, "segment": index, "chunks": 1})
+
+    def _on_status(status: str, elapsed: float) -> None:
+        on_event("avatar_status", {"job_id": job_id, "segment": index, "status": status, "elapsed_s": round(elapsed, 1)})
+
+    video_url, captions_url = await poll_job_and_get_result_async(job_id, on_status=_on_status)
+    await store_avatar(db, key, job_id, video_url, captions_url)
+    return _Segment(index, job_id, video_url, captions_url)
+
+
+async def _mirror_segment(seg: _Segment, workdir: str, prefix: str) -> str:
+    """Download, remux and store one segment; returns its storage key."""
+    mp4_path = os.path.join(workdir, f"seg_{seg.index:03d}.mp4")
+    ts_path = os.path.join(workdir, f"seg_{seg.index:03d}.ts")
+    await ranged_download(seg.video_url, mp4_path)  # bounded retries, resumes partial ranges
+    seg.duration = await asyncio.to_thread(_remux_to_ts, mp4_path, ts_path)
+
+    if seg.captions_url:
+        try:
+            resp = await _get_async_client().get(seg.captions_url, headers=_authenticate(), timeout=30)
+            if resp.is_success:
+                seg.captions = resp.text
+        except Exception as e:
+            logger.warning(f"⚠️ Could not fetch captions for segment {seg.index}: {e}")
+    if not seg.duration:
+        seg.duration = _last_cue_end(seg.captions)
+
+    key = f"{prefix}/seg_{seg.index:03d}.ts"
+    await asyncio.to_thread(_store_file, key, ts_path)
+    return key
+
+
+async def synthesize_segmented(
+    db,
+    chunks: List[str],
+    *,
+    avatar_character: str = "Max",
+    style: str = "business",
+    on_event: Optional[EventCallback] = None,
+    ledger=None,
+) -> Tuple[str, Optional[str]]:
+    """
+    Render every chunk as its own Azure job concurrently and stitch the results.
+    `ledger` (see submit_or_reattach_async) lets a resumed run reattach to running segment jobs.
+    Returns (HLS playlist URL, merged captions URL or None).
+    """
+    emit = on_event or (lambda _e, _d: None)
+    if not chunks:
+        raise ValueError("No narration to synthesize.")
+
+    slots = asyncio.Semaphore(max(1, settings.avatar_segment_concurrency))
+    segments = await _all_or_cancel(
+        _render_segment(db, i, c, avatar_character, style, slots, emit, ledger) for i, c in enumerate(chunks)
+    )
+    logger.info(f"✅ All {len(segments)} avatar segments rendered — mirroring and stitching.")
+
+    lecture_id = uuid.uuid4().hex
+    prefix = f"static/videos/{lecture_id}"
+    with tempfile.TemporaryDirectory(prefix="avatar-") as workdir:
+        keys = await _all_or_cancel(_mirror_segment(s, workdir, prefix) for s in segments)
+
+    playlist = build_hls_playlist([(os.path.basename(k), s.duration) for k, s in zip(keys, segments)])
+    playlist_key = f"{prefix}/index.m3u8"
+    await asyncio.to_thread(save_file, playlist_key, playlist.encode("utf-8"))
+    playlist_url = get_file_url(playlist_key)
+    emit("avatar_ready", {"job_id": lecture_id, "video_url": playlist_url, "segments": len(segments), "cached": False})
+
+    captions_url = None
+    tracks, offset = [], 0.0
+    for s in segments:
+        if s.captions:
+            tracks.append((s.captions, offset))
+        offset += s.duration
+    if tracks:
+        captions_key = f"static/captions/{lecture_id}.vtt"
+        await asyncio.to_thread(save_file, captions_key, merge_webvtt(tracks).encode("utf-8"))
+        captions_url = get_file_url(captions_key)
+    emit("captions", {"job_id": lecture_id, "captions_url": captions_url})
+
+    logger.info(f"🎞️ Avatar HLS playlist ready: {playlist_url} ({offset:.0f}s, {len(segments)} segments)")
+    return playlist_url, captions_url
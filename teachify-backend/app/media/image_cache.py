@@ -0,0 +1,261 @@
+# app/media/image_cache.py
+"""
+Persistent, content-addressed cache for generated FLUX images.
+
+Entries are keyed by SHA-256 of (prompt, aspect ratio, BFL route) and stored as
+`<key>.png` next to a small SQLite index (safe to share across uvicorn workers).
+Optionally, a new prompt may reuse a cached image whose prompt embedding is
+within a cosine-similarity threshold (MiniLM embedder from rag_processor).
+The cache is size-bounded with LRU eviction and keeps hit/miss counters.
+"""
+
+from __future__ import annotations
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    key        TEXT PRIMARY KEY,
+    prompt     TEXT NOT NULL,
+    aspect     TEXT NOT NULL,
+    route      TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0,
+    embedding  BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_images_last_used ON images(last_used);
+"""
+
+
+def cache_key(prompt: str, aspect_ratio: str, route: str) -> str:
+    """Content address for an image request."""
+    norm = " ".join((prompt or "").split())
+    return hashlib.sha256(f"{norm}\x1f{aspect_ratio}\x1f{route}".encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        *,
+        semantic: bool = False,
+        semantic_threshold: float = 0.92,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self.stats: Dict[str, int] = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        # In-memory view of stored embeddings, refreshed incrementally from SQLite. Rows of
+        # evicted / replaced keys are masked out and the view is compacted once they pile up.
+        self._emb_keys: list[str] = []
+        self._emb_meta: list[Tuple[str, str]] = []
+        self._emb_matrix: Optional[np.ndarray] = None
+        self._emb_live: np.ndarray = np.zeros(0, dtype=bool)
+        self._emb_row: Dict[str, int] = {}  # key → its current row
+        self._emb_rowid = 0
+        os.makedirs(directory, exist_ok=True)
+        with self._session() as conn:
+            conn.executescript(_SCHEMA)
+
+    # ────────────────────────────────
+    # Internals
+    # ────────────────────────────────
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _session(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    @staticmethod
+    def _embed(prompt: str) -> np.ndarray:
+        from app.content.rag_processor import _get_embedder  # lazy: heavy model import
+        vec = _get_embedder().encode([prompt], convert_to_numpy=True, normalize_embeddings=True)[0]
+        return vec.astype(np.float32)
+
+    def _read(self, conn: sqlite3.Connection, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            conn.execute("DELETE FROM images WHERE key = ?", (key,))  # evicted by another worker
+            self._forget(key)
+            return None
+        conn.execute("UPDATE images SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        return data
+
+    def _forget(self, key: str) -> None:
+        row = self._emb_row.pop(key, None)
+        if row is not None:
+            self._emb_live[row] = False
+
+    def _reset_embeddings(self) -> None:
+        self._emb_keys, self._emb_meta, self._emb_row = [], [], {}
+        self._emb_matrix, self._emb_live, self._emb_rowid = None, np.zeros(0, dtype=bool), 0
+
+    def _compact_embeddings(self) -> None:
+        keep = np.flatnonzero(self._emb_live)
+        self._emb_keys = [self._emb_keys[i] for i in keep]
+        self._emb_meta = [self._emb_meta[i] for i in keep]
+        self._emb_matrix = self._emb_matrix[keep] if len(keep) else None
+        self._emb_live = np.ones(len(keep), dtype=bool)
+        self._emb_row = {key: i for i, key in enumerate(self._emb_keys)}
+
+    def _refresh_embeddings(self, conn: sqlite3.Connection) -> None:
+        (stored,) = conn.execute("SELECT COUNT(*) FROM images WHERE embedding IS NOT NULL").fetchone()
+        if len(self._emb_row) > stored * 1.25 + 16:
+            self._reset_embeddings()  # other workers evicted many entries: reload the live rows
+        rows = conn.execute(
+            "SELECT rowid, key, aspect, route, embedding FROM images WHERE rowid > ? AND embedding IS NOT NULL",
+            (self._emb_rowid,),
+        ).fetchall()
+        if rows:
+            vecs = []
+            for rowid, key, aspect, route, blob in rows:
+                self._emb_rowid = max(self._emb_rowid, rowid)
+                self._forget(key)  # INSERT OR REPLACE gives a re-put key a new rowid
+                self._emb_row[key] = len(self._emb_keys)
+                self._emb_keys.append(key)
+                self._emb_meta.append((aspect, route))
+                vecs.append(np.frombuffer(blob, dtype=np.float32))
+            new = np.vstack(vecs)
+            self._emb_matrix = new if self._emb_matrix is None else np.vstack([self._emb_matrix, new])
+            self._emb_live = np.concatenate([self._emb_live, np.ones(len(vecs), dtype=bool)])
+        if len(self._emb_keys) > 2 * len(self._emb_row) + 16:
+            self._compact_embeddings()
+
+    def _nearest(self, conn: sqlite3.Connection, vec: np.ndarray, aspect: str, route: str) -> Iterator[Tuple[str, float]]:
+        """Matching (key, similarity) candidates above the threshold, best first."""
+        self._refresh_embeddings(conn)
+        if self._emb_matrix is None:
+            return
+        scores = self._emb_matrix @ vec
+        # only rows that are live and above the threshold get sorted
+        candidates = np.flatnonzero(self._emb_live & (scores >= self.semantic_threshold))
+        for idx in candidates[np.argsort(-scores[candidates])]:
+            if self._emb_meta[idx] == (aspect, route):
+                yield self._emb_keys[idx], float(scores[idx])
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (total,) = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM images").fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size_bytes FROM images ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM images WHERE key = ?", (key,))
+            self._forget(key)
+            total -= size
+            self.stats["evictions"] += 1
+
+    # ────────────────────────────────
+    # Public API
+    # ────────────────────────────────
+    def get(self, prompt: str, aspect_ratio: str, route: str) -> Optional[bytes]:
+        """Return cached image bytes for an exact (or, if enabled, near-duplicate) prompt."""
+        key = cache_key(prompt, aspect_ratio, route)
+        with self._lock, self._session() as conn:
+            if conn.execute("SELECT 1 FROM images WHERE key = ?", (key,)).fetchone():
+                data = self._read(conn, key)
+                if data is not None:
+                    self.stats["hits"] += 1
+                    logger.info(f"♻️ Image cache hit: {key[:12]}")
+                    return data
+
+        if self.semantic:
+            vec = self._embed(prompt)  # outside the lock: encoding is the slow part
+            with self._lock, self._session() as conn:
+                for match_key, score in self._nearest(conn, vec, aspect_ratio, route):
+                    data = self._read(conn, match_key)  # None when evicted: try the next candidate
+                    if data is not None:
+                        self.stats["semantic_hits"] += 1
+                        logger.info(f"♻️ Image cache near-duplicate hit: {match_key[:12]} (sim={score:.3f})")
+                        return data
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, prompt: str, aspect_ratio: str, route: str, data: bytes) -> None:
+        """Store freshly generated image bytes and evict least-recently-used entries if over budget."""
+        key = cache_key(prompt, aspect_ratio, route)
+        embedding = self._embed(prompt).tobytes() if self.semantic else None
+        now = time.time()
+        with self._lock, self._session() as conn:
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))  # atomic for concurrent writers
+            conn.execute(
+                "INSERT OR REPLACE INTO images (key, prompt, aspect, route, size_bytes, created_at, last_used, hits, embedding) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (key, prompt, aspect_ratio, route, len(data), now, now, embedding),
+            )
+            self.stats["stores"] += 1
+            self._evict(conn)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Counters plus current footprint, for metrics/logging."""
+        with self._lock, self._session() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM images").fetchone()
+        lookups = self.stats["hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hit_rate = (self.stats["hits"] + self.stats["semantic_hits"]) / lookups if lookups else 0.0
+        return {**self.stats, "entries": entries, "size_bytes": total, "hit_rate": round(hit_rate, 4)}
+
+
+# ────────────────────────────────
+# Process-wide instance
+# ────────────────────────────────
+_image_cache: Optional[ImageCache] = None
+
+
+def get_image_cache() -> Optional[ImageCache]:
+    """Return the shared cache, or None when disabled/unavailable."""
+    global _image_cache
+    if not settings.image_cache_enabled:
+        return None
+    if _image_cache is None:
+        try:
+            _image_cache = ImageCache(
+                settings.image_cache_dir,
+                settings.image_cache_max_mb * 1024 * 1024,
+                semantic=settings.image_cache_semantic,
+                semantic_threshold=settings.image_cache_semantic_threshold,
+            )
+            logger.info(f"✅ Image cache ready at {settings.image_cache_dir}")
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache unavailable: {e}")
+            return None
+    return _image_cache
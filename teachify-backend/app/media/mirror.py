@@ -0,0 +1,192 @@
+# app/media/mirror.py
+"""
+Background mirroring of finished Azure avatar assets into our own storage.
+
+Azure result URLs are short-lived SAS links, so lecture history entries go
+stale and every playback pulls from Azure. After a lecture is persisted, its
+video (and captions, if still remote) are fetched with parallel HTTP range
+requests into a preallocated temp file, uploaded through storage.save_file,
+and the lecture record is rewritten to the durable URL.
+
+Writes go through large file buffers (mirror_buffer_kb). Each range worker
+keeps the bytes it already wrote: after a network error it resumes from its
+current offset instead of restarting the download.
+"""
+
+from __future__ import annotations
+import os
+import asyncio
+import logging
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.utils import http_clients
+from app.utils.storage import save_file, get_file_url
+
+logger = logging.getLogger("uvicorn")
+
+MIN_PART_BYTES = 4 * 1024 * 1024   # don't split small files into tiny ranges
+RETRY_BACKOFF = 1.0
+
+
+class MirrorError(RuntimeError):
+    """A range could not be fetched within its retry budget."""
+
+
+def _client() -> httpx.AsyncClient:
+    return http_clients.get_async_client("azure")
+
+
+def _buffer_bytes() -> int:
+    return max(64 * 1024, settings.mirror_buffer_kb * 1024)
+
+
+def _plan_ranges(size: int, parts: int) -> List[Tuple[int, int]]:
+    """Split [0, size) into up to `parts` inclusive byte ranges of at least MIN_PART_BYTES."""
+    parts = max(1, min(parts, size // MIN_PART_BYTES or 1))
+    step = -(-size // parts)
+    return [(start, min(size, start + step) - 1) for start in range(0, size, step)]
+
+
+async def _probe(url: str) -> Tuple[Optional[int], bool]:
+    """Return (content length, server honours byte ranges)."""
+    try:
+        resp = await _client().head(url, follow_redirects=True)
+        if resp.is_success:
+            length = resp.headers.get("content-length")
+            ranged = resp.headers.get("accept-ranges", "").lower() == "bytes"
+            return (int(length) if length and length.isdigit() else None), ranged
+    except httpx.HTTPError as e:
+        logger.warning(f"⚠️ HEAD failed for mirror source, falling back to single stream: {e}")
+    return None, False
+
+
+async def _fetch_range(url: str, path: str, start: int, end: int, retries: int) -> None:
+    """Write bytes [start, end] of `url` at the same offsets of `path`, resuming on failure."""
+    pos, attempt = start, 0
+    buffer = _buffer_bytes()
+    with open(path, "r+b", buffering=buffer) as f:
+        while pos <= end:
+            try:
+                async with _client().stream(
+                    "GET", url, headers={"Range": f"bytes={pos}-{end}"}, follow_redirects=True
+                ) as r:
+                    if r.status_code != 206:
+                        raise MirrorError(f"expected 206 for range {pos}-{end}, got {r.status_code}")
+                    f.seek(pos)
+                    async for block in r.aiter_bytes():  # as received, so a resume loses nothing
+                        f.write(block[: end + 1 - pos])
+                        pos += len(block)
+                        if pos > end:
+                            break
+            except (httpx.HTTPError, MirrorError) as e:
+                attempt += 1
+                if attempt > retries:
+                    raise MirrorError(f"range {start}-{end} failed at offset {pos}: {e}")
+                logger.warning(f"⚠️ Range {start}-{end} interrupted at {pos} ({attempt}/{retries}): {e}")
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+
+async def _fetch_whole(url: str, path: str, retries: int) -> None:
+    """Single-stream fallback for servers without range support."""
+    buffer = _buffer_bytes()
+    for attempt in range(retries + 1):
+        try:
+            async with _client().stream("GET", url, follow_redirects=True) as r:
+                r.raise_for_status()
+                with open(path, "wb", buffering=buffer) as f:
+                    async for block in r.aiter_bytes():
+                        f.write(block)
+            return
+        except httpx.HTTPError as e:
+            if attempt >= retries:
+                raise MirrorError(f"download failed: {e}")
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+async def ranged_download(url: str, path: str) -> int:
+    """
+    Download `url` to `path` using up to settings.mirror_parallel_ranges concurrent
+    range requests (single stream if the server has no range support). Returns bytes written.
+    """
+    retries = settings.mirror_retries
+    size, ranged = await _probe(url)
+    if not size or not ranged:
+        await _fetch_whole(url, path, retries)
+        return os.path.getsize(path)
+
+    with open(path, "wb") as f:
+        f.truncate(size)  # preallocate so ranges can be written in place
+    ranges = _plan_ranges(size, settings.mirror_parallel_ranges)
+    await asyncio.gather(*(_fetch_range(url, path, s, e, retries) for s, e in ranges))
+    logger.info(f"📥 Mirrored {size / 1e6:.1f} MB in {len(ranges)} parallel ranges")
+    return size
+
+
+def _store(key: str, path: str) -> str:
+    with open(path, "rb") as f:
+        save_file(key, f.read())
+    return get_file_url(key)
+
+
+def is_remote(url: Optional[str]) -> bool:
+    """True for URLs we do not host (e.g. Azure SAS links)."""
+    return bool(url) and url.startswith(("http://", "https://")) and not url.startswith(get_file_url(""))
+
+
+async def mirror_asset(url: str, key: str) -> str:
+    """Fetch a remote asset into storage under `key`; returns its durable URL."""
+    fd, tmp = tempfile.mkstemp(prefix="mirror-", suffix=os.path.splitext(key)[1])
+    os.close(fd)
+    try:
+        await ranged_download(url, tmp)
+        return await asyncio.to_thread(_store, key, tmp)
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+async def mirror_lecture_assets(
+    db: AsyncIOMotorDatabase,
+    lecture_id: str,
+    video_url: Optional[str],
+    captions_url: Optional[str],
+) -> Optional[Dict[str, Any]]:
+    """
+    Mirror a persisted lecture's avatar video/captions and point its record at the
+    durable copies. Failures are logged and recorded on the lecture; the Azure URL stays.
+    """
+    updates: Dict[str, Any] = {}
+    try:
+        if is_remote(video_url):
+            durable = await mirror_asset(video_url, f"static/videos/{lecture_id}.mp4")
+            updates.update({
+                "avatar_video_url": durable,
+                "meta.lecture_output.video_path": durable,
+                "meta.source_video_url": video_url,
+            })
+        if is_remote(captions_url):
+            durable = await mirror_asset(captions_url, f"static/captions/{lecture_id}.vtt")
+            updates.update({"meta.captions_url": durable, "meta.lecture_output.captions_url": durable})
+    except Exception as e:
+        logger.error(f"❌ Mirroring lecture {lecture_id} failed: {e}")
+        await db.lectures.update_one(
+            {"_id": ObjectId(lecture_id)},
+            {"$set": {"meta.mirror_status": "failed", "meta.mirror_error": str(e), "updated_at": datetime.utcnow()}},
+        )
+        return None
+
+    if not updates:
+        return None
+    updates.update({"meta.mirror_status": "done", "updated_at": datetime.utcnow()})
+    await db.lectures.update_one({"_id": ObjectId(lecture_id)}, {"$set": updates})
+    logger.info(f"🗄️ Lecture {lecture_id} now served from durable storage.")
+    return updates
@@ -8,13 +8,20 @@ import os
 import re
 import time
 import json
+import asyncio
 import logging
+import threading
+import uuid
+import httpx
 import requests
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Any, List, Optional
 from PIL import Image, ImageDraw, ImageFont
 
 from app.config import settings
 from app.utils.storage import ensure_dirs
+from app.utils import http_clients
+from app.media.image_cache import get_image_cache
 
 logger = logging.getLogger("uvicorn")
 
@@ -28,6 +35,31 @@ BFL_ROUTE = os.getenv("BFL_ROUTE", "/v1/flux-pro-1.1")
 # aspect_ratio "16:9" gives 1280x720 delivery; API returns a signed URL we will download.
 DEFAULT_ASPECT = os.getenv("BFL_ASPECT", "16:9")
 
+BFL_POLL_INTERVAL = 0.5
+
+# Concurrency caps: per lecture, and process-wide so we stay under BFL rate limits
+PER_LECTURE_CONCURRENCY = max(1, settings.visuals_concurrency_per_lecture)
+GLOBAL_CONCURRENCY = max(1, settings.visuals_concurrency_global)
+_global_sync_slots = threading.BoundedSemaphore(GLOBAL_CONCURRENCY)
+_global_async_slots: Optional[asyncio.Semaphore] = None
+
+
+def _get_global_async_slots() -> asyncio.Semaphore:
+    global _global_async_slots
+    if _global_async_slots is None:
+        _global_async_slots = asyncio.Semaphore(GLOBAL_CONCURRENCY)
+    return _global_async_slots
+
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client shared by all BFL calls in this process."""
+    return http_clients.get_async_client("bfl")
+
+
+def _session() -> requests.Session:
+    return http_clients.get_sync_session("bfl")
+
 if BFL_API_KEY:
     logger.info("✅ BFL API key detected — using official FLUX API.")
 else:
@@ -38,7 +70,8 @@ else:
 # ────────────────────────────────
 def _safe_filename_from_prompt(prompt: str, index: int) -> str:
     safe = re.sub(r"[^a-zA-Z0-9_-]+", "_", prompt)[:60].strip("_")
-    return f"{safe or 'visual'}_{index}.png"
+    # Unique suffix: identical prompts across lectures must not overwrite each other
+    return f"{safe or 'visual'}_{index}_{uuid.uuid4().hex[:8]}.png"
 
 # ────────────────────────────────
 # Helper: placeholder image
@@ -91,7 +124,7 @@ def _generate_image_via_bfl(prompt: str, aspect_ratio: str = DEFAULT_ASPECT, tim
         # 1) Submit generation request
         payload = {"prompt": prompt, "aspect_ratio": aspect_ratio}
         logger.info("🧠 Submitting request to BFL FLUX API...")
-        submit = requests.post(url, headers=headers, data=json.dumps(payload), timeout=30)
+        submit = _session().post(url, headers=headers, data=json.dumps(payload), timeout=http_clients.timeout_for("bfl"))
         if submit.status_code != 200:
             logger.error(f"❌ BFL submit failed {submit.status_code}: {submit.text[:200]}")
             return None
@@ -110,7 +143,7 @@ def _generate_image_via_bfl(prompt: str, aspect_ratio: str = DEFAULT_ASPECT, tim
                 return None
 
             time.sleep(0.5)
-            poll = requests.get(polling_url, headers={"accept": "application/json", "x-key": BFL_API_KEY}, timeout=30)
+            poll = _session().get(polling_url, headers={"accept": "application/json", "x-key": BFL_API_KEY}, timeout=http_clients.timeout_for("bfl"))
             if poll.status_code != 200:
                 logger.warning(f"⚠️ BFL poll {poll.status_code}: {poll.text[:160]}")
                 continue
@@ -123,7 +156,7 @@ def _generate_image_via_bfl(prompt: str, aspect_ratio: str = DEFAULT_ASPECT, tim
                     logger.error("❌ BFL Ready but no result.sample URL.")
                     return None
                 # 3) Download the signed image URL (expires ~10 minutes)
-                img_resp = requests.get(sample_url, timeout=60)
+                img_resp = _session().get(sample_url, timeout=60)
                 if img_resp.ok:
                     logger.info("✅ BFL FLUX image generation success.")
                     return img_resp.content
@@ -138,35 +171,240 @@ def _generate_image_via_bfl(prompt: str, aspect_ratio: str = DEFAULT_ASPECT, tim
         logger.error(f"BFL image generation error: {e}")
         return None
 
+async def _generate_image_via_bfl_async(
+    prompt: str, aspect_ratio: str = DEFAULT_ASPECT, timeout_s: int = 180
+) -> Optional[bytes]:
+    """Async counterpart of _generate_image_via_bfl (pooled client, non-blocking poll)."""
+    if not BFL_API_KEY:
+        return None
+
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "x-key": BFL_API_KEY,
+    }
+    url = f"{BFL_BASE}{BFL_ROUTE}"
+    client = _get_async_client()
+
+    try:
+        # 1) Submit generation request
+        payload = {"prompt": prompt, "aspect_ratio": aspect_ratio}
+        logger.info("🧠 Submitting request to BFL FLUX API...")
+        submit = await client.post(url, headers=headers, content=json.dumps(payload))
+        if submit.status_code != 200:
+            logger.error(f"❌ BFL submit failed {submit.status_code}: {submit.text[:200]}")
+            return None
+
+        data = submit.json()
+        polling_url = data.get("polling_url")
+        if not polling_url:
+            logger.error("❌ BFL response missing polling_url.")
+            return None
+
+        # 2) Poll for result
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            if loop.time() - start > timeout_s:
+                logger.error("❌ BFL polling timed out.")
+                return None
+
+            await asyncio.sleep(BFL_POLL_INTERVAL)
+            poll = await client.get(polling_url, headers={"accept": "application/json", "x-key": BFL_API_KEY})
+            if poll.status_code != 200:
+                logger.warning(f"⚠️ BFL poll {poll.status_code}: {poll.text[:160]}")
+                continue
+
+            p = poll.json()
+            status = p.get("status")
+            if status == "Ready":
+                sample_url = (p.get("result") or {}).get("sample")
+                if not sample_url:
+                    logger.error("❌ BFL Ready but no result.sample URL.")
+                    return None
+                # 3) Download the signed image URL (expires ~10 minutes)
+                img_resp = await client.get(sample_url, timeout=60)
+                if img_resp.is_success:
+                    logger.info("✅ BFL FLUX image generation success.")
+                    return img_resp.content
+                logger.error(f"❌ Failed to download BFL image: {img_resp.status_code}")
+                return None
+            elif status in {"Error", "Failed"}:
+                logger.error(f"❌ BFL generation failed: {p}")
+                return None
+            # else: Queued / Processing → keep polling
+
+    except Exception as e:
+        logger.error(f"BFL image generation error: {e}")
+        return None
+
+# ────────────────────────────────
+# Cache-aware wrappers
+# ────────────────────────────────
+def _generate_image_cached(prompt: str, aspect_ratio: str = DEFAULT_ASPECT) -> Optional[bytes]:
+    cache = get_image_cache()
+    if cache:
+        try:
+            cached = cache.get(prompt, aspect_ratio, BFL_ROUTE)
+            if cached:
+                return cached
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache lookup failed: {e}")
+
+    with _global_sync_slots:
+        image_bytes = _generate_image_via_bfl(prompt, aspect_ratio=aspect_ratio)
+
+    if cache and image_bytes:
+        try:
+            cache.put(prompt, aspect_ratio, BFL_ROUTE, image_bytes)
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache store failed: {e}")
+    return image_bytes
+
+
+async def _generate_image_cached_async(prompt: str, aspect_ratio: str = DEFAULT_ASPECT) -> Optional[bytes]:
+    cache = get_image_cache()
+    if cache:
+        try:
+            cached = await asyncio.to_thread(cache.get, prompt, aspect_ratio, BFL_ROUTE)
+            if cached:
+                return cached
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache lookup failed: {e}")
+
+    async with _get_global_async_slots():
+        image_bytes = await _generate_image_via_bfl_async(prompt, aspect_ratio=aspect_ratio)
+
+    if cache and image_bytes:
+        try:
+            await asyncio.to_thread(cache.put, prompt, aspect_ratio, BFL_ROUTE, image_bytes)
+        except Exception as e:
+            logger.warning(f"⚠️ Image cache store failed: {e}")
+    return image_bytes
+
+
 # ────────────────────────────────
 # Public pipeline
 # ────────────────────────────────
-def generate_visuals_for_content(content: Dict[str, Any]) -> Dict[str, Any]:
+def _store_visual(image_bytes: Optional[bytes], out_path: str, prompt: str) -> None:
+    """Write generated bytes to disk, or a placeholder if generation/saving failed."""
+    filename = os.path.basename(out_path)
+    if image_bytes:
+        if _save_image_bytes(image_bytes, out_path):
+            logger.info(f"✅ FLUX image saved: {out_path}")
+        else:
+            logger.warning(f"⚠️ Could not save FLUX image. Placeholder for {filename}")
+            create_placeholder_image(out_path, prompt)
+    else:
+        logger.warning(f"⚠️ BFL API unavailable or failed. Placeholder for {filename}")
+        create_placeholder_image(out_path, prompt)
+
+
+def _render_visual_sync(idx: int, v: Dict[str, Any]) -> str:
+    prompt = (v.get("prompt") or f"Visual {idx}").strip()
+    filename = _safe_filename_from_prompt(prompt, idx)
+    out_path = os.path.join("static", "images", filename)
+
+    logger.info(f"🎨 Generating visual {idx}: {prompt[:80]}...")
+    image_bytes = _generate_image_cached(prompt, aspect_ratio=DEFAULT_ASPECT)
+    _store_visual(image_bytes, out_path, prompt)
+    return out_path
+
+
+def generate_visuals_for_content(content: Dict[str, Any], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
     """
     Generate visuals using BFL FLUX API or create placeholders if unavailable.
+    Visuals are rendered concurrently (bounded per lecture and process-wide);
+    results keep the original order.
     """
     ensure_dirs()
     visuals: List[Dict[str, Any]] = content.get("visualizations", []) or []
+    if not visuals:
+        content["visualizations"] = visuals
+        return content
 
-    for idx, v in enumerate(visuals, start=1):
-        prompt = (v.get("prompt") or f"Visual {idx}").strip()
-        filename = _safe_filename_from_prompt(prompt, idx)
-        out_path = os.path.join("static", "images", filename)
+    workers = max(1, min(max_concurrency or PER_LECTURE_CONCURRENCY, len(visuals)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        paths = list(pool.map(lambda item: _render_visual_sync(*item), enumerate(visuals, start=1)))
 
+    for v, out_path in zip(visuals, paths):
+        v["image_path"] = out_path
+
+    content["visualizations"] = visuals
+    logger.info("🖼️ Visual generation complete.")
+    return content
+
+
+async def _render_visual_async(idx: int, v: Dict[str, Any], lecture_slots: asyncio.Semaphore) -> str:
+    prompt = (v.get("prompt") or f"Visual {idx}").strip()
+    filename = _safe_filename_from_prompt(prompt, idx)
+    out_path = os.path.join("static", "images", filename)
+
+    async with lecture_slots:
         logger.info(f"🎨 Generating visual {idx}: {prompt[:80]}...")
-        image_bytes = _generate_image_via_bfl(prompt, aspect_ratio=DEFAULT_ASPECT)
-
-        if image_bytes:
-            if _save_image_bytes(image_bytes, out_path):
-                logger.info(f"✅ FLUX image saved: {out_path}")
-            else:
-                logger.warning(f"⚠️ Could not save FLUX image. Placeholder for {filename}")
-                create_placeholder_image(out_path, prompt)
-        else:
-            logger.warning(f"⚠️ BFL API unavailable or failed. Placeholder for {filename}")
-            create_placeholder_image(out_path, prompt)
+        image_bytes = await _generate_image_cached_async(prompt, aspect_ratio=DEFAULT_ASPECT)
+    await asyncio.to_thread(_store_visual, image_bytes, out_path, prompt)
+    return out_path
+
+
+def start_visual_render(idx: int, v: Dict[str, Any], lecture_slots: asyncio.Semaphore) -> "asyncio.Task[str]":
+    """
+    Begin rendering one visual in the background (e.g. while the lecture text is
+    still streaming). Pass the task to generate_visuals_for_content_async via
+    `started`, keyed by visual_prompt_key(v), so it is not rendered twice.
+    """
+    ensure_dirs()
+    return asyncio.create_task(_render_visual_async(idx, v, lecture_slots), name=f"visual-{idx}")
+
+
+def visual_prompt_key(v: Dict[str, Any]) -> str:
+    return (v.get("prompt") or "").strip()
+
+
+async def generate_visuals_for_content_async(
+    content: Dict[str, Any],
+    max_concurrency: Optional[int] = None,
+    *,
+    started: Optional[Dict[str, "asyncio.Task[str]"]] = None,
+    lecture_slots: Optional[asyncio.Semaphore] = None,
+    on_saved: Optional[Callable[[int, str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Async counterpart of generate_visuals_for_content for use from route handlers.
+    All visuals are generated concurrently under the per-lecture and global caps.
+    Renders already running in `started` (see start_visual_render) are awaited
+    instead of re-rendered; unclaimed ones are cancelled.
+    `on_saved(index, image_path)` is called as each visual lands on disk.
+    """
+    ensure_dirs()
+    visuals: List[Dict[str, Any]] = content.get("visualizations", []) or []
+    pending = dict(started or {})
 
+    if lecture_slots is None:
+        lecture_slots = asyncio.Semaphore(max(1, max_concurrency or PER_LECTURE_CONCURRENCY))
+
+    async def _finish(idx: int, v: Dict[str, Any], job: Awaitable[str]) -> str:
+        try:
+            out_path = await job
+        except Exception as e:
+            # Individual failures never sink the lecture — fall back to a placeholder
+            prompt = (v.get("prompt") or f"Visual {idx}").strip()
+            out_path = os.path.join("static", "images", _safe_filename_from_prompt(prompt, idx))
+            logger.warning(f"⚠️ Visual {idx} failed ({e}). Placeholder for {os.path.basename(out_path)}")
+            await asyncio.to_thread(create_placeholder_image, out_path, prompt)
         v["image_path"] = out_path
+        if on_saved:
+            on_saved(idx, out_path)
+        return out_path
+
+    jobs = []
+    for idx, v in enumerate(visuals, start=1):
+        early = pending.pop(visual_prompt_key(v), None)
+        jobs.append(_finish(idx, v, early if early is not None else _render_visual_async(idx, v, lecture_slots)))
+    for leftover in pending.values():
+        leftover.cancel()
+
+    await asyncio.gather(*jobs)
 
     content["visualizations"] = visuals
     logger.info("🖼️ Visual generation complete.")
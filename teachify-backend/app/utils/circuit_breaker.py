@@ -0,0 +1,84 @@
+# app/utils/circuit_breaker.py
+"""
+Shared async circuit breaker.
+
+closed    → calls flow; consecutive failures are counted.
+open      → calls are rejected immediately (callers use their fallback);
+            a background probe checks the dependency every `reset_timeout` seconds.
+closed    ← a successful probe (or real call) closes the circuit again.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("uvicorn")
+
+ProbeFunc = Callable[[], Awaitable[None]]
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, *, failure_threshold: int, reset_timeout: float, probe: Optional[ProbeFunc] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.stats: Dict[str, int] = {"opened": 0, "rejected": 0, "probes": 0}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """True if a real call may be attempted now."""
+        if not self.is_open:
+            return True
+        if self.probe is None and time.monotonic() - self.opened_at >= self.reset_timeout:
+            return True  # no background probe configured: let one real call through (half-open)
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.is_open:
+            logger.info(f"✅ Circuit '{self.name}' closed — dependency recovered.")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if not self.is_open:
+                self.stats["opened"] += 1
+                logger.error(f"🚫 Circuit '{self.name}' opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+            self._start_probe()
+
+    # ────────────────────────────────
+    # Background recovery probe
+    # ────────────────────────────────
+    def _start_probe(self) -> None:
+        if self.probe is None or (self._probe_task and not self._probe_task.done()):
+            return
+        try:
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop(), name=f"probe-{self.name}")
+        except RuntimeError:
+            pass  # no running loop (sync caller) — allow() stays closed to real calls until a loop probes
+
+    async def _probe_loop(self) -> None:
+        while self.is_open:
+            await asyncio.sleep(self.reset_timeout)
+            self.stats["probes"] += 1
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.warning(f"⚠️ Circuit '{self.name}' probe failed: {e}")
+                continue
+            self.record_success()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"state": "open" if self.is_open else "closed", "failures": self.failures, **self.stats}
@@ -0,0 +1,170 @@
+# app/utils/http_clients.py
+"""
+Process-wide registry of pooled, keep-alive HTTP clients — one per provider.
+
+- Async: one `httpx.AsyncClient` per provider (azure, bfl, default, webhooks).
+  The webhooks client only connects to public addresses (SSRF guard).
+- Sync:  one `requests.Session` per provider for legacy blocking code paths.
+
+Clients are created on startup (`startup()`), reused by every outbound call,
+and closed on shutdown (`shutdown()`). Each provider keeps counters of requests
+sent and new connections opened, so connection reuse can be monitored.
+"""
+
+from __future__ import annotations
+import logging
+import threading
+from typing import Dict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+PROVIDERS = ("azure", "bfl", "default", "webhooks")
+
+
+def timeout_for(provider: str) -> float:
+    """Configured per-request timeout (seconds) for a provider."""
+    return {
+        "azure": settings.azure_http_timeout_s,
+        "bfl": settings.bfl_http_timeout_s,
+        "webhooks": settings.webhook_timeout_s,
+    }.get(provider, settings.default_http_timeout_s)
+
+
+# ────────────────────────────────
+# Counters
+# ────────────────────────────────
+_counters_lock = threading.Lock()
+_counters: Dict[str, Dict[str, int]] = {p: {"requests": 0, "new_connections": 0} for p in PROVIDERS}
+
+
+def _count(provider: str, field: str) -> None:
+    with _counters_lock:
+        _counters.setdefault(provider, {"requests": 0, "new_connections": 0})[field] += 1
+
+
+def _async_hooks(provider: str) -> dict:
+    async def _trace(event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            _count(provider, "new_connections")
+
+    async def _on_request(request: httpx.Request) -> None:
+        _count(provider, "requests")
+        request.extensions["trace"] = _trace
+
+    return {"request": [_on_request]}
+
+
+class _CountingAdapter(HTTPAdapter):
+    """requests adapter that records requests and newly opened urllib3 connections."""
+
+    def __init__(self, provider: str, **kwargs):
+        self.provider = provider
+        super().__init__(**kwargs)
+
+    def _opened(self) -> int:
+        pools = self.poolmanager.pools
+        total = 0
+        for key in list(pools.keys()):
+            try:
+                total += pools[key].num_connections
+            except KeyError:  # evicted concurrently
+                pass
+        return total
+
+    def send(self, request, *args, **kwargs):
+        _count(self.provider, "requests")
+        before = self._opened()
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            if self._opened() > before:
+                _count(self.provider, "new_connections")
+
+
+# ────────────────────────────────
+# Registry
+# ────────────────────────────────
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_sync_sessions: Dict[str, requests.Session] = {}
+_sync_lock = threading.Lock()
+
+
+def _new_async_client(provider: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.http_pool_max_connections,
+        max_keepalive_connections=settings.http_pool_max_keepalive,
+        keepalive_expiry=settings.http_keepalive_expiry_s,
+    )
+    transport = None
+    if provider == "webhooks" and not settings.webhook_allow_private_urls:
+        from app.utils.webhooks import public_only_transport  # lazy import to avoid cycles
+        transport = public_only_transport(limits)
+    return httpx.AsyncClient(
+        timeout=timeout_for(provider),
+        limits=limits,
+        transport=transport,
+        event_hooks=_async_hooks(provider),
+    )
+
+
+def get_async_client(provider: str = "default") -> httpx.AsyncClient:
+    """Return the pooled async client for a provider (created lazily if startup() was skipped)."""
+    client = _async_clients.get(provider)
+    if client is None or client.is_closed:
+        client = _async_clients[provider] = _new_async_client(provider)
+    return client
+
+
+def get_sync_session(provider: str = "default") -> requests.Session:
+    """Return the pooled keep-alive requests.Session for a provider."""
+    with _sync_lock:
+        session = _sync_sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = _CountingAdapter(
+                provider,
+                pool_connections=settings.http_pool_max_keepalive,
+                pool_maxsize=settings.http_pool_max_keepalive,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sync_sessions[provider] = session
+        return session
+
+
+async def startup() -> None:
+    for provider in PROVIDERS:
+        get_async_client(provider)
+    logger.info(f"🌐 HTTP client pools ready: {', '.join(PROVIDERS)}")
+
+
+async def shutdown() -> None:
+    for provider, client in list(_async_clients.items()):
+        if not client.is_closed:
+            await client.aclose()
+    _async_clients.clear()
+    with _sync_lock:
+        for session in _sync_sessions.values():
+            session.close()
+        _sync_sessions.clear()
+    logger.info("🌐 HTTP client pools closed.")
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Per-provider request / connection counters and reuse ratio."""
+    with _counters_lock:
+        out: Dict[str, Dict[str, float]] = {}
+        for provider, c in _counters.items():
+            reused = max(0, c["requests"] - c["new_connections"])
+            out[provider] = {
+                **c,
+                "reused": reused,
+                "reuse_ratio": round(reused / c["requests"], 4) if c["requests"] else 0.0,
+            }
+        return out
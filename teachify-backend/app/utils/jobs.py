@@ -0,0 +1,113 @@
+# app/utils/jobs.py
+"""
+Persistence helpers for background jobs stored in the `jobs` collection.
+Jobs track the stage, progress and final result of long-running work
+(e.g. lecture generation) so clients can submit-and-poll instead of
+holding an HTTP connection open for minutes.
+"""
+
+from __future__ import annotations
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.utils.webhooks import notify_job_finished
+
+logger = logging.getLogger("uvicorn")
+
+
+# ────────────────────────────────
+# Create / Update
+# ────────────────────────────────
+async def create_job(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    job_type: str,
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    queued: bool = False,
+    priority: int = 0,
+    max_attempts: int = 1,
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Insert a new queued job and return its id.
+    `queued=True` hands it to the durable Mongo work queue (see app.utils.queue),
+    where workers claim it by `priority` (higher first) and retry up to `max_attempts`.
+    `extra` adds job-type specific top-level fields (e.g. per-item state of a batch).
+    """
+    now = datetime.utcnow()
+    doc = {
+        "user_id": user_id,
+        "job_type": job_type,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0,
+        "payload": payload or {},
+        "result": {},
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "queued": queued,
+        "priority": priority,
+        "attempts": 0,
+        "max_attempts": max(1, max_attempts),
+        "available_at": now,
+        "lease_until": None,
+        "worker": None,
+        **(extra or {}),
+    }
+    res = await db.jobs.insert_one(doc)
+    job_id = str(res.inserted_id)
+    logger.info(f"🗂️ Job created: {job_id} ({job_type})")
+    return job_id
+
+
+async def update_job(db: AsyncIOMotorDatabase, job_id: str, **fields: Any) -> None:
+    """Best-effort partial update of a job document."""
+    if db is None:
+        return
+    try:
+        fields["updated_at"] = datetime.utcnow()
+        await db.jobs.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+    except Exception as e:  # job tracking must never break the pipeline
+        logger.error(f"❌ Failed to update job {job_id}: {e}")
+
+
+async def mark_job_running(db: AsyncIOMotorDatabase, job_id: str) -> None:
+    await update_job(db, job_id, status="running", stage="starting", progress=1)
+
+
+async def mark_job_progress(db: AsyncIOMotorDatabase, job_id: str, stage: str, progress: int) -> None:
+    await update_job(db, job_id, stage=stage, progress=max(0, min(int(progress), 100)))
+
+
+async def mark_job_succeeded(db: AsyncIOMotorDatabase, job_id: str, result: Dict[str, Any]) -> None:
+    await update_job(db, job_id, status="succeeded", stage="done", progress=100, result=result, error=None)
+    await notify_job_finished(db, job_id)
+
+
+async def mark_job_failed(db: AsyncIOMotorDatabase, job_id: str, error: str, stage: Optional[str] = None) -> None:
+    fields: Dict[str, Any] = {"status": "failed", "error": error}
+    if stage:
+        fields["stage"] = stage
+    await update_job(db, job_id, **fields)
+    await notify_job_finished(db, job_id)
+
+
+# ────────────────────────────────
+# Read
+# ────────────────────────────────
+async def get_job(db: AsyncIOMotorDatabase, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Fetch a job by id, optionally scoped to its owner. Returns None if missing."""
+    try:
+        query: Dict[str, Any] = {"_id": ObjectId(job_id)}
+    except (InvalidId, TypeError):
+        return None
+    if user_id is not None:
+        query["user_id"] = user_id
+    return await db.jobs.find_one(query)
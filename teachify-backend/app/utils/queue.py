@@ -0,0 +1,277 @@
+# app/utils/queue.py
+"""
+Durable work queue on the `jobs` collection (TASKS_DRIVER=mongo).
+
+A job is queued by create_job(..., queued=True). Workers (`python -m app.worker`)
+claim jobs atomically with find_one_and_update — highest priority first, then
+oldest `available_at` — and hold a lease that is extended by a heartbeat while
+the handler runs. If a worker dies, its lease expires (visibility timeout) and
+the job becomes claimable again. Failed attempts are retried with capped
+exponential backoff until `max_attempts`, then the job is marked failed.
+
+Everything survives restarts: the queue state *is* the job document.
+"""
+
+from __future__ import annotations
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+# handler(db, job_doc) → result dict stored on the job (raise to retry / fail)
+JobHandler = Callable[[AsyncIOMotorDatabase, Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def retry_delay(attempt: int) -> float:
+    """Capped exponential backoff after the given (1-based) failed attempt."""
+    return min(settings.queue_backoff_cap_s, settings.queue_backoff_base_s * 2 ** max(0, attempt - 1))
+
+
+# ────────────────────────────────
+# Queue operations
+# ────────────────────────────────
+async def claim_job(
+    db: AsyncIOMotorDatabase,
+    owner: str,
+    job_types: Iterable[str],
+    lease_s: float,
+) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the next runnable job: queued and due, or running with an
+    expired lease (its worker died). Returns the claimed document or None.
+    """
+    now = datetime.utcnow()
+    return await db.jobs.find_one_and_update(
+        {
+            "queued": True,
+            "job_type": {"$in": list(job_types)},
+            "$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {
+                    "status": "running",
+                    "lease_until": {"$lt": now},
+                    "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+                },
+            ],
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker": owner,
+                "lease_until": now + timedelta(seconds=lease_s),
+                "started_at": now,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("priority", -1), ("available_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def reap_expired(db: AsyncIOMotorDatabase) -> int:
+    """Fail jobs whose worker died on their last allowed attempt (never reclaimed by claim_job)."""
+    from app.utils.webhooks import notify_job_finished  # lazy import to avoid cycles
+
+    now = datetime.utcnow()
+    query = {
+        "queued": True,
+        "status": "running",
+        "lease_until": {"$lt": now},
+        "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+    }
+    ids = [doc["_id"] async for doc in db.jobs.find(query, {"_id": 1})]
+    if not ids:
+        return 0
+    res = await db.jobs.update_many(
+        {**query, "_id": {"$in": ids}},
+        {"$set": {
+            "status": "failed",
+            "error": "Worker lost while running the final attempt.",
+            "lease_until": None,
+            "finished_at": now,
+            "updated_at": now,
+        }},
+    )
+    for job_id in ids:
+        await notify_job_finished(db, job_id)
+    return res.modified_count
+
+
+async def extend_lease(db: AsyncIOMotorDatabase, job_id: Any, owner: str, lease_s: float) -> bool:
+    """Push the lease forward; False if another worker has taken the job over."""
+    res = await db.jobs.update_one(
+        {"_id": job_id, "worker": owner, "status": "running"},
+        {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=lease_s)}},
+    )
+    return res.matched_count == 1
+
+
+async def complete_job(db: AsyncIOMotorDatabase, job: Dict[str, Any], owner: str, result: Optional[Dict[str, Any]]) -> None:
+    from app.utils.webhooks import notify_job_finished  # lazy import to avoid cycles
+
+    res = await db.jobs.update_one(
+        {"_id": job["_id"], "worker": owner},
+        {"$set": {
+            "status": "succeeded",
+            "stage": "done",
+            "progress": 100,
+            "result": result or {},
+            "error": None,
+            "lease_until": None,
+            "finished_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        }},
+    )
+    if res.matched_count == 1:  # a worker whose lease was taken over must not notify
+        await notify_job_finished(db, job["_id"])
+
+
+async def fail_or_retry(db: AsyncIOMotorDatabase, job: Dict[str, Any], owner: str, error: str) -> bool:
+    """Requeue with backoff while attempts remain, otherwise mark failed. Returns True if requeued."""
+    from app.utils.webhooks import notify_job_finished  # lazy import to avoid cycles
+
+    attempts = int(job.get("attempts") or 1)
+    max_attempts = int(job.get("max_attempts") or 1)
+    now = datetime.utcnow()
+    if attempts < max_attempts:
+        delay = retry_delay(attempts)
+        await db.jobs.update_one(
+            {"_id": job["_id"], "worker": owner},
+            {"$set": {
+                "status": "queued",
+                "stage": "retrying",
+                "error": error,
+                "available_at": now + timedelta(seconds=delay),
+                "lease_until": None,
+                "worker": None,
+                "updated_at": now,
+            }},
+        )
+        logger.warning(f"🔁 Job {job['_id']} attempt {attempts}/{max_attempts} failed — retrying in {delay:.0f}s: {error}")
+        return True
+    res = await db.jobs.update_one(
+        {"_id": job["_id"], "worker": owner},
+        {"$set": {
+            "status": "failed",
+            "error": error,
+            "lease_until": None,
+            "finished_at": now,
+            "updated_at": now,
+        }},
+    )
+    if res.matched_count != 1:
+        logger.warning(f"⚠️ Job {job['_id']} was taken over by another worker — dropping its failure.")
+        return False
+    logger.error(f"❌ Job {job['_id']} failed after {attempts} attempt(s): {error}")
+    await notify_job_finished(db, job["_id"])
+    return False
+
+
+# ────────────────────────────────
+# Worker
+# ────────────────────────────────
+class QueueWorker:
+    """Claims and runs jobs for the registered job types with bounded concurrency."""
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        handlers: Dict[str, JobHandler],
+        *,
+        concurrency: Optional[int] = None,
+        lease_s: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        self.db = db
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency or settings.queue_worker_concurrency)
+        self.lease_s = lease_s or settings.queue_lease_s
+        self.poll_interval = poll_interval or settings.queue_poll_interval_s
+        self.owner = worker_id()
+        self._running: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    async def _heartbeat(self, job_id: Any) -> None:
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                if not await extend_lease(self.db, job_id, self.owner, self.lease_s):
+                    logger.warning(f"⚠️ Lost lease on job {job_id}")
+                    return
+            except Exception as e:
+                logger.warning(f"⚠️ Lease heartbeat failed for job {job_id}: {e}")
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        handler = self.handlers[job["job_type"]]
+        beat = asyncio.create_task(self._heartbeat(job["_id"]))
+        try:
+            result = await handler(self.db, job)
+        except asyncio.CancelledError:
+            # shutting down mid-job: release it for another worker without burning an attempt
+            await self.db.jobs.update_one(
+                {"_id": job["_id"], "worker": self.owner},
+                {"$set": {"status": "queued", "worker": None, "lease_until": None,
+                          "available_at": datetime.utcnow()},
+                 "$inc": {"attempts": -1}},
+            )
+            raise
+        except Exception as e:
+            await fail_or_retry(self.db, job, self.owner, getattr(e, "detail", None) or str(e) or type(e).__name__)
+        else:
+            await complete_job(self.db, job, self.owner, result)
+            logger.info(f"✅ Job {job['_id']} ({job['job_type']}) succeeded on attempt {job.get('attempts')}")
+        finally:
+            beat.cancel()
+
+    async def run(self) -> None:
+        logger.info(
+            f"👷 Queue worker {self.owner} started: types={sorted(self.handlers)} concurrency={self.concurrency}"
+        )
+        while not self._stopping.is_set():
+            if len(self._running) >= self.concurrency:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                job = await claim_job(self.db, self.owner, self.handlers.keys(), self.lease_s)
+            except Exception as e:
+                logger.error(f"❌ Failed to claim job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await reap_expired(self.db)
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to reap expired jobs: {e}")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            logger.info(f"📥 Claimed job {job['_id']} ({job['job_type']}, attempt {job.get('attempts')})")
+            task = asyncio.create_task(self._execute(job), name=f"job-{job['_id']}")
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def stop(self, grace_s: float = 30.0) -> None:
+        """Stop claiming; wait for running jobs up to `grace_s`, then release them back to the queue."""
+        self._stopping.set()
+        if self._running:
+            _done, pending = await asyncio.wait(self._running, timeout=grace_s)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info(f"👷 Queue worker {self.owner} stopped.")
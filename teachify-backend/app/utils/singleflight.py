@@ -0,0 +1,221 @@
+# app/utils/singleflight.py
+"""
+Single-flight coalescing of identical in-flight requests, shared across processes.
+
+The first caller for a key becomes the leader (atomic insert into the
+`inflight` collection) and runs the work; concurrent callers with the same key
+— in this worker or any other uvicorn worker/pod — wait for the leader's
+result instead of starting a duplicate pipeline. Leaders hold a heartbeated
+lease so a crashed leader is taken over by a waiting follower.
+
+Only successful results are shared with late duplicates (RESULT_TTL_SECONDS).
+A failure is reported to the followers that were already waiting on that
+flight and then released immediately, so retries run the work again; a
+cancelled leader releases the key without publishing anything.
+
+The work function must return a JSON/BSON-serializable dict.
+"""
+
+from __future__ import annotations
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger("uvicorn")
+
+LEASE_SECONDS = 60          # leader must heartbeat within this window
+RESULT_TTL_SECONDS = 30     # late duplicates (e.g. double-click) still share a successful result
+POLL_INTERVAL = 1.0
+WAIT_TIMEOUT_SECONDS = 3600
+
+_OWNER = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_local_waiters: Dict[str, asyncio.Future] = {}
+
+
+class SingleFlightFailed(Exception):
+    """Raised in followers when the leader's execution failed; message is the leader's error."""
+
+
+class _LeaderCancelled(Exception):
+    """Set on the local future when the leader was cancelled: followers retry the flight themselves."""
+
+
+def flight_key(*parts: Any) -> str:
+    """Stable key from the identifying parts of a request."""
+    material = "\x1f".join(str(p) for p in parts)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)  # Mongo returns naive UTC datetimes
+    return dt
+
+
+# ────────────────────────────────
+# Lease handling
+# ────────────────────────────────
+async def _try_claim(db: AsyncIOMotorDatabase, key: str) -> bool:
+    """Atomically become leader for `key` (new key, expired result, or lapsed lease)."""
+    now = _now()
+    lease = {
+        "owner": _OWNER,
+        "flight": uuid.uuid4().hex,  # identifies this execution, so followers only see their own flight's failure
+        "status": "running",
+        "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+        "expires_at": now + timedelta(seconds=WAIT_TIMEOUT_SECONDS),
+        "result": None,
+        "error": None,
+        "updated_at": now,
+    }
+    try:
+        await db.inflight.insert_one({"key": key, "created_at": now, **lease})
+        return True
+    except DuplicateKeyError:
+        pass
+    # Take over a dead leader's lease, or recycle a finished entry past its TTL
+    taken = await db.inflight.find_one_and_update(
+        {
+            "key": key,
+            "$or": [
+                {"status": "running", "lease_until": {"$lt": now}},
+                {"status": {"$in": ["done", "failed"]}, "expires_at": {"$lt": now}},
+            ],
+        },
+        {"$set": lease},
+    )
+    if taken:
+        logger.warning(f"🔁 Took over single-flight key {key[:12]} (previous owner {taken.get('owner')})")
+    return taken is not None
+
+
+async def _heartbeat(db: AsyncIOMotorDatabase, key: str) -> None:
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        try:
+            await db.inflight.update_one(
+                {"key": key, "owner": _OWNER, "status": "running"},
+                {"$set": {"lease_until": _now() + timedelta(seconds=LEASE_SECONDS), "updated_at": _now()}},
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Single-flight heartbeat failed for {key[:12]}: {e}")
+
+
+async def _finish(db: AsyncIOMotorDatabase, key: str, *, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+    """Publish the outcome. Failures expire at once: waiting followers read them, new callers re-run."""
+    now = _now()
+    try:
+        await db.inflight.update_one(
+            {"key": key, "owner": _OWNER},
+            {"$set": {
+                "status": "failed" if error else "done",
+                "result": result,
+                "error": error,
+                "updated_at": now,
+                "expires_at": now if error else now + timedelta(seconds=RESULT_TTL_SECONDS),
+            }},
+        )
+    except Exception as e:
+        logger.error(f"❌ Failed to publish single-flight result for {key[:12]}: {e}")
+
+
+async def _release(db: AsyncIOMotorDatabase, key: str) -> None:
+    try:
+        await db.inflight.delete_one({"key": key, "owner": _OWNER, "status": "running"})
+    except Exception as e:
+        logger.error(f"❌ Failed to release single-flight key {key[:12]}: {e}")
+
+
+# ────────────────────────────────
+# Public API
+# ────────────────────────────────
+async def run_single_flight(
+    db: Optional[AsyncIOMotorDatabase],
+    key: str,
+    fn: Callable[[], Awaitable[Dict[str, Any]]],
+    *,
+    error_message: Callable[[BaseException], str] = str,
+) -> Dict[str, Any]:
+    """
+    Run `fn` once per key across all workers and return its result to every caller.
+    The leader re-raises its own exception; followers raise SingleFlightFailed
+    carrying `error_message(exc)` as published by the leader.
+    """
+    if db is None:
+        return await fn()
+
+    # Same-process duplicates: await the local leader directly, no polling
+    local = _local_waiters.get(key)
+    if local is not None:
+        logger.info(f"🤝 Coalesced duplicate request onto local flight {key[:12]}")
+        try:
+            return await asyncio.shield(local)
+        except _LeaderCancelled:
+            pass  # the leader went away without a result: claim the key below
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WAIT_TIMEOUT_SECONDS
+    waiting_on: Optional[str] = None
+    while loop.time() < deadline:
+        doc = await db.inflight.find_one({"key": key})
+        if doc:
+            status = doc.get("status")
+            expired = _as_aware(doc.get("expires_at"))
+            if status == "done" and (expired is None or expired >= _now()):
+                logger.info(f"🤝 Coalesced duplicate request onto flight {key[:12]}")
+                return doc.get("result") or {}
+            if status == "failed" and waiting_on is not None and doc.get("flight") == waiting_on:
+                raise SingleFlightFailed(doc.get("error") or "Coalesced request failed.")
+
+        if await _try_claim(db, key):
+            return await _lead(db, key, fn, error_message)
+        doc = await db.inflight.find_one({"key": key})
+        if doc and doc.get("status") == "running":
+            waiting_on = doc.get("flight")
+        await asyncio.sleep(POLL_INTERVAL)
+
+    raise SingleFlightFailed("Timed out waiting for an identical in-flight request.")
+
+
+async def _lead(
+    db: AsyncIOMotorDatabase,
+    key: str,
+    fn: Callable[[], Awaitable[Dict[str, Any]]],
+    error_message: Callable[[BaseException], str],
+) -> Dict[str, Any]:
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    future.add_done_callback(lambda f: f.exception() if not f.cancelled() else None)  # silence unretrieved
+    _local_waiters[key] = future
+    beat = asyncio.create_task(_heartbeat(db, key))
+    try:
+        result = await fn()
+    except Exception as e:
+        message = error_message(e)
+        await _finish(db, key, result=None, error=message)
+        if not future.done():
+            future.set_exception(SingleFlightFailed(message))
+        raise
+    except BaseException:  # cancelled: nothing to share, let a follower run it
+        await _release(db, key)
+        if not future.done():
+            future.set_exception(_LeaderCancelled())
+        raise
+    else:
+        await _finish(db, key, result=result, error=None)
+        if not future.done():
+            future.set_result(result)
+        return result
+    finally:
+        beat.cancel()
+        _local_waiters.pop(key, None)
@@ -0,0 +1,74 @@
+# app/utils/sse.py
+"""
+Server-Sent Events helpers.
+
+`sse_events(run)` starts `run(emit)` as a background task and yields every
+`emit(event, data)` call as an SSE frame. The task is not tied to the HTTP
+connection: if the client disconnects, the work still finishes (and is
+persisted) — the stream just stops being written.
+"""
+
+from __future__ import annotations
+import json
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.utils.tasks import spawn
+
+logger = logging.getLogger("uvicorn")
+
+KEEPALIVE_SECONDS = 15.0
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # disable proxy buffering (nginx)
+}
+
+Emit = Callable[[str, Dict[str, Any]], None]
+
+
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Encode one SSE frame (JSON payload on a single data line)."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_events(
+    run: Callable[[Emit], Awaitable[None]],
+    *,
+    name: str = "sse-stream",
+    keepalive_s: float = KEEPALIVE_SECONDS,
+) -> AsyncIterator[str]:
+    """Run `run(emit)` in the background and stream its events until it returns."""
+    queue: "asyncio.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = asyncio.Queue()
+
+    def emit(event: str, data: Dict[str, Any]) -> None:
+        queue.put_nowait((event, data))
+
+    async def _runner() -> None:
+        try:
+            await run(emit)
+        except Exception as e:
+            logger.error(f"❌ {name} failed: {e}")
+            emit("error", {"detail": "Lecture generation failed."})
+        finally:
+            queue.put_nowait(None)
+
+    spawn(_runner(), name=name)
+
+    event_id = 0
+    while True:
+        try:
+            item = await asyncio.wait_for(queue.get(), timeout=keepalive_s)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+        if item is None:
+            return
+        event_id += 1
+        yield format_sse(item[0], item[1], event_id)
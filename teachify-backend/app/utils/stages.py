@@ -0,0 +1,165 @@
+# app/utils/stages.py
+"""
+Minimal async DAG executor for multi-stage pipelines.
+
+Stages declare their dependencies once; every stage starts as soon as all of
+its dependencies have finished, so independent stages run concurrently.
+Each stage gets an optional timeout and retry budget, and may share a
+semaphore (`slots`) with the same stage of other pipelines to cap how many
+of them run at once.
+
+Usage:
+    pipeline = StagePipeline([
+        Stage("content", make_content),
+        Stage("visuals", make_visuals, deps=("content",)),
+        Stage("avatar", make_avatar, deps=("content",), timeout=900, retries=1),
+    ])
+    results = await pipeline.run()
+
+A stage function receives the dict of results produced so far and returns its own result.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger("uvicorn")
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+StageHook = Callable[[str], Awaitable[None]]
+ResultHook = Callable[[str, Any], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    func: StageFunc
+    deps: Sequence[str] = ()
+    timeout: Optional[float] = None   # seconds per attempt; None = unbounded
+    retries: int = 0                  # extra attempts after the first failure
+    retry_backoff: float = 2.0        # base seconds, doubled per attempt
+    slots: Optional[asyncio.Semaphore] = None  # shared cap, held per attempt (waiting is not timed)
+
+
+class StageError(Exception):
+    """Raised when a stage exhausts its attempts; wraps the last underlying error."""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+class StagePipeline:
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for st in stages:
+            if st.name in self.stages:
+                raise ValueError(f"Duplicate stage name: {st.name}")
+            self.stages[st.name] = st
+        self._validate()
+
+    # ────────────────────────────────
+    # Validation
+    # ────────────────────────────────
+    def _validate(self) -> None:
+        for st in self.stages.values():
+            for dep in st.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{st.name}' depends on unknown stage '{dep}'")
+        # Kahn's algorithm to reject cycles up front
+        indegree = {name: len(st.deps) for name, st in self.stages.items()}
+        ready = [name for name, n in indegree.items() if n == 0]
+        seen = 0
+        while ready:
+            name = ready.pop()
+            seen += 1
+            for other in self.stages.values():
+                if name in other.deps:
+                    indegree[other.name] -= 1
+                    if indegree[other.name] == 0:
+                        ready.append(other.name)
+        if seen != len(self.stages):
+            raise ValueError("Stage graph contains a cycle")
+
+    # ────────────────────────────────
+    # Execution
+    # ────────────────────────────────
+    async def _run_stage(self, st: Stage, results: Dict[str, Any]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                async with AsyncExitStack() as stack:
+                    if st.slots is not None:
+                        await stack.enter_async_context(st.slots)
+                    coro = st.func(results)
+                    if st.timeout:
+                        return await asyncio.wait_for(coro, timeout=st.timeout)
+                    return await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= st.retries:
+                    raise StageError(st.name, e) from e
+                wait = st.retry_backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning(
+                    f"⚠️ Stage '{st.name}' failed (attempt {attempt}/{st.retries + 1}): {e} — retrying in {wait:.1f}s"
+                )
+                await asyncio.sleep(wait)
+
+    async def run(
+        self,
+        initial: Optional[Dict[str, Any]] = None,
+        *,
+        on_start: Optional[StageHook] = None,
+        on_done: Optional[StageHook] = None,
+        on_result: Optional[ResultHook] = None,
+    ) -> Dict[str, Any]:
+        """
+        Execute all stages and return {stage_name: result} (merged over `initial`).
+        Names already present in `initial` are treated as completed and skipped.
+        `on_result(name, value)` sees each newly produced result (e.g. to checkpoint it).
+        On the first failure, running stages are cancelled and StageError is raised.
+        """
+        results: Dict[str, Any] = dict(initial or {})
+        pending = {name: st for name, st in self.stages.items() if name not in results}
+        running: Dict[asyncio.Task, str] = {}
+
+        async def _execute(st: Stage) -> Any:
+            if on_start:
+                await on_start(st.name)
+            value = await self._run_stage(st, results)
+            logger.debug(f"✅ Stage '{st.name}' complete")
+            return value
+
+        try:
+            while pending or running:
+                launchable: List[Stage] = [
+                    st for st in pending.values() if all(d in results for d in st.deps)
+                ]
+                for st in launchable:
+                    del pending[st.name]
+                    running[asyncio.create_task(_execute(st), name=f"stage-{st.name}")] = st.name
+
+                if not running:
+                    raise RuntimeError(f"Unschedulable stages: {sorted(pending)}")
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    results[name] = task.result()  # re-raises StageError
+                    if on_result:
+                        await on_result(name, results[name])
+                    if on_done:
+                        await on_done(name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.keys(), return_exceptions=True)
+
+        return results
@@ -6,22 +6,26 @@ Usage:
 - Inline (default): runs tasks synchronously (good for dev)
 - Threaded: runs tasks in a background thread pool
 - Celery: if Celery is installed and broker is configured, tasks are enqueued to Celery
+- Mongo: async jobs (lecture generation) go to the durable queue on the `jobs`
+  collection and are executed by separate `python -m app.worker` processes
+  (see app/utils/queue.py); sync enqueue() calls run inline.
 
 Configure via env:
-  TASKS_DRIVER=inline | thread | celery
+  TASKS_DRIVER=inline | thread | celery | mongo
   CELERY_BROKER_URL=redis://localhost:6379/0
   CELERY_RESULT_BACKEND=redis://localhost:6379/0
 """
 
 from __future__ import annotations
 import os
+import asyncio
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
 
 logger = logging.getLogger("uvicorn")
 
-TASKS_DRIVER = os.getenv("TASKS_DRIVER", "inline").lower()  # inline | thread | celery
+TASKS_DRIVER = os.getenv("TASKS_DRIVER", "inline").lower()  # inline | thread | celery | mongo
 
 # Optional Celery wiring
 CELERY_AVAILABLE = False
@@ -80,6 +84,35 @@ def enqueue(func: Callable, *args: Any, **kwargs: Any) -> Any:
     return func(*args, **kwargs)
 
 
+def uses_durable_queue() -> bool:
+    """True when async jobs are handed to `python -m app.worker` instead of this process."""
+    return TASKS_DRIVER == "mongo"
+
+
+# Strong references to in-flight background coroutines (asyncio only keeps weak refs)
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Awaitable[Any], *, name: Optional[str] = None) -> asyncio.Task:
+    """
+    Schedule a coroutine on the running event loop without awaiting it.
+    Used for async pipelines (e.g. lecture jobs) that must outlive the request.
+    """
+    task = asyncio.ensure_future(coro)
+    if name:
+        task.set_name(name)
+    _background_tasks.add(task)
+
+    def _done(t: asyncio.Task) -> None:
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            logger.error(f"❌ Background task {t.get_name()} failed: {t.exception()}")
+
+    task.add_done_callback(_done)
+    logger.debug(f"🌀 Spawned background task: {task.get_name()}")
+    return task
+
+
 # Convenience wrappers for your pipeline (optional sugar)
 def enqueue_generate_visuals(content_dict: Dict) -> Any:
     """
@@ -0,0 +1,498 @@
+# app/utils/webhooks.py
+"""
+Completion webhooks for generation jobs.
+
+When a lecture (or batch) job reaches a terminal state, a delivery document is
+written to `webhook_deliveries` — for the callback URL given with the request,
+or else the account's registered endpoint (`webhook_endpoints`). A dispatcher
+running in every API and queue-worker process claims due deliveries with a lease,
+POSTs the JSON payload and records each attempt in the delivery's log. Failed
+attempts are retried with capped exponential backoff until
+`settings.webhook_max_attempts`; since the state lives in Mongo, pending
+deliveries survive restarts.
+
+Every request carries:
+    X-Teachify-Event:      lecture.completed | lecture.failed | batch.completed | batch.failed | ping
+    X-Teachify-Delivery:   delivery id (stable across retries — use it to deduplicate)
+    X-Teachify-Signature:  t=<unix ts>,v1=<hex HMAC-SHA256(secret, "<ts>." + raw body)>
+
+Receivers verify the signature with `verify_signature` (or the same few lines
+in their own stack) using the account's webhook secret.
+
+Callback hosts must resolve only to public addresses. The check runs when a URL
+is registered and again on every connect, against the address actually dialed,
+so DNS rebinding cannot point a delivery at internal services
+(settings.webhook_allow_private_urls lifts this for local development).
+"""
+
+from __future__ import annotations
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import socket
+import secrets
+import ipaddress
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+import httpx
+import httpcore
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.config import settings
+from app.utils import http_clients
+from app.utils.queue import worker_id
+
+logger = logging.getLogger("uvicorn")
+
+SIGNATURE_HEADER = "X-Teachify-Signature"
+EVENT_HEADER = "X-Teachify-Event"
+DELIVERY_HEADER = "X-Teachify-Delivery"
+
+# Per-delivery attempt log is capped to the most recent entries
+_LOG_LIMIT = 20
+
+
+# ────────────────────────────────
+# Signing
+# ────────────────────────────────
+def new_secret() -> str:
+    return "whsec_" + secrets.token_urlsafe(32)
+
+
+def sign_payload(secret: str, body: bytes, timestamp: Optional[int] = None) -> str:
+    ts = int(time.time()) if timestamp is None else int(timestamp)
+    digest = hmac.new(secret.encode(), f"{ts}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={digest}"
+
+
+def verify_signature(secret: str, body: bytes, header: str, *, tolerance_s: int = 300) -> bool:
+    """Check an X-Teachify-Signature header; rejects signatures older than `tolerance_s`."""
+    try:
+        parts = dict(item.split("=", 1) for item in header.split(","))
+        ts = int(parts["t"])
+    except (ValueError, KeyError):
+        return False
+    if tolerance_s and abs(time.time() - ts) > tolerance_s:
+        return False
+    expected = sign_payload(secret, body, ts).split("v1=", 1)[1]
+    return hmac.compare_digest(expected, parts.get("v1", ""))
+
+
+def _blocked_address(ip: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> bool:
+    ip = getattr(ip, "ipv4_mapped", None) or ip
+    return (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+            or ip.is_multicast or ip.is_unspecified or not ip.is_global)
+
+
+def _public_addresses(host: str, infos: List[tuple]) -> List[str]:
+    """IPs from getaddrinfo results; raises ValueError if any of them is not a public address."""
+    addrs = list(dict.fromkeys(info[4][0].split("%", 1)[0] for info in infos))
+    if not addrs:
+        raise ValueError(f"Callback host {host} did not resolve.")
+    for addr in addrs:
+        if _blocked_address(ipaddress.ip_address(addr)):
+            raise ValueError(f"Callback host {host} resolves to a non-public address ({addr}).")
+    return addrs
+
+
+def _check_url_shape(url: str) -> Tuple[str, str, int]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("Callback URL must be an absolute http(s) URL.")
+    host = parts.hostname
+    if not settings.webhook_allow_private_urls and (host == "localhost" or host.endswith(".localhost")):
+        raise ValueError("Callback URL must not point to a private address.")
+    return url, host, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+def validate_callback_url(url: str) -> str:
+    """
+    Return the normalized URL or raise ValueError: http(s) only, and unless
+    settings.webhook_allow_private_urls, every address the host resolves to
+    must be public. Blocks on DNS — use `check_callback_url` from async code.
+    Delivery re-checks at connect time (see `_PublicOnlyBackend`).
+    """
+    url, host, port = _check_url_shape((url or "").strip())
+    if not settings.webhook_allow_private_urls:
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            raise ValueError(f"Callback host {host} did not resolve.")
+        _public_addresses(host, infos)
+    return url
+
+
+async def check_callback_url(url: str) -> str:
+    return await asyncio.to_thread(validate_callback_url, url)
+
+
+async def _resolve(host: str, port: int) -> List[tuple]:
+    return await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+
+
+class _PublicOnlyBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend for webhook deliveries: resolves the host itself, refuses
+    to connect if any address is non-public, and connects to the address it
+    checked — so a DNS answer that changes between validation and connect
+    (rebinding) cannot reach internal services. TLS SNI and the Host header
+    still use the URL's hostname.
+    """
+
+    def __init__(self):
+        self._inner = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addrs = _public_addresses(host, await _resolve(host, port))
+        except (OSError, UnicodeError, ValueError) as e:
+            raise httpcore.ConnectError(str(e)) from e
+        last: Optional[Exception] = None
+        for addr in addrs:
+            try:
+                return await self._inner.connect_tcp(
+                    addr, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last = e
+        raise last
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("Unix sockets are not allowed for webhooks.")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._inner.sleep(seconds)
+
+
+def public_only_transport(limits: httpx.Limits) -> httpx.AsyncHTTPTransport:
+    """
+    httpx transport for the "webhooks" client (see app.utils.http_clients).
+    httpx has no public network-backend option, so the backend is set on the
+    transport's httpcore pool; httpx/httpcore are pinned in requirements.txt
+    and this refuses to build the client rather than run without the guard.
+    """
+    transport = httpx.AsyncHTTPTransport(limits=limits)
+    pool = getattr(transport, "_pool", None)
+    if not isinstance(pool, httpcore.AsyncConnectionPool) or not hasattr(pool, "_network_backend"):
+        raise RuntimeError("Unsupported httpx/httpcore version: cannot install the webhook SSRF guard.")
+    pool._network_backend = _PublicOnlyBackend()
+    return transport
+
+
+def retry_delay(attempt: int) -> float:
+    """Capped exponential backoff after the given (1-based) failed attempt."""
+    return min(settings.webhook_backoff_cap_s, settings.webhook_backoff_base_s * 2 ** max(0, attempt - 1))
+
+
+# ────────────────────────────────
+# Account endpoints
+# ────────────────────────────────
+async def get_endpoint(db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+    return await db.webhook_endpoints.find_one({"user_id": user_id})
+
+
+async def ensure_endpoint(db: AsyncIOMotorDatabase, user_id: str) -> Dict[str, Any]:
+    """Return the account's endpoint document, creating one (no URL, fresh secret) if missing."""
+    now = datetime.utcnow()
+    return await db.webhook_endpoints.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {"user_id": user_id, "url": None, "secret": new_secret(),
+                          "created_at": now, "updated_at": now}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def set_endpoint(
+    db: AsyncIOMotorDatabase, user_id: str, url: Optional[str], *, rotate_secret: bool = False
+) -> Dict[str, Any]:
+    await ensure_endpoint(db, user_id)
+    fields: Dict[str, Any] = {"url": url, "updated_at": datetime.utcnow()}
+    if rotate_secret:
+        fields["secret"] = new_secret()
+    return await db.webhook_endpoints.find_one_and_update(
+        {"user_id": user_id}, {"$set": fields}, return_document=ReturnDocument.AFTER
+    )
+
+
+# ────────────────────────────────
+# Enqueue
+# ────────────────────────────────
+async def enqueue_delivery(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    url: str,
+    event: str,
+    data: Dict[str, Any],
+    *,
+    job_id: Optional[str] = None,
+) -> str:
+    """Persist a pending delivery; the dispatcher sends it on its next pass."""
+    await ensure_endpoint(db, user_id)  # every account that receives webhooks has a secret
+    now = datetime.utcnow()
+    delivery_id = ObjectId()
+    payload = {
+        "id": str(delivery_id),
+        "event": event,
+        "created_at": now.isoformat() + "Z",
+        "data": data,
+    }
+    await db.webhook_deliveries.insert_one({
+        "_id": delivery_id,
+        "user_id": user_id,
+        "job_id": job_id,
+        "url": url,
+        "event": event,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "max_attempts": max(1, settings.webhook_max_attempts),
+        "next_attempt_at": now,
+        "lease_until": None,
+        "owner": None,
+        "last_status_code": None,
+        "last_error": None,
+        "log": [],
+        "created_at": now,
+        "updated_at": now,
+        "delivered_at": None,
+        "expires_at": now + timedelta(days=settings.webhook_log_ttl_days),
+    })
+    logger.info(f"📮 Webhook {event} queued for {url} (delivery {delivery_id})")
+    return str(delivery_id)
+
+
+def _job_event(job: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    job_type = job.get("job_type", "generation")
+    ok = job.get("status") == "succeeded"
+    data: Dict[str, Any] = {
+        "job_id": str(job["_id"]),
+        "job_type": job_type,
+        "status": job.get("status"),
+        "error": job.get("error"),
+        "prompt": (job.get("payload") or {}).get("prompt"),
+    }
+    if job_type == "batch":
+        data["items"] = [
+            {k: item.get(k) for k in ("index", "prompt", "status", "error", "topic", "video_path")}
+            for item in job.get("items") or []
+        ]
+        prefix = "batch"
+    else:
+        data["lecture"] = (job.get("result") or {}).get("lecture")
+        prefix = "lecture"
+    return f"{prefix}.{'completed' if ok else 'failed'}", data
+
+
+async def notify_job_finished(db: AsyncIOMotorDatabase, job_id: Any) -> None:
+    """
+    Queue the completion webhook for a job that just reached a terminal state.
+    Uses the per-request callback URL if one was given, else the account endpoint.
+    Best-effort: never raises into the job runner.
+    """
+    if db is None or not settings.webhooks_enabled:
+        return
+    try:
+        oid = job_id if isinstance(job_id, ObjectId) else ObjectId(str(job_id))
+        job = await db.jobs.find_one({"_id": oid})
+        if not job or job.get("status") not in ("succeeded", "failed"):
+            return
+        url = (job.get("payload") or {}).get("callback_url")
+        if not url:
+            endpoint = await get_endpoint(db, job["user_id"])
+            url = (endpoint or {}).get("url")
+        if not url:
+            return
+        event, data = _job_event(job)
+        await enqueue_delivery(db, job["user_id"], url, event, data, job_id=str(oid))
+    except Exception as e:
+        logger.error(f"❌ Failed to queue webhook for job {job_id}: {e}")
+
+
+# ────────────────────────────────
+# Delivery
+# ────────────────────────────────
+def encode_payload(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), default=str).encode()
+
+
+async def send_webhook(
+    url: str, secret: str, event: str, delivery_id: str, body: bytes
+) -> Tuple[Optional[int], Optional[str], float]:
+    """POST one signed delivery. Returns (status_code, error, elapsed_ms); error is None on 2xx."""
+    headers = {
+        "Content-Type": "application/json",
+        "User-Agent": "Teachify-Webhooks/1.0",
+        EVENT_HEADER: event,
+        DELIVERY_HEADER: delivery_id,
+        SIGNATURE_HEADER: sign_payload(secret, body),
+    }
+    try:
+        _check_url_shape(url)
+    except ValueError as e:
+        return None, str(e), 0.0
+    started = time.perf_counter()
+    try:
+        # the "webhooks" client only connects to public addresses, checked at connect time
+        resp = await http_clients.get_async_client("webhooks").post(
+            url, content=body, headers=headers, timeout=settings.webhook_timeout_s, follow_redirects=False
+        )
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", (time.perf_counter() - started) * 1000
+    elapsed = (time.perf_counter() - started) * 1000
+    if 200 <= resp.status_code < 300:
+        return resp.status_code, None, elapsed
+    return resp.status_code, f"HTTP {resp.status_code}: {resp.text[:200]}", elapsed
+
+
+async def claim_delivery(db: AsyncIOMotorDatabase, owner: str, lease_s: float) -> Optional[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return await db.webhook_deliveries.find_one_and_update(
+        {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lt": now}},  # dispatcher died mid-send
+            ],
+        },
+        {"$set": {"status": "sending", "owner": owner, "lease_until": now + timedelta(seconds=lease_s),
+                  "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def attempt_delivery(db: AsyncIOMotorDatabase, delivery: Dict[str, Any], owner: str) -> bool:
+    """Send a claimed delivery and record the attempt. Returns True when delivered."""
+    endpoint = await get_endpoint(db, delivery["user_id"])
+    secret = (endpoint or {}).get("secret") or ""
+    body = encode_payload(delivery["payload"])
+    status_code, error, elapsed_ms = await send_webhook(
+        delivery["url"], secret, delivery["event"], str(delivery["_id"]), body
+    )
+    now = datetime.utcnow()
+    attempts = int(delivery.get("attempts") or 1)
+    entry = {"attempt": attempts, "at": now, "status_code": status_code, "error": error,
+             "duration_ms": round(elapsed_ms, 1)}
+    fields: Dict[str, Any] = {"last_status_code": status_code, "last_error": error,
+                              "lease_until": None, "owner": None, "updated_at": now}
+    if error is None:
+        fields.update({"status": "delivered", "delivered_at": now})
+        logger.info(f"📬 Webhook {delivery['event']} delivered to {delivery['url']} ({status_code}, {elapsed_ms:.0f} ms)")
+    elif attempts < int(delivery.get("max_attempts") or 1):
+        delay = retry_delay(attempts)
+        fields.update({"status": "pending", "next_attempt_at": now + timedelta(seconds=delay)})
+        logger.warning(f"🔁 Webhook delivery {delivery['_id']} attempt {attempts} failed — retrying in {delay:.0f}s: {error}")
+    else:
+        fields["status"] = "failed"
+        logger.error(f"❌ Webhook delivery {delivery['_id']} gave up after {attempts} attempt(s): {error}")
+
+    await db.webhook_deliveries.update_one(
+        {"_id": delivery["_id"], "owner": owner},
+        {"$set": fields, "$push": {"log": {"$each": [entry], "$slice": -_LOG_LIMIT}}},
+    )
+    return error is None
+
+
+async def redeliver(db: AsyncIOMotorDatabase, delivery_id: str, user_id: str) -> bool:
+    """Reset a delivery so the dispatcher sends it again with a fresh attempt budget."""
+    try:
+        oid = ObjectId(delivery_id)
+    except (InvalidId, TypeError):
+        return False
+    now = datetime.utcnow()
+    res = await db.webhook_deliveries.update_one(
+        {"_id": oid, "user_id": user_id, "status": {"$ne": "sending"}},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": now, "updated_at": now,
+                  "expires_at": now + timedelta(days=settings.webhook_log_ttl_days)}},
+    )
+    return res.matched_count == 1
+
+
+async def list_deliveries(db: AsyncIOMotorDatabase, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    cursor = db.webhook_deliveries.find({"user_id": user_id}).sort("created_at", -1).limit(max(1, min(limit, 200)))
+    return [doc async for doc in cursor]
+
+
+# ────────────────────────────────
+# Dispatcher
+# ────────────────────────────────
+class WebhookDispatcher:
+    """Background loop that sends due deliveries with bounded concurrency."""
+
+    def __init__(self, db: AsyncIOMotorDatabase, *, concurrency: int = 4,
+                 lease_s: Optional[float] = None, poll_interval: Optional[float] = None):
+        self.db = db
+        self.concurrency = max(1, concurrency)
+        self.lease_s = lease_s or max(settings.webhook_timeout_s * 3, 30)
+        self.poll_interval = poll_interval or settings.webhook_poll_interval_s
+        self.owner = worker_id()
+        self._running: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def _send(self, delivery: Dict[str, Any]) -> None:
+        try:
+            await attempt_delivery(self.db, delivery, self.owner)
+        except Exception as e:  # the lease expires and another pass retries it
+            logger.error(f"❌ Webhook delivery {delivery['_id']} crashed: {e}")
+
+    async def _loop(self) -> None:
+        while not self._stopping.is_set():
+            if len(self._running) >= self.concurrency:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                delivery = await claim_delivery(self.db, self.owner, self.lease_s)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to claim webhook delivery: {e}")
+                delivery = None
+            if delivery is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._send(delivery), name=f"webhook-{delivery['_id']}")
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="webhook-dispatcher")
+            logger.info(f"📮 Webhook dispatcher {self.owner} started.")
+
+    async def stop(self, grace_s: float = 5.0) -> None:
+        self._stopping.set()
+        if self._running:
+            await asyncio.wait(self._running, timeout=grace_s)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._running, return_exceptions=True)
+            self._task = None
+
+
+_dispatcher: Optional[WebhookDispatcher] = None
+
+
+def start_webhook_dispatcher(db: AsyncIOMotorDatabase) -> None:
+    """Start this process's dispatcher (called on API / worker startup)."""
+    global _dispatcher
+    if _dispatcher is None and settings.webhooks_enabled:
+        _dispatcher = WebhookDispatcher(db, concurrency=settings.webhook_concurrency)
+        _dispatcher.start()
+
+
+async def stop_webhook_dispatcher() -> None:
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+        _dispatcher = None
@@ -0,0 +1,77 @@
+# app/worker.py
+"""
+Queue worker process for the durable Mongo work queue.
+
+    TASKS_DRIVER=mongo uvicorn app.main:app        # API pods only enqueue
+    python -m app.worker --concurrency 2           # generation workers, scaled separately
+
+Workers claim jobs from the `jobs` collection (see app/utils/queue.py) and
+shut down gracefully on SIGINT/SIGTERM: they stop claiming, let running jobs
+finish for a grace period, then release the rest back to the queue.
+"""
+
+from __future__ import annotations
+import signal
+import asyncio
+import logging
+import argparse
+from typing import Dict
+
+from app.config import settings
+from app.logging_config import setup_logging
+from app.database.connection import get_db, ensure_indexes, close_mongo_connection
+from app.utils import http_clients
+from app.utils.queue import JobHandler, QueueWorker
+from app.utils.storage import ensure_dirs
+from app.media.avatar_poller import stop_avatar_poller
+from app.utils.webhooks import start_webhook_dispatcher, stop_webhook_dispatcher
+from app.content.extraction import shutdown_extraction_pool
+from app.content.pipeline import lecture_job_handler
+from app.content.batch import batch_job_handler
+
+logger = logging.getLogger("uvicorn")
+
+HANDLERS: Dict[str, JobHandler] = {
+    "generation": lecture_job_handler,
+    "batch": batch_job_handler,
+}
+
+
+async def main(concurrency: int, grace_s: float) -> None:
+    ensure_dirs()
+    await http_clients.startup()
+    db = await get_db()
+    await ensure_indexes(db)
+    start_webhook_dispatcher(db)
+
+    worker = QueueWorker(db, HANDLERS, concurrency=concurrency)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    runner = asyncio.create_task(worker.run(), name="queue-worker")
+    await stop.wait()
+    logger.info("🛑 Shutdown requested — draining queue worker...")
+    await worker.stop(grace_s=grace_s)
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+
+    await stop_avatar_poller()
+    await stop_webhook_dispatcher()
+    shutdown_extraction_pool()
+    await http_clients.shutdown()
+    await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teachify durable queue worker")
+    parser.add_argument("--concurrency", type=int, default=settings.queue_worker_concurrency)
+    parser.add_argument("--grace", type=float, default=60.0, help="seconds to let running jobs finish on shutdown")
+    args = parser.parse_args()
+
+    setup_logging()
+    asyncio.run(main(args.concurrency, args.grace))
@@ -0,0 +1,58 @@
+# tests/conftest.py
+"""
+Shared fixtures. Tests that need MongoDB run against a local mongod
+(TEST_MONGO_URI, default mongodb://localhost:27017) on a throwaway database
+per test, and are skipped when no server is reachable.
+"""
+
+import os
+import sys
+import uuid
+import asyncio
+
+import pytest
+
+# Settings are read at import time; provide harmless defaults for the test run
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DB_NAME", "teachify_test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_MONGO_URI = os.environ.get("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+def mongo_available() -> bool:
+    from pymongo import MongoClient
+
+    try:
+        client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=500)
+        try:
+            client.admin.command("ping")
+        finally:
+            client.close()
+        return True
+    except Exception:
+        return False
+
+
+requires_mongo = pytest.mark.skipif(not mongo_available(), reason=f"no MongoDB server at {TEST_MONGO_URI}")
+
+
+@pytest.fixture
+def run_with_db():
+    """Run `scenario(db)` in a fresh event loop against a throwaway database; returns its result."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    def _run(scenario):
+        async def _main():
+            client = AsyncIOMotorClient(TEST_MONGO_URI)
+            db = client[f"teachify_test_{uuid.uuid4().hex[:8]}"]
+            try:
+                return await scenario(db)
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+
+        return asyncio.run(_main())
+
+    return _run
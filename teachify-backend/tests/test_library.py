@@ -0,0 +1,88 @@
+# tests/test_library.py
+"""Filtered search over a per-user library index (app.content.library) with synthetic vectors."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from app.config import settings
+from app.content.ann_index import index_kind
+from app.content.embedding_cache import DocumentEmbedding
+from app.content.library import UserLibraryIndex
+
+DIM = 32
+TOP_K = 6
+
+
+def _doc(seq, vectors):
+    n = len(vectors)
+    return DocumentEmbedding(
+        text=" ".join(f"d{seq}w{i}" for i in range(n)),
+        spans=np.array([[i, i + 1] for i in range(n)], dtype=np.int32),
+        vectors=vectors,
+    )
+
+
+@pytest.fixture
+def ivf_library(tmp_path, monkeypatch):
+    """Clustered library large enough to be rebuilt as IVF; returns (library, {seq: vectors})."""
+    monkeypatch.setattr(settings, "rag_ann_index", "auto")
+    monkeypatch.setattr(settings, "rag_ann_flat_max", 1000)
+    monkeypatch.setattr(settings, "rag_ivf_nlist", 64)
+    monkeypatch.setattr(settings, "rag_ivf_nprobe", 4)
+    monkeypatch.setattr(settings, "library_quantization", "none")
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((64, DIM)).astype(np.float32)
+    lib = UserLibraryIndex(str(tmp_path), "u1")
+    docs = {}
+    for seq in range(1, 13):
+        n = 400 if seq < 12 else 5  # one tiny document whose chunks sit in few IVF lists
+        v = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, DIM)).astype(np.float32)
+        v /= np.linalg.norm(v, axis=1, keepdims=True)
+        v = v.astype(np.float16).astype(np.float32)  # what docs/<seq>.npz keeps
+        lib.add(seq, _doc(seq, v))
+        docs[seq] = v
+    assert index_kind(lib.reader()) == "ivf"
+    return lib, docs
+
+
+def _recall(lib, docs, seqs, queries):
+    vectors = np.vstack([docs[s] for s in seqs])
+    names = [f"d{s}w{i}" for s in seqs for i in range(len(docs[s]))]
+    recalls = []
+    for q in queries:
+        truth = {names[i] for i in np.argsort(-(vectors @ q))[:min(TOP_K, len(names))]}
+        found = {text for text, _score in lib.search(q[None, :], seqs, TOP_K)}
+        recalls.append(len(truth & found) / len(truth))
+    return float(np.mean(recalls))
+
+
+def _queries(n=20):
+    q = np.random.default_rng(1).standard_normal((n, DIM)).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("seqs", [(12,), (3,), (3, 12)])
+def test_small_selection_is_scored_exactly(ivf_library, seqs):
+    lib, docs = ivf_library
+    assert _recall(lib, docs, seqs, _queries()) == 1.0
+
+
+def test_exact_scores_match_stored_vectors(ivf_library):
+    lib, docs = ivf_library
+    q = _queries(1)
+    hits = lib.search(q, (12,), TOP_K)
+    assert len(hits) == len(docs[12])  # every chunk of the tiny document is reachable
+    expected = sorted((docs[12] @ q[0]).tolist(), reverse=True)
+    assert [round(s, 4) for _t, s in hits] == [round(s, 4) for s in expected]
+
+
+def test_large_selection_probes_more_lists(ivf_library, monkeypatch):
+    lib, docs = ivf_library
+    monkeypatch.setattr(settings, "library_exact_search_max", 0)  # force the IVF path
+    seqs = (3, 12)
+    # one selected document out of twelve: nprobe is scaled up by the filter's selectivity
+    assert _recall(lib, docs, seqs, _queries()) >= 0.95
@@ -0,0 +1,197 @@
+# tests/test_queue.py
+"""Durable Mongo work queue (app.utils.queue) against a local mongod."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import requires_mongo
+from app.config import settings
+from app.utils.queue import QueueWorker, claim_job, complete_job, fail_or_retry, reap_expired, retry_delay
+
+pytestmark = requires_mongo
+
+OWNER = "test-worker"
+
+
+async def _insert_job(db, **fields):
+    now = datetime.utcnow()
+    doc = {
+        "user_id": "u1",
+        "job_type": "generation",
+        "status": "queued",
+        "stage": "queued",
+        "payload": {},
+        "queued": True,
+        "priority": 0,
+        "attempts": 0,
+        "max_attempts": 3,
+        "available_at": now,
+        "lease_until": None,
+        "worker": None,
+        "created_at": now,
+        "updated_at": now,
+        **fields,
+    }
+    res = await db.jobs.insert_one(doc)
+    return res.inserted_id
+
+
+def test_claim_orders_by_priority_then_available_at(run_with_db):
+    async def scenario(db):
+        now = datetime.utcnow()
+        low_old = await _insert_job(db, priority=0, available_at=now - timedelta(seconds=30))
+        high_new = await _insert_job(db, priority=5, available_at=now - timedelta(seconds=1))
+        high_old = await _insert_job(db, priority=5, available_at=now - timedelta(seconds=10))
+        await _insert_job(db, priority=9, available_at=now + timedelta(hours=1))  # not due yet
+        await _insert_job(db, priority=9, job_type="batch")                        # not a handled type
+
+        claimed = []
+        while (job := await claim_job(db, OWNER, ["generation"], 60)) is not None:
+            claimed.append(job)
+        return claimed, (high_old, high_new, low_old)
+
+    claimed, expected = run_with_db(scenario)
+    assert [j["_id"] for j in claimed] == list(expected)
+    for job in claimed:
+        assert job["status"] == "running"
+        assert job["worker"] == OWNER
+        assert job["attempts"] == 1
+        assert job["lease_until"] > datetime.utcnow()
+
+
+def test_expired_lease_is_taken_over_until_attempts_run_out(run_with_db):
+    async def scenario(db):
+        past = datetime.utcnow() - timedelta(seconds=5)
+        retryable = await _insert_job(db, status="running", worker="dead", lease_until=past, attempts=1)
+        exhausted = await _insert_job(db, status="running", worker="dead", lease_until=past, attempts=3)
+        live = await _insert_job(
+            db, status="running", worker="alive", lease_until=datetime.utcnow() + timedelta(seconds=60), attempts=1
+        )
+
+        taken = await claim_job(db, OWNER, ["generation"], 60)
+        nothing_else = await claim_job(db, OWNER, ["generation"], 60)
+        reaped = await reap_expired(db)
+        docs = {d["_id"]: d async for d in db.jobs.find({})}
+        return taken, nothing_else, reaped, docs, (retryable, exhausted, live)
+
+    taken, nothing_else, reaped, docs, (retryable, exhausted, live) = run_with_db(scenario)
+    assert taken["_id"] == retryable
+    assert taken["worker"] == OWNER and taken["attempts"] == 2
+    assert nothing_else is None  # the exhausted job is never reclaimed, the live lease is respected
+    assert reaped == 1
+    assert docs[exhausted]["status"] == "failed"
+    assert docs[exhausted]["error"] == "Worker lost while running the final attempt."
+    assert docs[live]["worker"] == "alive" and docs[live]["status"] == "running"
+
+
+def test_retry_delay_is_capped_exponential(monkeypatch):
+    monkeypatch.setattr(settings, "queue_backoff_base_s", 10.0)
+    monkeypatch.setattr(settings, "queue_backoff_cap_s", 60.0)
+    assert [retry_delay(a) for a in (1, 2, 3, 4, 5)] == [10.0, 20.0, 40.0, 60.0, 60.0]
+    assert retry_delay(0) == 10.0
+
+
+def test_fail_or_retry_backs_off_then_fails_at_max_attempts(run_with_db, monkeypatch):
+    monkeypatch.setattr(settings, "queue_backoff_base_s", 10.0)
+    monkeypatch.setattr(settings, "queue_backoff_cap_s", 600.0)
+
+    async def scenario(db):
+        job_id = await _insert_job(db, max_attempts=2)
+        first = await claim_job(db, OWNER, ["generation"], 60)
+        before = datetime.utcnow()
+        requeued = await fail_or_retry(db, first, OWNER, "boom 1")
+        after_retry = await db.jobs.find_one({"_id": job_id})
+        not_due = await claim_job(db, OWNER, ["generation"], 60)
+
+        await db.jobs.update_one({"_id": job_id}, {"$set": {"available_at": datetime.utcnow()}})
+        second = await claim_job(db, OWNER, ["generation"], 60)
+        final = await fail_or_retry(db, second, OWNER, "boom 2")
+        after_fail = await db.jobs.find_one({"_id": job_id})
+        return before, requeued, after_retry, not_due, second, final, after_fail
+
+    before, requeued, after_retry, not_due, second, final, after_fail = run_with_db(scenario)
+    assert requeued is True
+    assert after_retry["status"] == "queued" and after_retry["stage"] == "retrying"
+    assert after_retry["worker"] is None and after_retry["error"] == "boom 1"
+    delay = (after_retry["available_at"] - before).total_seconds()
+    assert 9 <= delay <= 11
+    assert not_due is None  # still backing off
+    assert second["attempts"] == 2
+    assert final is False
+    assert after_fail["status"] == "failed" and after_fail["error"] == "boom 2"
+    assert after_fail["finished_at"] is not None
+
+
+def test_cancelled_job_is_released_without_burning_an_attempt(run_with_db):
+    async def scenario(db):
+        started = asyncio.Event()
+
+        async def handler(_db, _job):
+            started.set()
+            await asyncio.sleep(3600)
+
+        job_id = await _insert_job(db)
+        worker = QueueWorker(db, {"generation": handler}, lease_s=60)
+        job = await claim_job(db, worker.owner, ["generation"], 60)
+        task = asyncio.create_task(worker._execute(job))
+        await asyncio.wait_for(started.wait(), timeout=5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return job, await db.jobs.find_one({"_id": job_id})
+
+    claimed, released = run_with_db(scenario)
+    assert claimed["attempts"] == 1
+    assert released["status"] == "queued"
+    assert released["attempts"] == 0
+    assert released["worker"] is None and released["lease_until"] is None
+    assert released["available_at"] <= datetime.utcnow()
+
+
+def test_worker_runs_and_completes_claimed_jobs(run_with_db):
+    async def scenario(db):
+        ran = []
+
+        async def handler(_db, job):
+            ran.append(job["_id"])
+            return {"ok": True}
+
+        job_id = await _insert_job(db)
+        worker = QueueWorker(db, {"generation": handler}, lease_s=60, poll_interval=0.05)
+        runner = asyncio.create_task(worker.run())
+        for _ in range(100):
+            doc = await db.jobs.find_one({"_id": job_id})
+            if doc["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.05)
+        await worker.stop(grace_s=1)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return ran, doc
+
+    ran, doc = run_with_db(scenario)
+    assert len(ran) == 1
+    assert doc["status"] == "succeeded" and doc["result"] == {"ok": True} and doc["progress"] == 100
+
+
+
+def test_only_the_lease_holder_finishes_a_job_and_notifies(run_with_db, monkeypatch):
+    monkeypatch.setattr(settings, "webhooks_enabled", True)
+
+    async def scenario(db):
+        payload = {"prompt": "p", "callback_url": "https://hooks.example.com/teachify"}
+        await _insert_job(db, payload=payload, max_attempts=1)
+        stale = await claim_job(db, OWNER, ["generation"], 60)
+        # the lease was lost: another worker took the job over and finished it
+        await db.jobs.update_one({"_id": stale["_id"]}, {"$set": {"worker": "other"}})
+        await complete_job(db, {**stale, "worker": "other"}, "other", {"ok": True})
+
+        await complete_job(db, stale, OWNER, {"stale": True})
+        await fail_or_retry(db, stale, OWNER, "stale failure")
+        return await db.jobs.find_one({"_id": stale["_id"]}), await db.webhook_deliveries.find({}).to_list(None)
+
+    job, deliveries = run_with_db(scenario)
+    assert job["status"] == "succeeded" and job["result"] == {"ok": True}
+    assert [d["event"] for d in deliveries] == ["lecture.completed"]  # one delivery, from the lease holder
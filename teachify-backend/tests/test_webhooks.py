@@ -0,0 +1,288 @@
+# tests/test_webhooks.py
+"""Webhook signing, SSRF guard and delivery (app.utils.webhooks) against a local HTTP receiver."""
+
+import time
+import socket
+import asyncio
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import requires_mongo
+from app.config import settings
+from app.utils import http_clients, webhooks
+from app.utils.webhooks import (
+    attempt_delivery, claim_delivery, enqueue_delivery, redeliver, send_webhook,
+    sign_payload, validate_callback_url, verify_signature,
+)
+
+OWNER = "test-dispatcher"
+SECRET = "whsec_test"
+
+
+class Receiver:
+    """Local HTTP endpoint; answers with the queued status codes (200 once they run out)."""
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+        self.delay_s = 0.0
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                receiver.requests.append((dict(self.headers), body))
+                time.sleep(receiver.delay_s)
+                code = receiver.statuses.pop(0) if receiver.statuses else 200
+                self.send_response(code)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def receiver():
+    r = Receiver()
+    yield r
+    r.close()
+
+
+@pytest.fixture
+def local_delivery(monkeypatch):
+    """Allow the loopback receiver and use short timeouts / backoff."""
+    monkeypatch.setattr(settings, "webhook_allow_private_urls", True)
+    monkeypatch.setattr(settings, "webhook_timeout_s", 0.5)
+    monkeypatch.setattr(settings, "webhook_backoff_base_s", 15)
+    monkeypatch.setattr(settings, "webhook_backoff_cap_s", 3600)
+
+
+def _run(coro_fn):
+    async def _main():
+        try:
+            return await coro_fn()
+        finally:
+            await http_clients.shutdown()  # clients are bound to this event loop
+
+    return asyncio.run(_main())
+
+
+def _closing(scenario):
+    async def _wrapped(db):
+        try:
+            return await scenario(db)
+        finally:
+            await http_clients.shutdown()
+
+    return _wrapped
+
+
+def _addrinfo(*ips):
+    return [(socket.AF_INET6 if ":" in ip else socket.AF_INET, socket.SOCK_STREAM, 6, "", (ip, 0)) for ip in ips]
+
+
+# ────────────────────────────────
+# Signing
+# ────────────────────────────────
+def test_signature_format_and_verification():
+    body = b'{"event":"ping"}'
+    header = sign_payload(SECRET, body, timestamp=1700000000)
+    ts, v1 = header.split(",")
+    assert ts == "t=1700000000" and v1.startswith("v1=") and len(v1) == 3 + 64
+
+    fresh = sign_payload(SECRET, body)
+    assert verify_signature(SECRET, body, fresh)
+    assert not verify_signature(SECRET, body + b" ", fresh)
+    assert not verify_signature("whsec_other", body, fresh)
+    assert not verify_signature(SECRET, body, header)  # outside the 5 minute tolerance
+    assert verify_signature(SECRET, body, header, tolerance_s=0)
+    assert not verify_signature(SECRET, body, "garbage")
+
+
+def test_delivery_is_signed_over_the_raw_body(receiver, local_delivery):
+    body = webhooks.encode_payload({"id": "d1", "event": "ping", "data": {"x": 1}})
+    status, error, _ms = _run(lambda: send_webhook(receiver.url, SECRET, "ping", "d1", body))
+    assert (status, error) == (200, None)
+    headers, received = receiver.requests[0]
+    assert received == body
+    assert headers["X-Teachify-Event"] == "ping" and headers["X-Teachify-Delivery"] == "d1"
+    assert verify_signature(SECRET, received, headers["X-Teachify-Signature"])
+
+
+# ────────────────────────────────
+# SSRF guard
+# ────────────────────────────────
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "http:///hook",
+    "http://localhost:8000/hook",
+    "http://api.localhost/hook",
+    "http://127.0.0.1/hook",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://224.0.0.1/hook",
+    "http://0.0.0.0/hook",
+])
+def test_rejects_non_public_callback_urls(url):
+    with pytest.raises(ValueError):
+        validate_callback_url(url)
+
+
+def test_rejects_hosts_resolving_to_any_private_address(monkeypatch):
+    answers = {"hooks.example.com": _addrinfo("93.184.216.34"),
+               "mixed.example.com": _addrinfo("93.184.216.34", "192.168.1.10")}
+    monkeypatch.setattr(socket, "getaddrinfo", lambda host, *a, **kw: answers[host])
+    assert validate_callback_url(" https://hooks.example.com/x ") == "https://hooks.example.com/x"
+    with pytest.raises(ValueError, match="non-public"):
+        validate_callback_url("https://mixed.example.com/x")
+
+
+def test_webhook_client_uses_the_public_only_backend(monkeypatch):
+    # fails loudly if an httpx/httpcore upgrade stops routing connections through the guard
+    monkeypatch.setattr(settings, "webhook_allow_private_urls", False)
+
+    async def _backend():
+        return http_clients.get_async_client("webhooks")._transport._pool._network_backend
+
+    assert isinstance(_run(_backend), webhooks._PublicOnlyBackend)
+
+
+def test_delivery_refuses_private_addresses_at_connect_time(receiver, monkeypatch):
+    monkeypatch.setattr(settings, "webhook_allow_private_urls", False)
+    status, error, _ms = _run(lambda: send_webhook(receiver.url, SECRET, "ping", "d1", b"{}"))
+    assert status is None and "non-public" in error
+    assert receiver.requests == []
+
+
+def test_delivery_connects_to_the_checked_address(receiver, monkeypatch):
+    # Validation saw a public address; by delivery time DNS answers with loopback (rebinding)
+    monkeypatch.setattr(settings, "webhook_allow_private_urls", False)
+
+    async def rebound(host, port):
+        return _addrinfo("127.0.0.1")
+
+    monkeypatch.setattr(webhooks, "_resolve", rebound)
+    url = f"http://hooks.example.com:{receiver.port}/hook"
+    status, error, _ms = _run(lambda: send_webhook(url, SECRET, "ping", "d1", b"{}"))
+    assert status is None and "non-public" in error
+    assert receiver.requests == []
+
+    # With the loopback check lifted, the pinned address is dialed and the Host header is kept
+    monkeypatch.setattr(webhooks, "_blocked_address", lambda ip: False)
+    status, error, _ms = _run(lambda: send_webhook(url, SECRET, "ping", "d1", b"{}"))
+    assert (status, error) == (200, None)
+    assert receiver.requests[0][0]["Host"] == f"hooks.example.com:{receiver.port}"
+
+
+# ────────────────────────────────
+# Delivery log, retries, redelivery (MongoDB)
+# ────────────────────────────────
+async def _deliver_once(db, delivery_id):
+    await db.webhook_deliveries.update_one({"_id": delivery_id}, {"$set": {"next_attempt_at": datetime.utcnow()}})
+    delivery = await claim_delivery(db, OWNER, 30)
+    assert delivery is not None and delivery["_id"] == delivery_id
+    return await attempt_delivery(db, delivery, OWNER)
+
+
+@requires_mongo
+def test_retries_with_backoff_on_5xx_and_timeouts(run_with_db, receiver, local_delivery):
+    from bson import ObjectId
+
+    receiver.statuses = [500, 503]
+
+    async def scenario(db):
+        delivery_id = ObjectId(await enqueue_delivery(db, "u1", receiver.url, "lecture.completed", {"job_id": "j1"}))
+        states = []
+        for _ in range(2):
+            before = datetime.utcnow()
+            ok = await _deliver_once(db, delivery_id)
+            states.append((ok, before, await db.webhook_deliveries.find_one({"_id": delivery_id})))
+
+        receiver.delay_s = 2.0  # longer than webhook_timeout_s
+        before = datetime.utcnow()
+        ok = await _deliver_once(db, delivery_id)
+        states.append((ok, before, await db.webhook_deliveries.find_one({"_id": delivery_id})))
+
+        receiver.delay_s = 0.0
+        ok = await _deliver_once(db, delivery_id)
+        states.append((ok, None, await db.webhook_deliveries.find_one({"_id": delivery_id})))
+        return states
+
+    states = run_with_db(_closing(scenario))
+    for (ok, before, doc), attempt, expected_delay in zip(states[:3], (1, 2, 3), (15, 30, 60)):
+        assert ok is False and doc["status"] == "pending" and doc["attempts"] == attempt
+        delay = (doc["next_attempt_at"] - before).total_seconds()
+        assert expected_delay - 1 <= delay <= expected_delay + 3
+    assert states[0][2]["last_status_code"] == 500 and states[1][2]["last_status_code"] == 503
+    assert states[2][2]["last_status_code"] is None and "Timeout" in states[2][2]["last_error"]
+
+    ok, _before, doc = states[3]
+    assert ok is True and doc["status"] == "delivered" and doc["delivered_at"] is not None
+    assert [e["attempt"] for e in doc["log"]] == [1, 2, 3, 4]
+    assert [e["status_code"] for e in doc["log"]] == [500, 503, None, 200]
+
+
+@requires_mongo
+def test_gives_up_at_max_attempts_and_caps_the_log(run_with_db, receiver, local_delivery, monkeypatch):
+    from bson import ObjectId
+
+    monkeypatch.setattr(settings, "webhook_max_attempts", 25)
+    receiver.statuses = [500] * 25
+
+    async def scenario(db):
+        delivery_id = ObjectId(await enqueue_delivery(db, "u1", receiver.url, "lecture.failed", {}))
+        for _ in range(25):
+            await _deliver_once(db, delivery_id)
+        return await db.webhook_deliveries.find_one({"_id": delivery_id})
+
+    doc = run_with_db(_closing(scenario))
+    assert doc["status"] == "failed" and doc["attempts"] == 25
+    assert len(doc["log"]) == webhooks._LOG_LIMIT == 20
+    assert [e["attempt"] for e in doc["log"]] == list(range(6, 26))
+
+
+@requires_mongo
+def test_redeliver_resets_a_failed_delivery(run_with_db, receiver, local_delivery, monkeypatch):
+    from bson import ObjectId
+
+    monkeypatch.setattr(settings, "webhook_max_attempts", 1)
+    receiver.statuses = [500]
+
+    async def scenario(db):
+        delivery_id = ObjectId(await enqueue_delivery(db, "u1", receiver.url, "lecture.completed", {}))
+        first = await _deliver_once(db, delivery_id)
+        failed = await db.webhook_deliveries.find_one({"_id": delivery_id})
+
+        other_user = await redeliver(db, str(delivery_id), "u2")
+        bad_id = await redeliver(db, "not-an-id", "u1")
+        reset = await redeliver(db, str(delivery_id), "u1")
+        pending = await db.webhook_deliveries.find_one({"_id": delivery_id})
+        second = await _deliver_once(db, delivery_id)
+        delivered = await db.webhook_deliveries.find_one({"_id": delivery_id})
+        return first, failed, other_user, bad_id, reset, pending, second, delivered
+
+    first, failed, other_user, bad_id, reset, pending, second, delivered = run_with_db(_closing(scenario))
+    assert first is False and failed["status"] == "failed"
+    assert other_user is False and bad_id is False and reset is True
+    assert pending["status"] == "pending" and pending["attempts"] == 0
+    assert second is True and delivered["status"] == "delivered"
+    assert [e["status_code"] for e in delivered["log"]] == [500, 200]
+    # the same delivery id (and a valid signature) is sent on every attempt
+    ids = {h["X-Teachify-Delivery"] for h, _ in receiver.requests}
+    assert ids == {str(failed["_id"])}